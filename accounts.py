@@ -0,0 +1,171 @@
+import os
+from telethon import utils as tg_utils
+from telethon.errors import (
+    FloodWaitError, AuthKeyUnregisteredError, UserDeactivatedError, UserDeactivatedBanError, SessionRevokedError
+)
+from utils import logger
+from rate_governor import RateGovernor
+from entity_cache import entity_cache
+from config import SESSION_NAME, SESSION_POOL_FILE
+
+# خطاهایی که نشان می‌دهند سشن یک حساب دیگر قابل استفاده نیست
+_DEAD_SESSION_ERRORS = (AuthKeyUnregisteredError, UserDeactivatedError, UserDeactivatedBanError, SessionRevokedError)
+
+
+def load_session_names(path=SESSION_POOL_FILE):
+    """نام سشن‌های اضافی ثبت شده با auth_user.py (بدون سشن اصلی)"""
+    if not path or not os.path.exists(path):
+        return []
+    names = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            name = line.strip()
+            if name and not name.startswith("#") and name != SESSION_NAME and name not in names:
+                names.append(name)
+    return names
+
+
+def register_session_name(name, path=SESSION_POOL_FILE):
+    """افزودن یک سشن به فهرست حساب‌های اضافی (اگر قبلاً ثبت نشده باشد)"""
+    if name == SESSION_NAME or name in load_session_names(path):
+        return False
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(name + "\n")
+    return True
+
+
+class Account:
+    """یک حساب کاربری متصل به همراه کنترل‌کننده نرخ و وضعیت فلاد مخصوص خودش
+
+    access_hash کانال‌ها برای هر حساب متفاوت است، پس peerها برای هر حساب
+    جداگانه resolve و نگه‌داری می‌شوند. ارسال به هر مقصد علاوه بر کنترل‌کننده
+    نرخ کل حساب، از کنترل‌کننده نرخ جداگانه آن مقصد هم عبور می‌کند: سرعت ارسال به
+    یک مقصد محدود است و در عین حال مجموع درخواست‌ها از سقف حساب بیشتر نمی‌شود.
+    FloodWait ارسال به هر دو کنترل‌کننده گزارش می‌شود.
+    """
+
+    def __init__(self, name, client, governor):
+        self.name = name
+        self.client = client
+        self.governor = governor
+        self.is_healthy = True
+        self._peers = {}  # شناسه marked -> input peer در این حساب (None یعنی بدون دسترسی)
+        self._forward_governors = {}  # مقصد -> کنترل‌کننده نرخ ارسال از این حساب به آن مقصد
+
+    def forward_governor(self, target):
+        """کنترل‌کننده نرخ و وضعیت فلاد ارسال از این حساب به مقصد target"""
+        governor = self._forward_governors.get(target)
+        if governor is None:
+            governor = self._forward_governors[target] = RateGovernor()
+        return governor
+
+    def estimated_wait(self, target=None):
+        """زمان تقریبی تا درخواست بعدی این حساب (یا ارسال بعدی به target)"""
+        wait = self.governor.estimated_wait()
+        if target is not None:
+            wait = max(wait, self.forward_governor(target).estimated_wait())
+        return wait
+
+    async def _call_forward(self, request_factory, max_flood_wait, target):
+        """اجرای درخواست ارسال تحت کنترل نرخ مقصد و کنترل نرخ کل حساب (تو در تو)"""
+        forward_governor = self.forward_governor(target)
+        while True:
+            # ابتدا نوبت مقصد و سپس توکن حساب، تا توکن حساب در انتظار مقصد هدر نرود
+            await forward_governor.acquire()
+            await self.governor.acquire()
+            try:
+                result = await request_factory(self.client)
+            except FloodWaitError as e:
+                forward_governor.on_flood_wait(e.seconds)
+                self.governor.on_flood_wait(e.seconds)
+                if max_flood_wait is not None and e.seconds > max_flood_wait:
+                    raise
+                continue
+            forward_governor.on_success()
+            self.governor.on_success()
+            return result
+
+    async def call(self, request_factory, max_flood_wait=None, target=None):
+        """اجرای یک درخواست روی این حساب تحت کنترل نرخ همین حساب
+
+        Args:
+            request_factory: تابعی که کلاینت را گرفته و coroutine درخواست را می‌سازد
+            max_flood_wait: مانند RateGovernor.call
+            target: برای درخواست‌های ارسال، مقصدی که کنترل نرخ جداگانه دارد
+        """
+        try:
+            if target is not None:
+                return await self._call_forward(request_factory, max_flood_wait, target)
+            return await self.governor.call(lambda: request_factory(self.client), max_flood_wait)
+        except _DEAD_SESSION_ERRORS as e:
+            self.is_healthy = False
+            logger.error(f"سشن حساب {self.name} نامعتبر شد و از مجموعه حساب‌ها کنار گذاشته شد: {e}")
+            raise
+
+    def remember_peer(self, entity):
+        """ثبت input peer چتی که همین حساب قبلاً resolve کرده است (مثلاً از entity_cache)، بدون درخواست مجدد"""
+        try:
+            peer = tg_utils.get_input_peer(entity)
+        except TypeError:
+            return
+        self._peers[tg_utils.get_peer_id(peer)] = peer
+
+    async def input_peer(self, entity):
+        """input peer معادل entity (یا شناسه marked) در این حساب؛ None اگر این حساب به آن دسترسی ندارد"""
+        peer_id = tg_utils.get_peer_id(entity)
+        if peer_id in self._peers:
+            return self._peers[peer_id]
+
+        # entity ممکن است input peer ذخیره شده در entity_cache (بدون نام کاربری) باشد
+        key = getattr(entity, "username", None) or (entity_cache and entity_cache.username_for(peer_id)) or peer_id
+        try:
+            peer = await self.call(lambda client: client.get_input_entity(key), max_flood_wait=0)
+        except FloodWaitError:
+            raise
+        except Exception as e:
+            logger.warning(f"حساب {self.name} به چت {peer_id} دسترسی ندارد: {e}")
+            peer = None
+        self._peers[peer_id] = peer
+        return peer
+
+
+class AccountPool:
+    """مجموعه حساب‌های متصل؛ هر درخواست به سالم‌ترین حسابی می‌رود که زودتر آزاد است
+
+    حسابی که FloodWait گرفته تا پایان زمان انتظارش عملاً انتخاب نمی‌شود و بار
+    آن به سایر حساب‌ها منتقل می‌شود؛ چون هر حساب token bucket خودش را دارد،
+    ظرفیت کل تقریباً به نسبت تعداد حساب‌ها افزایش می‌یابد.
+    """
+
+    def __init__(self):
+        self.accounts = []
+
+    def add(self, account):
+        self.accounts.append(account)
+
+    def clear(self):
+        self.accounts = []
+
+    @property
+    def primary(self):
+        return self.accounts[0] if self.accounts else None
+
+    @property
+    def healthy(self):
+        return [account for account in self.accounts if account.is_healthy]
+
+    def pick(self, exclude=(), target=None):
+        """حسابی با کمترین زمان انتظار تا درخواست بعدی (یا ارسال بعدی به target)؛ None اگر حسابی باقی نمانده باشد"""
+        candidates = [account for account in self.healthy if account not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda account: account.estimated_wait(target))
+
+    def estimated_wait(self, target=None):
+        """زمان تقریبی تا آزاد شدن اولین حساب (برای ارسال به target در صورت تعیین)"""
+        waits = [account.estimated_wait(target) for account in self.healthy]
+        return min(waits) if waits else 0.0
+
+    def drain_flood_waits(self):
+        """آیا حساب دیگری برای جایگزینی حساب دارای FloodWait وجود دارد؟"""
+        return len(self.healthy) > 1
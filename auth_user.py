@@ -2,23 +2,39 @@
 """
 این اسکریپت برای احراز هویت حساب کاربری تلگرام و ایجاد فایل session استفاده می‌شود.
 اجرای این اسکریپت به صورت تعاملی است و نیاز به ورود شماره تلفن و کد تأیید دارد.
+
+استفاده:
+    python auth_user.py                  # حساب اصلی (SESSION_NAME)
+    python auth_user.py --add            # افزودن یک حساب اضافی با نام خودکار
+    python auth_user.py --session NAME   # احراز هویت یا افزودن حساب اضافی با نام دلخواه
 """
 
 import os
 import sys
 import asyncio
+import argparse
 import shutil
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError
 
 from config import API_ID, API_HASH, SESSION_NAME
+from accounts import load_session_names, register_session_name
 
-# استفاده از نام سشن متفاوت برای جلوگیری از تداخل با سرویس در حال اجرا
-TEMP_SESSION_NAME = f"{SESSION_NAME}_auth_temp"
+def next_session_name():
+    """اولین نام آزاد برای حساب اضافی (SESSION_NAME_2، SESSION_NAME_3، ...)"""
+    existing = set(load_session_names())
+    index = 2
+    while f"{SESSION_NAME}_{index}" in existing or os.path.exists(f"{SESSION_NAME}_{index}.session"):
+        index += 1
+    return f"{SESSION_NAME}_{index}"
 
-async def main():
+async def main(session_name=SESSION_NAME):
     print("ابزار احراز هویت تلگرام")
     print("=" * 30)
+    print(f"سشن: {session_name}")
+    
+    # استفاده از نام سشن متفاوت برای جلوگیری از تداخل با سرویس در حال اجرا
+    TEMP_SESSION_NAME = f"{session_name}_auth_temp"
     
     # بررسی تنظیمات API
     if not API_ID or not API_HASH:
@@ -73,7 +89,7 @@ async def main():
     try:
         # اطمینان از اینکه فایل سشن موقت ایجاد شده است
         temp_session_file = f"{TEMP_SESSION_NAME}.session"
-        target_session_file = f"{SESSION_NAME}.session"
+        target_session_file = f"{session_name}.session"
         
         if os.path.exists(temp_session_file):
             print(f"\nکپی فایل سشن موقت به سشن اصلی...")
@@ -93,6 +109,10 @@ async def main():
             os.remove(temp_session_file)
             print("فایل سشن موقت حذف شد.")
             
+            # ثبت حساب اضافی تا ربات آن را در مجموعه حساب‌ها استفاده کند
+            if session_name != SESSION_NAME and register_session_name(session_name):
+                print(f"سشن {session_name} به فهرست حساب‌های اضافی اضافه شد.")
+            
             print(f"اکنون می‌توانید ربات را اجرا کنید.")
             print(f"مسیر فایل سشن نهایی: {target_session_file}")
         else:
@@ -101,5 +121,13 @@ async def main():
         print(f"خطا در کپی فایل سشن: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="احراز هویت حساب‌های تلگرام ربات")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--add", action="store_true", help="افزودن یک حساب اضافی با نام خودکار")
+    group.add_argument("--session", help="نام سشن (حساب اضافی یا اصلی)")
+    args = parser.parse_args()
+    
+    session_name = args.session or (next_session_name() if args.add else SESSION_NAME)
+    
     # اجرای اسکریپت در حلقه رویداد
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main(session_name)) 
\ No newline at end of file
@@ -0,0 +1,91 @@
+from config import BATCH_SIZE
+
+
+class BatchView:
+    """نمای تنبل یک دسته از فهرست فایل‌ها (بدون کپی عناصر)
+
+    مرزهای دسته هنگام ساخت نما ثابت می‌شوند؛ پس فایل‌هایی که بعداً به دسته
+    آخر اضافه شوند در نمایی که در حال ارسال است ظاهر نمی‌شوند.
+    """
+    __slots__ = ("_items", "start", "stop")
+
+    def __init__(self, items, start, stop):
+        self._items = items
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self._items[self.start + start:self.start + stop:step]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("اندیس خارج از محدوده دسته")
+        return self._items[self.start + index]
+
+    def __iter__(self):
+        items = self._items
+        for index in range(self.start, self.stop):
+            yield items[index]
+
+    def __repr__(self):
+        return f"BatchView(start={self.start}, stop={self.stop})"
+
+
+class BatchStore:
+    """دسته‌بندی افزایشی (append-only) فایل‌های موسیقی
+
+    فایل‌های جدید فقط به انتهای فهرست اضافه می‌شوند و با هزینه O(تعداد جدید)
+    ابتدا دسته ناقص آخر را پر کرده و سپس دسته‌های جدید را باز می‌کنند. دسته‌ها
+    به صورت نمای اندیسی (BatchView) روی همان فهرست ساخته می‌شوند، پس با هر
+    ادامه دریافت هیچ کپی یا دسته‌بندی مجددی از کل فهرست انجام نمی‌شود.
+    """
+
+    def __init__(self, items=None, batch_size=BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError("اندازه دسته باید حداقل 1 باشد")
+        self.items = items if items is not None else []
+        self.batch_size = batch_size
+
+    def extend(self, audio_refs):
+        """افزودن فایل‌های جدید به انتهای فهرست"""
+        self.items.extend(audio_refs)
+
+    @property
+    def file_count(self):
+        return len(self.items)
+
+    def batch_length(self, index):
+        """تعداد فایل‌های دسته index (شروع از صفر) بدون ساخت نما"""
+        start = index * self.batch_size
+        return max(0, min(self.batch_size, len(self.items) - start))
+
+    def __len__(self):
+        return -(-len(self.items) // self.batch_size)
+
+    def __getitem__(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("شماره دسته خارج از محدوده")
+        start = index * self.batch_size
+        return BatchView(self.items, start, min(start + self.batch_size, len(self.items)))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def page(self, page, page_size):
+        """(شماره صفحه معتبر, تعداد صفحه‌ها, بازه اندیس دسته‌های آن صفحه) برای نمایش صفحه‌بندی شده"""
+        page_count = max(1, -(-len(self) // page_size))
+        page = min(max(page, 0), page_count - 1)
+        start = page * page_size
+        return page, page_count, range(start, min(start + page_size, len(self)))
+
+    def __repr__(self):
+        return f"BatchStore(files={len(self.items)}, batches={len(self)}, batch_size={self.batch_size})"
@@ -0,0 +1,424 @@
+"""بنچمارک آفلاین مسیرهای اسکن و ارسال با یک کلاینت تلگرام جعلی
+
+این اسکریپت بدون اتصال به تلگرام، تاریخچه‌ای مصنوعی (با اندازه، نسبت فایل‌های
+صوتی و احتمال FloodWait قابل تنظیم) را از طریق همان فراخوانی‌هایی که
+MusicDownloader استفاده می‌کند (GetHistoryRequest، SearchRequest، get_entity و
+forward_messages) ارائه می‌دهد و سرعت اسکن، سرعت ارسال، تاخیر و حداکثر حافظه
+را گزارش می‌کند. داده‌ها با seed ثابت ساخته می‌شوند تا نتایج بین commitها قابل
+مقایسه باشند.
+
+مثال:
+    python benchmark.py --messages 200000 --audio-ratio 0.3 --mode history --repeat 3
+    python benchmark.py --flood-rate 0.01 --flood-seconds 1 --json
+"""
+import os
+
+# تنظیمات پیش از بارگذاری config: بدون نمایه/دفترچه روی دیسک، بدون حافظه نتایج اسکن و بدون سقف نرخ
+# (مگر اینکه کاربر صریحاً مقدار دیگری تعیین کرده باشد)
+for _name, _value in (
+    ("SCAN_INDEX_PATH", ""),
+    ("SCAN_CACHE_SIZE", "0"),
+    ("ENTITY_CACHE_PATH", ""),
+    ("FORWARD_JOURNAL_PATH", ""),
+    ("FORWARD_LEDGER_PATH", ""),
+    ("SESSION_SPILL_DIR", ""),
+    ("RATE_LIMIT_INITIAL", "1000000"),
+    ("RATE_LIMIT_MAX", "1000000"),
+    ("RATE_LIMIT_BURST", "1000000"),
+):
+    os.environ.setdefault(_name, _value)
+
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import random
+import statistics
+import time
+from array import array
+from types import SimpleNamespace
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.messages import GetHistoryRequest, SearchRequest
+from telethon.tl.types import (
+    Message, PeerChannel, MessageMediaDocument, Document, DocumentAttributeAudio, DocumentAttributeFilename
+)
+from telethon.tl.types.messages import Messages
+from client_service import ClientService
+from accounts import Account
+from rate_governor import RateGovernor
+from downloader import MusicDownloader
+from rate_governor import governor
+from classifier import audio_classifier
+from models import AudioRef
+from forward_scheduler import forward_scheduler
+from utils import logger, split_into_batches
+import handlers
+
+try:
+    import resource
+except ImportError:  # ویندوز
+    resource = None
+
+BENCH_CHANNEL_ID = 1234567890
+# شناسه کاربر جعلی که بنچمارک ارسال به نام او اجرا می‌شود
+BENCH_USER_ID = 1
+
+
+def peak_rss_mb():
+    """حداکثر حافظه مقیم فرآیند تا این لحظه (مگابایت) یا None اگر قابل اندازه‌گیری نباشد"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # لینوکس بر حسب کیلوبایت و macOS بر حسب بایت گزارش می‌کند
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+class FakeTelegramClient:
+    """کلاینت جعلی تلگرام با تاریخچه مصنوعی و قطعی
+
+    پیام‌ها با شناسه‌های 1 تا message_count و به صورت تنبل (فقط برای صفحه
+    درخواستی) ساخته می‌شوند تا حافظه کلاینت جعلی در اندازه‌گیری‌ها غالب نشود.
+    """
+
+    def __init__(self, message_count=100000, audio_ratio=0.3, voice_ratio=0.05, flood_rate=0.0,
+                 flood_seconds=1, latency=0.0, seed=1):
+        self.message_count = message_count
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.latency = latency
+        self.peer = PeerChannel(BENCH_CHANNEL_ID)
+        self.requests = 0
+        self.flood_waits = 0
+        self.forwarded = 0
+        self._random = random.Random(seed)
+
+        # نوع هر پیام با یک تابع درهم‌سازی قطعی تعیین می‌شود: صوتی، voice یا متنی
+        self._audio_threshold = int(audio_ratio * 10000)
+        self._voice_threshold = self._audio_threshold + int(voice_ratio * 10000)
+        self._seed = seed
+        self._audio_ids = array("q", (i for i in range(1, message_count + 1) if self._kind(i) == "audio"))
+
+    def _kind(self, message_id):
+        bucket = ((message_id * 2654435761) ^ self._seed) % 10000
+        if bucket < self._audio_threshold:
+            return "audio"
+        if bucket < self._voice_threshold:
+            return "voice"
+        return "text"
+
+    def _make_message(self, message_id):
+        kind = self._kind(message_id)
+        if kind == "text":
+            return Message(id=message_id, peer_id=self.peer, date=None, message=f"پیام {message_id}")
+        attributes = [DocumentAttributeAudio(
+            duration=30 + message_id % 300,
+            voice=kind == "voice",
+            title=f"Track {message_id}",
+            performer=f"Artist {message_id % 97}"
+        )]
+        if kind == "audio":
+            attributes.append(DocumentAttributeFilename(file_name=f"track_{message_id}.mp3"))
+        document = Document(
+            id=10_000_000 + message_id,
+            access_hash=message_id,
+            file_reference=b"",
+            date=None,
+            mime_type="audio/mpeg" if kind == "audio" else "audio/ogg",
+            size=3_000_000 + message_id % 5_000_000,
+            dc_id=2,
+            attributes=attributes
+        )
+        return Message(id=message_id, peer_id=self.peer, date=None, message="",
+                       media=MessageMediaDocument(document=document))
+
+    async def _simulate_request(self, request=None):
+        """تاخیر شبکه و تزریق FloodWait"""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_rate and self._random.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request=request, capture=self.flood_seconds)
+
+    def _page_ids(self, request):
+        """شناسه پیام‌های یک صفحه (از جدید به قدیم) با رعایت offset_id، min_id و limit"""
+        top = request.offset_id - 1 if request.offset_id else self.message_count
+        top = min(top, self.message_count)
+        bottom = max(request.min_id + 1, 1)
+        if isinstance(request, SearchRequest):
+            # فیلتر موسیقی سمت سرور
+            end = bisect.bisect_right(self._audio_ids, top)
+            start = max(bisect.bisect_left(self._audio_ids, bottom), end - request.limit)
+            return reversed(self._audio_ids[start:end])
+        return range(top, max(bottom, top - request.limit + 1) - 1, -1)
+
+    async def __call__(self, request):
+        await self._simulate_request(request)
+        if not isinstance(request, (GetHistoryRequest, SearchRequest)):
+            raise NotImplementedError(f"درخواست پشتیبانی نشده در کلاینت جعلی: {type(request).__name__}")
+        messages = [self._make_message(message_id) for message_id in self._page_ids(request)]
+        return Messages(messages=messages, chats=[], users=[])
+
+    async def get_entity(self, chat_id):
+        await self._simulate_request()
+        return self.peer
+
+    async def get_input_entity(self, peer):
+        await self._simulate_request()
+        return self.peer
+
+    async def forward_messages(self, entity, messages, from_peer=None):
+        await self._simulate_request()
+        if isinstance(messages, list):
+            self.forwarded += len(messages)
+            return [object() for _ in messages]
+        self.forwarded += 1
+        return object()
+
+    async def disconnect(self):
+        pass
+
+
+class FakeClientService(ClientService):
+    """سرویس کلاینت با همان حلقه رویداد اختصاصی، اما متصل به کلاینت‌های جعلی
+
+    کلاینت اول با کنترل‌کننده نرخ مشترک governor و بقیه با کنترل‌کننده نرخ
+    مستقل به عنوان حساب‌های اضافی در pool قرار می‌گیرند.
+    """
+
+    def __init__(self, fake_client, extra_clients=()):
+        super().__init__(session_name="benchmark", user_mode=True)
+        self._fake_client = fake_client
+        self._extra_clients = list(extra_clients)
+
+    async def _connect(self):
+        self.client = self._fake_client
+        self.pool.clear()
+        self.pool.add(Account("benchmark", self._fake_client, governor))
+        for index, client in enumerate(self._extra_clients, 2):
+            self.pool.add(Account(f"benchmark_{index}", client, RateGovernor()))
+        self.is_connected = True
+        return True
+
+
+def bench_scan(downloader, mode, shards, max_messages):
+    """اسکن کامل کانال جعلی با iter_music_files در حالت تعیین شده؛ (فایل‌ها, نتیجه اندازه‌گیری)"""
+    processed = 0
+
+    async def scan():
+        nonlocal processed
+        refs = []
+        async for page in downloader.iter_music_files(f"bench:{BENCH_CHANNEL_ID}", max_messages,
+                                                      mode=mode, shards=shards):
+            refs.extend(page.audio_files)
+            processed = page.processed
+        return refs
+
+    started = time.perf_counter()
+    refs = downloader._run(scan())
+    elapsed = time.perf_counter() - started
+    return refs, {
+        "elapsed_s": elapsed,
+        "messages": processed,
+        "audio_found": len(refs),
+        "messages_per_s": processed / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_get_music_files(downloader, max_messages):
+    """تاخیر سرتاسری get_music_files با تنظیمات پیش‌فرض config"""
+    started = time.perf_counter()
+    refs, _, _ = downloader.get_music_files(f"bench:{BENCH_CHANNEL_ID}", max_messages=max_messages)
+    elapsed = time.perf_counter() - started
+    return {"elapsed_s": elapsed, "audio_found": len(refs), "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_classifier(fake_client, message_count=20000, page_size=100):
+    """هزینه تشخیص فایل‌های صوتی به ازای هر پیام (بدون شبکه) با audio_classifier.classify_page
+
+    مسیر قدیمی (is_audio برای هر پیام و سپس AudioRef.from_message) به عنوان مبنای مقایسه
+    روی همان صفحه‌ها اندازه‌گیری می‌شود.
+    """
+    pages = [
+        [fake_client._make_message(message_id) for message_id in range(start, min(start + page_size, message_count + 1))]
+        for start in range(1, message_count + 1, page_size)
+    ]
+    baseline_found = 0
+    started = time.perf_counter()
+    for page in pages:
+        baseline_found += len([AudioRef.from_message(message) for message in page if audio_classifier.is_audio(message)])
+    baseline_elapsed = time.perf_counter() - started
+
+    found = 0
+    started = time.perf_counter()
+    for page in pages:
+        found += len(audio_classifier.classify_page(page))
+    elapsed = time.perf_counter() - started
+    if found != baseline_found:
+        raise RuntimeError(f"نتیجه classify_page ({found}) با مسیر قدیمی ({baseline_found}) یکسان نیست")
+    return {
+        "elapsed_s": elapsed,
+        "messages": message_count,
+        "audio_found": found,
+        "ns_per_message": elapsed / message_count * 1e9 if message_count else 0.0,
+        "baseline_ns_per_message": baseline_elapsed / message_count * 1e9 if message_count else 0.0,
+        "speedup": baseline_elapsed / elapsed if elapsed else 0.0,
+    }
+
+
+class FakeBot:
+    """Bot API جعلی برای پیام‌های وضعیت ارسال (فقط شناسه پیام برمی‌گرداند)"""
+
+    def __init__(self):
+        self.message_count = 0
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.message_count += 1
+        return SimpleNamespace(message_id=self.message_count)
+
+    def edit_message_text(self, *args, **kwargs):
+        pass
+
+
+def bench_forward(downloader, refs, target="@benchmark_target"):
+    """ارسال یک دسته با مسیر واقعی ربات: forward_batch_files روی زمان‌بند مشترک ForwardScheduler (Bot API جعلی)"""
+    chunk_latencies = []
+    forward_chunk = downloader.forward_chunk
+
+    def timed_forward_chunk(chunk, chunk_target):
+        chunk_started = time.perf_counter()
+        try:
+            return forward_chunk(chunk, chunk_target)
+        finally:
+            chunk_latencies.append(time.perf_counter() - chunk_started)
+
+    downloader.forward_chunk = timed_forward_chunk
+    batches = split_into_batches(refs, max(1, len(refs)))
+    user_data = {
+        "downloader": downloader,
+        "channel": f"bench:{BENCH_CHANNEL_ID}",
+        "batches": batches,
+        "current_batch": 1,
+        "is_forwarding": True,
+        "forwards": {},
+    }
+    handlers.user_data_store[BENCH_USER_ID] = user_data
+    context = SimpleNamespace(bot=FakeBot())
+    try:
+        started = time.perf_counter()
+        handlers._start_target_forward(context, BENCH_USER_ID, user_data, target, 1, batches[0] if refs else [])
+        state = user_data["forwards"][target]
+        while not state["done"]:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+    finally:
+        forward_scheduler.cancel(BENCH_USER_ID)
+        handlers.user_data_store.pop(BENCH_USER_ID, None)
+        del downloader.forward_chunk
+    sent = state["file_index"] - state["failed"] - state["skipped"]
+    return {
+        "elapsed_s": elapsed,
+        "forwarded": sent,
+        "forwards_per_s": sent / elapsed if elapsed else 0.0,
+        "chunk_latency_p50_ms": statistics.median(chunk_latencies) * 1000 if chunk_latencies else 0.0,
+        "chunk_latency_max_ms": max(chunk_latencies) * 1000 if chunk_latencies else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _summarize(runs):
+    """میانه هر مقدار عددی در چند تکرار (برای پایداری نتایج)"""
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = statistics.median(values) if values else None
+    return summary
+
+
+def run_benchmark(args):
+    fake_clients = [
+        FakeTelegramClient(
+            message_count=args.messages,
+            audio_ratio=args.audio_ratio,
+            flood_rate=args.flood_rate,
+            flood_seconds=args.flood_seconds,
+            latency=args.latency,
+            seed=args.seed + index
+        )
+        for index in range(max(1, args.accounts))
+    ]
+    fake_client = fake_clients[0]
+    service = FakeClientService(fake_client, fake_clients[1:])
+    downloader = MusicDownloader(service=service)
+    if not downloader.connect():
+        raise RuntimeError("اتصال به کلاینت جعلی ناموفق بود")
+
+    try:
+        scan_runs, e2e_runs, forward_runs, classifier_runs = [], [], [], []
+        refs = []
+        for _ in range(args.repeat):
+            refs, scan_result = bench_scan(downloader, args.mode, args.shards, args.max_messages)
+            scan_runs.append(scan_result)
+            e2e_runs.append(bench_get_music_files(downloader, args.max_messages))
+            classifier_runs.append(bench_classifier(fake_client, min(args.messages, 20000)))
+            forward_runs.append(bench_forward(downloader, refs[:args.forward_count]))
+    finally:
+        service.stop()
+
+    return {
+        "params": vars(args),
+        "scan": _summarize(scan_runs),
+        "get_music_files": _summarize(e2e_runs),
+        "classifier": _summarize(classifier_runs),
+        "forward": _summarize(forward_runs),
+        "fake_client": {
+            "requests": sum(client.requests for client in fake_clients),
+            "flood_waits": sum(client.flood_waits for client in fake_clients),
+            "forwarded": sum(client.forwarded for client in fake_clients),
+        },
+    }
+
+
+def _print_report(report):
+    for section in ("scan", "get_music_files", "classifier", "forward", "fake_client"):
+        print(f"[{section}]")
+        for key, value in report[section].items():
+            if isinstance(value, float):
+                value = f"{value:.0f}" if value.is_integer() else f"{value:.3f}"
+            print(f"  {key:<24} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک آفلاین اسکن و ارسال با کلاینت تلگرام جعلی")
+    parser.add_argument("--messages", type=int, default=100000, help="تعداد پیام‌های تاریخچه مصنوعی")
+    parser.add_argument("--audio-ratio", type=float, default=0.3, help="نسبت پیام‌های موسیقی")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="احتمال FloodWait برای هر درخواست")
+    parser.add_argument("--flood-seconds", type=int, default=1, help="مدت هر FloodWait تزریق شده")
+    parser.add_argument("--latency", type=float, default=0.0, help="تاخیر شبیه‌سازی شده شبکه برای هر درخواست (ثانیه)")
+    parser.add_argument("--accounts", type=int, default=1, help="تعداد حساب‌های جعلی در pool")
+    parser.add_argument("--mode", choices=("history", "search"), default="history", help="حالت اسکن")
+    parser.add_argument("--shards", type=int, default=1, help="تعداد بخش‌های موازی اسکن")
+    parser.add_argument("--max-messages", type=int, default=None, help="سقف پیام‌های اسکن")
+    parser.add_argument("--forward-count", type=int, default=5000, help="تعداد فایل‌های ارسالی در بنچمارک ارسال")
+    parser.add_argument("--repeat", type=int, default=3, help="تعداد تکرار (میانه گزارش می‌شود)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="خروجی JSON برای مقایسه بین commitها")
+    parser.add_argument("--verbose", action="store_true", help="نمایش لاگ‌های اسکن و ارسال")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        # لاگ هر صفحه در نتایج زمان‌سنجی اثر می‌گذارد
+        logging.getLogger().setLevel(logging.WARNING)
+        logger.setLevel(logging.WARNING)
+
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
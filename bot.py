@@ -14,9 +14,13 @@ from handlers import (
     help_handler,
     status_handler,
     message_handler,
-    button_handler
+    button_handler,
+    resume_unfinished_forwards,
+    schedule_session_sweep
 )
 from config import BOT_TOKEN, API_ID, API_HASH
+from client_service import client_service
+from metrics import start_metrics_server
 
 # تنظیم لاگر
 logging.basicConfig(
@@ -39,17 +43,14 @@ def main():
         logger.error("لطفاً API_ID و API_HASH تلگرام را در فایل .env تنظیم کنید.")
         return
     
-    # تست اولیه اتصال به تلگرام
+    # اتصال یک‌باره به تلگرام؛ این کلاینت تا پایان اجرای ربات بین همه کاربران مشترک است
     try:
-        from downloader import MusicDownloader
-        test_client = MusicDownloader()
-        if not test_client.connect():
+        if not client_service.start():
             logger.error("اتصال اولیه به تلگرام ناموفق بود. لطفاً تنظیمات API را بررسی کنید.")
             return
-        logger.info("تست اتصال به تلگرام با موفقیت انجام شد.")
-        test_client.disconnect()
+        logger.info("اتصال مشترک به تلگرام برقرار شد.")
     except Exception as e:
-        logger.error(f"خطا در تست اتصال به تلگرام: {e}")
+        logger.error(f"خطا در اتصال به تلگرام: {e}")
         return
         
     # ایجاد آپدیتر
@@ -67,6 +68,15 @@ def main():
     # هندلر دکمه‌های اینلاین
     dispatcher.add_handler(CallbackQueryHandler(button_handler))
     
+    # سرور معیارهای Prometheus (در صورت تعیین METRICS_PORT)
+    start_metrics_server()
+    
+    # ادامه کارهای ارسال ناتمام از اجرای قبلی
+    resume_unfinished_forwards(updater.job_queue)
+    
+    # خروج دوره‌ای جلسه‌های بیکار کاربران از حافظه
+    schedule_session_sweep(updater.job_queue)
+    
     # شروع پولینگ
     updater.start_polling()
     
@@ -74,6 +84,9 @@ def main():
     
     # منتظر ماندن تا زمانی که ربات متوقف شود
     updater.idle()
+    
+    # قطع اتصال مشترک تلگرام
+    client_service.stop()
 
 if __name__ == "__main__":
     try:
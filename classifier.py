@@ -0,0 +1,96 @@
+from telethon import utils as tg_utils
+from telethon.tl.types import Message, Document, DocumentAttributeAudio
+from models import AudioRef
+from config import (
+    AUDIO_MIN_DURATION, AUDIO_MAX_DURATION, AUDIO_MIN_SIZE, AUDIO_MAX_SIZE, AUDIO_MIME_TYPES, AUDIO_EXCLUDE_VOICE
+)
+
+
+class AudioClassifier:
+    """تشخیص فایل‌های موسیقی در یک صفحه کامل از پیام‌ها با یک پیمایش
+
+    برای هر پیام فقط یک بار سند و ویژگی‌های آن بررسی می‌شود و AudioRef همان
+    لحظه از همان ویژگی صوتی ساخته می‌شود. قوانین (مدت، حجم، نوع فایل و حذف
+    پیام‌های صوتی voice) قابل تنظیم هستند؛ مقدار 0 برای حداقل/حداکثر یعنی بدون محدودیت.
+    """
+
+    def __init__(self, min_duration=AUDIO_MIN_DURATION, max_duration=AUDIO_MAX_DURATION,
+                 min_size=AUDIO_MIN_SIZE, max_size=AUDIO_MAX_SIZE, mime_types=AUDIO_MIME_TYPES,
+                 exclude_voice=AUDIO_EXCLUDE_VOICE):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.min_size = min_size
+        self.max_size = max_size
+        self.mime_types = frozenset(mime_types) if mime_types else None
+        self.exclude_voice = exclude_voice
+        self._has_rules = bool(min_duration or max_duration or min_size or max_size or self.mime_types)
+
+    def _audio_attribute(self, message):
+        """(سند, ویژگی صوتی) پیام اگر طبق قوانین موسیقی باشد، در غیر این صورت None"""
+        if not isinstance(message, Message):
+            return None
+        document = getattr(message.media, "document", None)
+        if not isinstance(document, Document):
+            return None
+
+        for attribute in document.attributes:
+            if isinstance(attribute, DocumentAttributeAudio):
+                break
+        else:
+            return None
+        if attribute.voice and self.exclude_voice:
+            return None
+
+        if self._has_rules:
+            duration = attribute.duration or 0
+            if duration < self.min_duration or (self.max_duration and duration > self.max_duration):
+                return None
+            if document.size < self.min_size or (self.max_size and document.size > self.max_size):
+                return None
+            if self.mime_types is not None and document.mime_type not in self.mime_types:
+                return None
+        return document, attribute
+
+    @property
+    def fingerprint(self):
+        """شناسه متنی قوانین فعلی؛ نتایج ذخیره شده با قوانین دیگر با این مقدار تشخیص داده می‌شوند"""
+        mime_types = ",".join(sorted(self.mime_types)) if self.mime_types else "*"
+        return (f"duration={self.min_duration}-{self.max_duration};size={self.min_size}-{self.max_size};"
+                f"mime={mime_types};voice={'no' if self.exclude_voice else 'yes'}")
+
+    def is_audio(self, message):
+        """آیا پیام یک فایل موسیقی (طبق قوانین) است؟"""
+        return self._audio_attribute(message) is not None
+
+    def classify_page(self, messages):
+        """فایل‌های موسیقی یک صفحه از پیام‌ها به صورت AudioRef (با حفظ ترتیب)"""
+        audio_files = []
+        peer_ids = {}
+        for message in messages:
+            found = self._audio_attribute(message)
+            if found is None:
+                continue
+            document, attribute = found
+
+            # همه پیام‌های یک صفحه معمولاً از یک چت هستند؛ شناسه marked یک بار محاسبه می‌شود
+            peer = message.peer_id
+            peer_key = (type(peer), getattr(peer, "channel_id", None) or getattr(peer, "chat_id", None)
+                        or getattr(peer, "user_id", None))
+            peer_id = peer_ids.get(peer_key)
+            if peer_id is None:
+                peer_id = peer_ids[peer_key] = tg_utils.get_peer_id(peer)
+
+            audio_files.append(AudioRef(
+                message_id=message.id,
+                peer_id=peer_id,
+                document_id=document.id,
+                size=document.size,
+                duration=attribute.duration or 0,
+                title=attribute.title or None,
+                performer=attribute.performer or None,
+            ))
+        return audio_files
+
+
+# تشخیص‌دهنده مشترک با قوانین تعیین شده در config
+audio_classifier = AudioClassifier()
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+from telethon import TelegramClient
+from utils import logger
+from config import API_ID, API_HASH, SESSION_NAME, BOT_TOKEN
+from rate_governor import governor, RateGovernor
+from accounts import Account, AccountPool, load_session_names
+
+
+class ClientService:
+    """کلاینت مشترک و دائمی تلگرام روی یک حلقه رویداد اختصاصی
+
+    یک TelegramClient و یک event loop برای کل فرآیند در یک thread جداگانه
+    اجرا می‌شوند. هندلرها coroutineهای خود را با submit به این حلقه می‌فرستند
+    و یک Future دریافت می‌کنند؛ بنابراین اتصال و handshake فقط یک بار انجام
+    می‌شود و همه کاربران به صورت امن از یک اتصال استفاده می‌کنند.
+
+    در حالت کاربر، سشن‌های اضافی ثبت شده با auth_user.py هم روی همین حلقه
+    متصل شده و همراه با حساب اصلی در pool قرار می‌گیرند.
+    """
+
+    def __init__(self, session_name=SESSION_NAME, user_mode=True):
+        self.session_name = session_name
+        self.user_mode = user_mode  # استفاده از حساب کاربری عادی به جای ربات
+        self.loop = None
+        self.client = None
+        self.pool = AccountPool()  # حساب اصلی (با کنترل‌کننده نرخ مشترک governor) و حساب‌های اضافی
+        self.is_connected = False
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        """راه‌اندازی حلقه رویداد و اتصال کلاینت (فقط یک بار در هر فرآیند)"""
+        with self._lock:
+            if self.is_connected:
+                return True
+
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._run_loop, name="telethon-loop", daemon=True)
+                self._thread.start()
+
+            try:
+                return self.submit(self._connect()).result()
+            except Exception as e:
+                logger.error(f"خطا در برقراری اتصال به تلگرام: {e}")
+                return False
+
+    async def _connect(self):
+        """ایجاد اتصال به تلگرام روی حلقه رویداد اختصاصی"""
+        if self.client is None:
+            # flood_sleep_threshold=0: همه FloodWaitها به کنترل‌کننده نرخ مشترک سپرده می‌شوند
+            self.client = TelegramClient(self.session_name, API_ID, API_HASH, flood_sleep_threshold=0)
+
+        if self.user_mode:
+            # حالت کاربر عادی: تلاش برای استفاده از session موجود
+            logger.info("تلاش برای اتصال با حساب کاربری عادی...")
+            await self.client.connect()
+            if not await self.client.is_user_authorized():
+                # اگر قبلاً احراز هویت نشده، نیاز به ورود ماژول interactive_auth است
+                logger.error("سشن معتبر یافت نشد. لطفاً ابتدا با اجرای اسکریپت auth_user.py به صورت تعاملی احراز هویت کنید.")
+                return False
+            logger.info("اتصال با حساب کاربری عادی با موفقیت انجام شد.")
+        else:
+            # حالت ربات: تلاش برای استفاده از توکن ربات
+            try:
+                logger.info("تلاش برای اتصال با Bot Token...")
+                await self.client.start(bot_token=BOT_TOKEN)
+                logger.info("اتصال با Bot Token با موفقیت انجام شد.")
+            except Exception as e:
+                logger.error(f"خطا در اتصال با Bot Token: {e}")
+                return False
+
+        self.pool.clear()
+        self.pool.add(Account(self.session_name, self.client, governor))
+        if self.user_mode:
+            for name in load_session_names():
+                await self._connect_extra_account(name)
+        
+        self.is_connected = True
+        logger.info(f"اتصال به تلگرام برقرار شد ({len(self.pool.accounts)} حساب فعال)")
+        return True
+
+    async def _connect_extra_account(self, name):
+        """اتصال یک حساب اضافی؛ حساب‌هایی که احراز هویت نشده‌اند نادیده گرفته می‌شوند"""
+        client = TelegramClient(name, API_ID, API_HASH, flood_sleep_threshold=0)
+        try:
+            await client.connect()
+            if not await client.is_user_authorized():
+                logger.warning(f"سشن {name} احراز هویت نشده است؛ با auth_user.py --session {name} آن را فعال کنید.")
+                await client.disconnect()
+                return
+        except Exception as e:
+            logger.error(f"خطا در اتصال حساب {name}: {e}")
+            await client.disconnect()
+            return
+        self.pool.add(Account(name, client, RateGovernor()))
+        logger.info(f"حساب اضافی {name} به مجموعه حساب‌ها اضافه شد")
+
+    def submit(self, coro):
+        """ارسال یک coroutine به حلقه رویداد مشترک و دریافت concurrent.futures.Future"""
+        if self.loop is None:
+            raise RuntimeError("سرویس کلاینت تلگرام راه‌اندازی نشده است")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """اجرای یک coroutine روی حلقه مشترک و انتظار برای نتیجه آن"""
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        """قطع اتصال کلاینت و توقف حلقه رویداد (هنگام خاموش شدن ربات)"""
+        with self._lock:
+            if self.loop is None:
+                return
+            if self.client is not None and self.is_connected:
+                for account in self.pool.accounts or [Account(self.session_name, self.client, governor)]:
+                    try:
+                        self.run(account.client.disconnect(), timeout=10)
+                    except Exception as e:
+                        logger.error(f"خطا در قطع اتصال حساب {account.name} از تلگرام: {e}")
+                logger.info("اتصال به تلگرام قطع شد")
+                self.pool.clear()
+            self.is_connected = False
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=10)
+            self.loop = None
+            self._thread = None
+
+
+# سرویس مشترک برای کل فرآیند
+client_service = ClientService()
@@ -9,12 +9,103 @@ API_ID = os.getenv('API_ID')
 API_HASH = os.getenv('API_HASH')
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 SESSION_NAME = os.getenv('SESSION_NAME', 'tg_music_downloader')
+# فهرست سشن‌های اضافی (هر خط یک نام) که با auth_user.py --add ثبت می‌شوند
+SESSION_POOL_FILE = os.getenv('SESSION_POOL_FILE', 'sessions.txt')
 
 # آدرس ربات مقصد
 TARGET_BOT = "@دلخواه"
+# ارسال همزمان به چند مقصد (ربات‌ها یا کانال‌های پشتیبان)، جدا شده با کاما؛ پیش‌فرض فقط TARGET_BOT
+TARGET_BOTS = [target.strip() for target in os.getenv('TARGET_BOTS', TARGET_BOT).split(',') if target.strip()]
 
 # تعداد فایل موسیقی در هر دسته
 BATCH_SIZE = 100
+# تعداد دسته‌های نمایش داده شده در هر صفحه از فهرست دسته‌ها
+BATCH_PAGE_SIZE = int(os.getenv('BATCH_PAGE_SIZE', '24'))
 
 # حداکثر تعداد پیام‌هایی که پردازش می‌شود (برای جلوگیری از پردازش بیش از حد کانال‌های بزرگ)
-MAX_MESSAGES = 50000 
\ No newline at end of file
+MAX_MESSAGES = 50000 
+
+# حالت اسکن کانال: "search" (فقط فایل‌های موسیقی با فیلتر سمت سرور) یا "history" (پیمایش کامل تاریخچه)
+SCAN_MODE = os.getenv('SCAN_MODE', 'search')
+
+# تعداد بخش‌های موازی برای اسکن همزمان محدوده شناسه پیام‌های یک کانال (1 یعنی اسکن ترتیبی)
+SCAN_SHARDS = int(os.getenv('SCAN_SHARDS', '4'))
+
+# مسیر فایل نمایه دائمی اسکن کانال‌ها (برای غیرفعال کردن، مقدار خالی قرار دهید)
+SCAN_INDEX_PATH = os.getenv('SCAN_INDEX_PATH', 'scan_index.db')
+
+# حافظه نتایج اسکن مشترک بین کاربران: مدت اعتبار (ثانیه) و حداکثر تعداد نتایج نگه‌داری شده (0 برای غیرفعال کردن)
+SCAN_CACHE_TTL = float(os.getenv('SCAN_CACHE_TTL', '600'))
+SCAN_CACHE_SIZE = int(os.getenv('SCAN_CACHE_SIZE', '32'))
+
+# حافظه دائمی resolve آدرس کانال‌ها (نام کاربری، لینک t.me یا شناسه عددی) و مدت اعتبار آن (ثانیه)؛ مسیر خالی یعنی غیرفعال
+ENTITY_CACHE_PATH = os.getenv('ENTITY_CACHE_PATH', 'entity_cache.db')
+ENTITY_CACHE_TTL = float(os.getenv('ENTITY_CACHE_TTL', '86400'))
+
+# حذف فایل‌های تکراری در حین اسکن: "off"، "document" (شناسه سند) یا "metadata" (شناسه سند یا خواننده/عنوان/مدت/حجم)
+DEDUP_MODE = os.getenv('DEDUP_MODE', 'document')
+
+# تعداد اسکن‌های همزمان در پس‌زمینه و حداکثر تعداد اسکن‌های منتظر در صف
+SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', '3'))
+SCAN_QUEUE_SIZE = int(os.getenv('SCAN_QUEUE_SIZE', '50'))
+
+# کنترل نرخ درخواست‌ها به تلگرام (درخواست در ثانیه)؛ نرخ به صورت خودکار بین حداقل و حداکثر تنظیم می‌شود
+RATE_LIMIT_INITIAL = float(os.getenv('RATE_LIMIT_INITIAL', '2'))
+RATE_LIMIT_MIN = float(os.getenv('RATE_LIMIT_MIN', '0.2'))
+RATE_LIMIT_MAX = float(os.getenv('RATE_LIMIT_MAX', '20'))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '5'))
+
+# حداکثر زمان FloodWait که ارسال فایل به صورت درجا منتظر آن می‌ماند؛ بیشتر از آن به زمان‌بندی مجدد سپرده می‌شود
+FORWARD_MAX_INLINE_WAIT = 10
+
+# تعداد پیام‌هایی که با یک درخواست ارسال گروهی فرستاده می‌شوند (حداکثر 100)
+FORWARD_CHUNK_SIZE = min(100, int(os.getenv('FORWARD_CHUNK_SIZE', '100')))
+
+# زمان‌بند مشترک ارسال: حداکثر ارسال همزمان در کل ربات و وزن نوبت کاربران (مثال: "12345:3,67890:2"؛ پیش‌فرض 1)
+FORWARD_WORKERS = int(os.getenv('FORWARD_WORKERS', '4'))
+FORWARD_USER_WEIGHTS = {
+    int(user_id): int(weight)
+    for user_id, weight in (item.split(':') for item in os.getenv('FORWARD_USER_WEIGHTS', '').split(',') if item.strip())
+}
+
+# ویرایش پیام‌های وضعیت: حداقل فاصله بین دو ویرایش در یک چت (ثانیه) و سقف کلی ویرایش‌ها در ثانیه
+PROGRESS_CHAT_INTERVAL = float(os.getenv('PROGRESS_CHAT_INTERVAL', '3'))
+PROGRESS_GLOBAL_RATE = float(os.getenv('PROGRESS_GLOBAL_RATE', '20'))
+
+# دفترچه پایدار ارسال فایل‌ها برای ادامه کارهای ناتمام پس از راه‌اندازی مجدد (برای غیرفعال کردن، مقدار خالی قرار دهید)
+FORWARD_JOURNAL_PATH = os.getenv('FORWARD_JOURNAL_PATH', 'forward_journal.log')
+# فاصله group commit (ثانیه): نوشتن‌های همزمان در این بازه با یک fsync پایدار می‌شوند
+FORWARD_JOURNAL_SYNC_INTERVAL = float(os.getenv('FORWARD_JOURNAL_SYNC_INTERVAL', '0.05'))
+# حجم دفترچه (بایت) که پس از رسیدن به آن، با پایان هر کار ارسال فقط کارهای ناتمام بازنویسی می‌شوند
+FORWARD_JOURNAL_COMPACT_SIZE = int(os.getenv('FORWARD_JOURNAL_COMPACT_SIZE', str(8 * 1024 * 1024)))
+
+# دفتر دائمی فایل‌های ارسال شده به هر مقصد برای جلوگیری از ارسال تکراری (برای غیرفعال کردن، مقدار خالی قرار دهید)
+FORWARD_LEDGER_PATH = os.getenv('FORWARD_LEDGER_PATH', 'forward_ledger.db')
+# ظرفیت و نرخ خطای فیلتر Bloom هر مقصد (حافظه تقریبی: 10 میلیون فایل با خطای 1% حدود 12 مگابایت)
+FORWARD_LEDGER_CAPACITY = int(os.getenv('FORWARD_LEDGER_CAPACITY', '10000000'))
+FORWARD_LEDGER_ERROR_RATE = float(os.getenv('FORWARD_LEDGER_ERROR_RATE', '0.01'))
+
+# آدرس سرور HTTP معیارها با قالب Prometheus (مسیر /metrics)؛ پورت 0 یعنی غیرفعال
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# پوشه ذخیره فایل‌های trace زمان‌بندی مراحل هر اسکن (قالب Chrome trace)؛ خالی یعنی غیرفعال
+SCAN_TRACE_DIR = os.getenv('SCAN_TRACE_DIR', '')
+
+# قوانین تشخیص فایل‌های موسیقی (0 یعنی بدون محدودیت)
+AUDIO_MIN_DURATION = int(os.getenv('AUDIO_MIN_DURATION', '0'))  # ثانیه
+AUDIO_MAX_DURATION = int(os.getenv('AUDIO_MAX_DURATION', '0'))  # ثانیه
+AUDIO_MIN_SIZE = int(os.getenv('AUDIO_MIN_SIZE', '0'))  # بایت
+AUDIO_MAX_SIZE = int(os.getenv('AUDIO_MAX_SIZE', '0'))  # بایت
+# انواع مجاز فایل با کاما جدا می‌شوند (مثلاً audio/mpeg,audio/flac)؛ خالی یعنی همه انواع
+AUDIO_MIME_TYPES = [mime.strip() for mime in os.getenv('AUDIO_MIME_TYPES', '').split(',') if mime.strip()]
+# نادیده گرفتن پیام‌های صوتی (voice)
+AUDIO_EXCLUDE_VOICE = os.getenv('AUDIO_EXCLUDE_VOICE', '1') not in ('0', 'false', 'False')
+
+# جلسه‌های کاربران: زمان بیکاری تا خروج از حافظه (ثانیه)، سقف مجموع حافظه جلسه‌ها (بایت) و فاصله بررسی (ثانیه)
+SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', '3600'))
+SESSION_MEMORY_BUDGET = int(os.getenv('SESSION_MEMORY_BUDGET', str(256 * 1024 * 1024)))
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+# پوشه ذخیره جلسه‌های خارج شده از حافظه برای بارگذاری مجدد (خالی یعنی جلسه‌ها فقط حذف می‌شوند) و مدت نگه‌داری آن‌ها (ثانیه)
+SESSION_SPILL_DIR = os.getenv('SESSION_SPILL_DIR', 'session_spill')
+SESSION_SPILL_TTL = float(os.getenv('SESSION_SPILL_TTL', str(7 * 24 * 3600)))
\ No newline at end of file
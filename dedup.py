@@ -0,0 +1,63 @@
+import itertools
+import sys
+from config import DEDUP_MODE
+
+
+class AudioDeduplicator:
+    """حذف فایل‌های موسیقی تکراری در حین اسکن
+
+    حالت‌ها:
+        "off": بدون حذف تکراری
+        "document": فایل‌هایی با شناسه سند یکسان تکراری هستند
+        "metadata": علاوه بر شناسه سند، فایل‌هایی با (خواننده، عنوان، مدت، حجم) یکسان
+
+    برای کم بودن مصرف حافظه در میلیون‌ها فایل، فقط hash عددی کلیدها نگه‌داری می‌شود.
+    """
+
+    def __init__(self, mode=DEDUP_MODE):
+        self.mode = mode
+        self.dropped = 0  # تعداد فایل‌های تکراری حذف شده
+        self._document_ids = set()
+        self._metadata_keys = set()
+
+    @staticmethod
+    def _metadata_key(ref):
+        """کلید فراداده برای تشخیص ارسال‌های مجدد یک آهنگ با سند متفاوت"""
+        if not ref.title:
+            return None
+        performer = (ref.performer or "").strip().lower()
+        title = ref.title.strip().lower()
+        return hash((performer, title, ref.duration, ref.size))
+
+    def is_duplicate(self, ref):
+        """بررسی و ثبت یک فایل؛ True اگر قبلاً دیده شده باشد"""
+        if self.mode == "off":
+            return False
+
+        if ref.document_id in self._document_ids:
+            return True
+
+        if self.mode == "metadata":
+            key = self._metadata_key(ref)
+            if key is not None:
+                if key in self._metadata_keys:
+                    return True
+                self._metadata_keys.add(key)
+
+        self._document_ids.add(ref.document_id)
+        return False
+
+    def filter(self, refs):
+        """حذف فایل‌های تکراری از یک لیست و به‌روزرسانی شمارنده"""
+        unique = [ref for ref in refs if not self.is_duplicate(ref)]
+        self.dropped += len(refs) - len(unique)
+        return unique
+
+    def memory_usage(self):
+        """حجم تقریبی حافظه کلیدهای نگه‌داری شده (بایت)؛ حجم هر کلید از روی نمونه‌ای از کلیدها تخمین زده می‌شود"""
+        size = 0
+        for keys in (self._document_ids, self._metadata_keys):
+            sample = list(itertools.islice(keys, 100))
+            per_key = sum(sys.getsizeof(key) for key in sample) / len(sample) if sample else 0
+            size += sys.getsizeof(keys) + int(per_key * len(keys))
+        return size
@@ -1,284 +1,796 @@
 import logging
 import asyncio
 import time
-from telethon import TelegramClient
-from telethon.tl.functions.messages import GetHistoryRequest
+from telethon import utils as tg_utils
+from telethon.errors import BadRequestError, FloodWaitError
+from telethon.tl.functions.messages import GetHistoryRequest, SearchRequest
 from utils import logger
-from telethon.tl.types import DocumentAttributeAudio, Message
-from config import API_ID, API_HASH, SESSION_NAME, BOT_TOKEN, MAX_MESSAGES
+from telethon.tl.types import InputMessagesFilterMusic
+from config import MAX_MESSAGES, SCAN_MODE, SCAN_SHARDS, FORWARD_MAX_INLINE_WAIT, FORWARD_CHUNK_SIZE
+from rate_governor import governor
+from scan_index import scan_index
+from scan_cache import scan_cache
+from entity_cache import entity_cache
+from client_service import client_service
+import metrics
+from scan_timing import ScanTimings
+from classifier import audio_classifier
+
+class ScanPage:
+    """نتیجه پردازش یک صفحه از تاریخچه کانال"""
+    __slots__ = ("audio_files", "offset_id", "processed", "has_more")
+    
+    def __init__(self, audio_files, offset_id, processed, has_more):
+        self.audio_files = audio_files  # فایل‌های صوتی یافت‌شده در این صفحه (AudioRef)
+        self.offset_id = offset_id      # همه پیام‌ها از این شناسه تا ابتدای اسکن پردازش شده‌اند
+        self.processed = processed      # مجموع پیام‌های پردازش‌شده تا این صفحه
+        self.has_more = has_more        # آیا پیام‌های بیشتری برای پردازش وجود دارد
+
+def _split_forward_chunks(audio_refs, chunk_size):
+    """تقسیم فایل‌ها به بخش‌های متوالی از یک کانال مبدا با حداکثر chunk_size عضو"""
+    chunk = []
+    for ref in audio_refs:
+        if chunk and (len(chunk) >= chunk_size or ref.peer_id != chunk[0].peer_id):
+            yield chunk
+            chunk = []
+        chunk.append(ref)
+    if chunk:
+        yield chunk
+
+class _SearchUnavailable(Exception):
+    """جستجوی سمت سرور برای این چت پشتیبانی نمی‌شود
+
+    فقط از خطای BadRequest (رد درخواست جستجو توسط سرور) ساخته می‌شود؛ خطاهای
+    موقت مانند ServerError در _send_with_retry دوباره تلاش می‌شوند.
+    """
 
 class MusicDownloader:
-    def __init__(self):
-        """راه‌اندازی کلاینت تلگرام برای دانلود موسیقی"""
+    def __init__(self, service=None):
+        """راه‌اندازی دانلودر موسیقی روی کلاینت مشترک تلگرام
+        
+        هر کاربر یک نمونه MusicDownloader دارد، اما همه نمونه‌ها از یک
+        TelegramClient و یک حلقه رویداد مشترک (client_service) استفاده می‌کنند.
+        """
+        self.service = service or client_service
         self.client = None
         self.is_connected = False
         self.loop = None
-        self.user_mode = True  # استفاده از حساب کاربری عادی به جای ربات
+        self.request_count = 0  # تعداد درخواست‌های ارسال شده به تلگرام
+        self.timings = ScanTimings()  # زمان‌سنجی مراحل آخرین اسکن
         
     def connect(self):
-        """ایجاد اتصال به تلگرام"""
+        """اتصال به کلاینت مشترک تلگرام (اتصال واقعی فقط یک بار در هر فرآیند انجام می‌شود)"""
         if not self.is_connected:
-            try:
-                self.loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(self.loop)
-                
-                # استفاده از نام session برای احراز هویت
-                self.client = TelegramClient(SESSION_NAME, API_ID, API_HASH, loop=self.loop)
-                
-                if self.user_mode:
-                    # حالت کاربر عادی: تلاش برای استفاده از session موجود
-                    logger.info("تلاش برای اتصال با حساب کاربری عادی...")
-                    
-                    async def _connect_and_check():
-                        await self.client.connect()
-                        return await self.client.is_user_authorized()
-                    
-                    self.loop.run_until_complete(self.client.connect())
-                    if not self.loop.run_until_complete(self.client.is_user_authorized()):
-                        # اگر قبلاً احراز هویت نشده، نیاز به ورود ماژول interactive_auth است
-                        logger.error("سشن معتبر یافت نشد. لطفاً ابتدا با اجرای اسکریپت auth_user.py به صورت تعاملی احراز هویت کنید.")
-                        return False
-                    
-                    logger.info("اتصال با حساب کاربری عادی با موفقیت انجام شد.")
-                else:
-                    # حالت ربات: تلاش برای استفاده از توکن ربات
-                    try:
-                        logger.info("تلاش برای اتصال با Bot Token...")
-                        
-                        async def _start_bot():
-                            await self.client.start(bot_token=BOT_TOKEN)
-                        
-                        self.loop.run_until_complete(_start_bot())
-                        logger.info("اتصال با Bot Token با موفقیت انجام شد.")
-                    except Exception as e:
-                        logger.error(f"خطا در اتصال با Bot Token: {e}")
-                        return False
-                
-                self.is_connected = True
-                logger.info("اتصال به تلگرام برقرار شد")
-                return True
-            except Exception as e:
-                logger.error(f"خطا در برقراری اتصال به تلگرام: {e}")
+            if not self.service.start():
                 return False
+            self.client = self.service.client
+            self.loop = self.service.loop
+            self.is_connected = True
+        return True
                 
     def disconnect(self):
-        """قطع اتصال از تلگرام"""
-        if self.is_connected and self.client:
-            try:
-                async def _disconnect():
-                    await self.client.disconnect()
-                
-                self.loop.run_until_complete(_disconnect())
-                self.is_connected = False
-                logger.info("اتصال به تلگرام قطع شد")
-            except Exception as e:
-                logger.error(f"خطا در قطع اتصال از تلگرام: {e}")
+        """جدا شدن از کلاینت مشترک (اتصال مشترک برای سایر کاربران باز می‌ماند)"""
+        self.is_connected = False
+    
+    def _run(self, coro):
+        """اجرای یک coroutine روی حلقه رویداد مشترک و انتظار برای نتیجه"""
+        return self.service.run(coro)
+    
+    def submit(self, coro):
+        """ارسال یک coroutine به حلقه رویداد مشترک و دریافت Future آن"""
+        return self.service.submit(coro)
     
     def get_entity(self, chat_id):
         """دریافت اطلاعات کانال یا گروه"""
         try:
-            async def _get_entity():
-                return await self.client.get_entity(chat_id)
-                
-            entity = self.loop.run_until_complete(_get_entity())
+            entity = self._run(self._get_entity_async(chat_id))
             return entity
         except Exception as e:
             logger.error(f"خطا در دریافت اطلاعات کانال یا گروه: {e}")
             return None
     
-    def get_music_files(self, chat_id, progress_callback=None, max_messages=None, start_offset_id=0):
-        """دریافت همه فایل‌های موسیقی از کانال یا گروه
+    async def _get_entity_async(self, chat_id):
+        """دریافت اطلاعات کانال یا گروه (async)؛ نتیجه resolve در حافظه دائمی entity_cache نگه‌داری می‌شود"""
+        if entity_cache is None:
+            entity = await governor.call(lambda: self.client.get_entity(chat_id))
+        else:
+            entity = await entity_cache.resolve(
+                self.service.session_name, chat_id, lambda: governor.call(lambda: self.client.get_entity(chat_id))
+            )
+        # نتیجه برای حساب اصلی معتبر است؛ فقط حساب‌های اضافی چت را دوباره resolve می‌کنند
+        primary = self.service.pool.primary
+        if primary is not None and primary.name == self.service.session_name:
+            primary.remember_peer(entity)
+        return entity
+    
+    async def _send_with_retry(self, request, fail_fast=False):
+        """ارسال یک درخواست به تلگرام از طریق کنترل‌کننده نرخ با تلاش مجدد در صورت خطا
+        
+        هر تلاش به حسابی از pool می‌رود که زودتر آزاد است و peer درخواست برای
+        همان حساب resolve می‌شود. FloodWait توسط کنترل‌کننده نرخ همان حساب ثبت
+        می‌شود و اگر حساب دیگری وجود داشته باشد درخواست بلافاصله به آن منتقل
+        می‌شود؛ سایر خطاها (مانند قطعی شبکه) با تاخیر نمایی دوباره تلاش می‌شوند.
+        
+        Args:
+            request: درخواست MTProto
+            fail_fast: اگر True باشد، خطاهای BadRequest (مثلاً عدم پشتیبانی جستجو) بلافاصله دوباره
+                پرتاب می‌شوند؛ سایر خطاها مانند ServerError همچنان دوباره تلاش می‌شوند
+            
+        Returns:
+            نتیجه درخواست یا None پس از چند تلاش ناموفق
+        """
+        request_name = type(request).__name__
+        timings = self.timings
+        network_time = 0.0
+        
+        async def timed_request(client):
+            # فقط زمان پاسخ تلگرام اندازه‌گیری می‌شود، نه انتظار در کنترل‌کننده نرخ
+            nonlocal network_time
+            started = time.monotonic()
+            try:
+                return await client(request)
+            finally:
+                duration = time.monotonic() - started
+                network_time += duration
+                timings.add("network", duration, started)
+                metrics.request_latency.observe(duration, request=request_name)
+        
+        pool = self.service.pool
+        entity = getattr(request, "peer", None)
+        no_access = set()  # حساب‌هایی که به این چت دسترسی ندارند
+        retry_count = 0
+        while True:
+            started = time.monotonic()
+            network_time = 0.0
+            try:
+                try:
+                    account = pool.pick(no_access)
+                    peer = entity
+                    if account is None:
+                        # هیچ حسابی از pool چت را resolve نکرد؛ مانند قبل با حساب اصلی ارسال می‌شود
+                        account = pool.primary
+                    elif entity is not None:
+                        peer = await account.input_peer(entity)
+                        if peer is None:
+                            no_access.add(account)
+                            continue
+                    if entity is not None:
+                        request.peer = peer
+                    self.request_count += 1
+                    # با وجود حساب جایگزین، FloodWait بدون انتظار به حساب دیگری منتقل می‌شود
+                    result = await account.call(timed_request, max_flood_wait=0 if pool.drain_flood_waits() else None)
+                finally:
+                    # هر زمانی که صرف پاسخ شبکه نشده، انتظار در کنترل‌کننده نرخ بوده است
+                    timings.add("pacing", max(0.0, time.monotonic() - started - network_time), started)
+                metrics.pages_fetched.inc(mode="search" if isinstance(request, SearchRequest) else "history")
+                return result
+            except FloodWaitError:
+                # وضعیت فلاد در کنترل‌کننده نرخ همان حساب ثبت شده است؛ انتخاب حساب بعدی
+                continue
+            except Exception as e:
+                if fail_fast and isinstance(e, BadRequestError):
+                    raise
+                
+                retry_count += 1
+                logger.error(f"خطا در دریافت پیام‌ها: {e}")
+                
+                # پس از چند تلاش ناموفق، خروج
+                if retry_count >= 10:  # افزایش تعداد تلاش‌ها
+                    logger.error("تعداد تلاش‌های ناموفق بیش از حد مجاز - توقف پردازش")
+                    return None
+                
+                # تلاش مجدد با تاخیر نمایی
+                wait_time = min(30, 2 ** retry_count)
+                logger.info(f"انتظار برای {wait_time} ثانیه قبل از تلاش مجدد...")
+                with timings.span("backoff"):
+                    await asyncio.sleep(wait_time)
+    
+    async def iter_music_files(self, chat_id, max_messages=None, start_offset_id=0, entity=None, mode=None,
+                               shards=None, deduplicator=None):
+        """پیمایش تدریجی فایل‌های موسیقی کانال یا گروه (async generator)
+        
+        به جای جمع‌آوری همه پیام‌ها در یک لیست، نتایج هر صفحه
+        به محض دریافت به صورت یک ScanPage بازگردانده می‌شود تا فراخواننده
+        بتواند در حین اسکن آن‌ها را ذخیره یا ارسال کند.
         
         Args:
             chat_id: آدرس کانال یا گروه
-            progress_callback: تابع کال‌بک برای نمایش پیشرفت
             max_messages: حداکثر تعداد پیام‌های قابل پردازش
             start_offset_id: شناسه پیامی که پردازش از آن شروع می‌شود
+            entity: entity از پیش دریافت شده (اختیاری)
+            mode: حالت اسکن؛ "search" (فیلتر موسیقی سمت سرور) یا "history" (پیمایش کامل تاریخچه)
+            shards: تعداد بخش‌های موازی محدوده شناسه‌ها (پیش‌فرض SCAN_SHARDS)
+            deduplicator: AudioDeduplicator برای حذف فایل‌های تکراری (اختیاری)
+            
+        Yields:
+            ScanPage: فایل‌های صوتی هر صفحه به همراه offset فعلی
+        """
+        if entity is None:
+            try:
+                entity = await self._get_entity_async(chat_id)
+            except Exception as e:
+                logger.error(f"خطا در دریافت اطلاعات کانال یا گروه: {e}")
+                return
+        
+        mode = mode or SCAN_MODE
+        shards = SCAN_SHARDS if shards is None else shards
+        
+        def scan():
+            if scan_index is None:
+                return self._scan_pages(entity, max_messages, start_offset_id, 0, mode, shards)
+            return self._iter_indexed_pages(entity, max_messages, start_offset_id, mode, shards)
+        
+        # درخواست‌های همزمان یا تکراری برای یک بازه از یک چت، یک اسکن مشترک دارند
+        if scan_cache is None:
+            pages = scan()
+        else:
+            key = (tg_utils.get_peer_id(entity), start_offset_id, max_messages, mode, shards)
+            pages = scan_cache.iter_pages(key, scan, self.timings)
+        async for page in pages:
+            if deduplicator is not None:
+                page.audio_files = deduplicator.filter(page.audio_files)
+            yield page
+    
+    async def _scan_pages(self, entity, max_messages, start_offset_id, floor_id, mode, shards):
+        """اسکن پیام‌های با شناسه بیشتر از floor_id، با بازگشت به پیمایش تاریخچه در صورت عدم امکان جستجو"""
+        if mode == "search":
+            try:
+                async for page in self._iter_pages(entity, max_messages, start_offset_id, floor_id, "search", shards):
+                    yield page
+                return
+            except _SearchUnavailable as e:
+                logger.warning(f"جستجوی سمت سرور برای این کانال در دسترس نیست ({e}) - استفاده از پیمایش تاریخچه")
+        
+        async for page in self._iter_pages(entity, max_messages, start_offset_id, floor_id, "history", shards):
+            yield page
+    
+    def _iter_pages(self, entity, max_messages, start_offset_id, floor_id, mode, shards):
+        """انتخاب روش پیمایش بر اساس حالت اسکن و تعداد بخش‌های موازی"""
+        if shards > 1:
+            return self._iter_sharded_pages(entity, max_messages, start_offset_id, floor_id, mode, shards)
+        if mode == "search":
+            return self._iter_search_pages(entity, max_messages, start_offset_id, floor_id)
+        return self._iter_history_pages(entity, max_messages, start_offset_id, floor_id)
+    
+    async def _iter_indexed_pages(self, entity, max_messages, start_offset_id, mode, shards):
+        """اسکن با استفاده از نمایه ذخیره شده روی دیسک
+        
+        محدوده‌هایی از شناسه‌ها که قبلاً اسکن شده‌اند مستقیماً از نمایه خوانده می‌شوند و
+        فقط بازه‌های اسکن نشده (پیام‌های جدیدتر از آخرین اسکن یا قدیمی‌تر از آن) از
+        تلگرام دریافت می‌شوند. سقف max_messages فقط برای پیام‌های دریافتی از تلگرام است.
+        اطلاعاتی که با قوانین تشخیص یا حالت اسکن دیگری ذخیره شده‌اند استفاده نمی‌شوند.
+        """
+        peer_id = tg_utils.get_peer_id(entity)
+        if scan_index.ensure_fingerprint(peer_id, f"mode={mode};{audio_classifier.fingerprint}"):
+            logger.info(f"قوانین تشخیص یا حالت اسکن تغییر کرده است - نمایه ذخیره شده کانال {peer_id} باطل شد")
+        cursor = start_offset_id
+        if not cursor:
+            latest_id = await self._get_top_message_id(entity)
+            if latest_id is None:
+                return
+            cursor = latest_id + 1
+        
+        scanned = 0  # تعداد پیام‌های دریافت شده از تلگرام در این فراخوانی
+        while True:
+            if cursor <= 1:
+                yield ScanPage([], cursor, scanned, False)
+                return
+            
+            # بخش قبلاً اسکن شده: خواندن مستقیم از نمایه
+            cached_range = scan_index.find_range(peer_id, cursor - 1)
+            if cached_range:
+                low = cached_range[0]
+                for refs in scan_index.iter_audio(peer_id, low, cursor):
+                    yield ScanPage(refs, refs[-1].message_id, scanned, True)
+                cursor = low
+                continue
+            
+            # بخش اسکن نشده تا ابتدای بازه ذخیره شده بعدی
+            floor_id = scan_index.next_range_below(peer_id, cursor)
+            budget = None
+            if max_messages:
+                budget = max_messages - scanned
+                if budget <= 0:
+                    # سقف پیام‌های این مرحله پیش از بخش اسکن نشده بعدی پر شده است؛ ادامه از همین نقطه
+                    yield ScanPage([], cursor, scanned, True)
+                    return
+            segment_top = cursor
+            last_page = None
+            page_processed = 0
+            async for page in self._scan_pages(entity, budget, cursor, floor_id, mode, shards):
+                scanned += page.processed - page_processed
+                page_processed = page.processed
+                low = page.offset_id if page.has_more else 1
+                scan_index.add_page(peer_id, page.audio_files, low, segment_top - 1)
+                last_page = page
+                yield ScanPage(page.audio_files, page.offset_id, scanned, page.has_more)
+            
+            if last_page is None:
+                return
+            if not last_page.has_more:
+                return
+            if not (floor_id and last_page.offset_id == floor_id + 1):
+                # سقف پیام‌های این مرحله پر شده است
+                return
+            cursor = last_page.offset_id
+    
+    @staticmethod
+    def _build_page_request(entity, mode, offset_id, min_id, limit=100):
+        """ساخت درخواست یک صفحه از پیام‌ها (پیام‌هایی با min_id < id < offset_id)"""
+        if mode == "search":
+            return SearchRequest(
+                peer=entity,
+                q="",
+                filter=InputMessagesFilterMusic(),
+                min_date=None,
+                max_date=None,
+                offset_id=offset_id,
+                add_offset=0,
+                limit=limit,
+                max_id=0,
+                min_id=min_id,
+                hash=0
+            )
+        return GetHistoryRequest(
+            peer=entity,
+            offset_id=offset_id,
+            offset_date=None,
+            add_offset=0,
+            limit=limit,
+            max_id=0,
+            min_id=min_id,
+            hash=0
+        )
+    
+    async def _get_top_message_id(self, entity):
+        """دریافت شناسه آخرین پیام کانال (0 برای کانال خالی و None در صورت خطا)"""
+        latest = await self._send_with_retry(self._build_page_request(entity, "history", 0, 0, limit=1))
+        if latest is None:
+            return None
+        return latest.messages[0].id if latest.messages else 0
+    
+    async def _iter_history_pages(self, entity, max_messages, start_offset_id, floor_id=0):
+        """پیمایش کامل تاریخچه با GetHistoryRequest و تشخیص فایل‌های صوتی در سمت کلاینت"""
+        offset_id = start_offset_id
+        limit = 100
+        processed = 0
+        
+        while True:
+            # بررسی برای توقف پردازش پس از رسیدن به حداکثر تعداد پیام‌ها (اگر تعیین شده باشد)
+            if max_messages and processed >= max_messages:
+                logger.info(f"رسیدن به حداکثر تعداد پیام‌های قابل پردازش ({max_messages})")
+                return
+            
+            history = await self._send_with_retry(self._build_page_request(entity, "history", offset_id, floor_id, limit))
+            if history is None:
+                return
+            
+            messages = history.messages
+            if not messages:
+                logger.info("پایان پیام‌های کانال")
+                if floor_id:
+                    yield ScanPage([], floor_id + 1, processed, True)
+                else:
+                    yield ScanPage([], offset_id, processed, False)
+                return
+            
+            logger.info(f"دریافت {len(messages)} پیام جدید (مجموع پردازش شده: {processed})")
+            
+            reached_limit = False
+            # بررسی برای توقف پردازش در میانه صفحه (اگر تعیین شده باشد)
+            if max_messages and processed + len(messages) >= max_messages:
+                messages = messages[:max_messages - processed]
+                logger.info(f"رسیدن به حداکثر تعداد پیام در حلقه داخلی ({max_messages})")
+                reached_limit = True
+            processed += len(messages)
+            offset_id = messages[-1].id
+            
+            # تشخیص فایل‌های صوتی کل صفحه با یک پیمایش؛ فقط نمایش فشرده پیام نگه‌داری می‌شود
+            with self.timings.span("classification"):
+                audio_files = audio_classifier.classify_page(messages)
+            
+            metrics.messages_classified.inc(len(messages))
+            metrics.audio_found.inc(len(audio_files))
+            logger.info(f"یافتن {len(audio_files)} فایل صوتی در این دسته")
+            
+            if reached_limit:
+                # هنوز پیام‌های بیشتری وجود دارد
+                yield ScanPage(audio_files, offset_id, processed, True)
+                return
+            
+            if len(messages) < limit:
+                logger.info("تعداد پیام‌های دریافتی کمتر از حد مجاز - پایان دریافت")
+                if floor_id:
+                    # به ابتدای بازه درخواستی رسیدیم؛ پیام‌های قدیمی‌تر خارج از این بازه هستند
+                    yield ScanPage(audio_files, floor_id + 1, processed, True)
+                else:
+                    yield ScanPage(audio_files, offset_id, processed, False)
+                return
+            
+            yield ScanPage(audio_files, offset_id, processed, True)
+    
+    async def _iter_search_pages(self, entity, max_messages, start_offset_id, floor_id=0):
+        """دریافت فقط فایل‌های موسیقی با messages.Search و فیلتر موسیقی سمت سرور
+        
+        معنای offset_id و max_messages مانند پیمایش تاریخچه حفظ می‌شود: محدوده
+        شناسه‌های پوشش داده شده (و نه فقط تعداد نتایج) به عنوان پیام‌های پردازش شده
+        شمرده می‌شود و محدودیت با min_id به سرور سپرده می‌شود.
+        """
+        limit = 100
+        top_id = start_offset_id
+        
+        if not top_id and max_messages:
+            # برای محاسبه محدوده شناسه‌ها به شناسه آخرین پیام کانال نیاز داریم
+            latest_id = await self._get_top_message_id(entity)
+            if latest_id is None:
+                return
+            if not latest_id:
+                yield ScanPage([], 0, 0, False)
+                return
+            top_id = latest_id + 1
+        
+        # پیام‌هایی با شناسه کوچک‌تر یا مساوی min_id در این مرحله بررسی نمی‌شوند
+        min_id = max(floor_id, top_id - max_messages - 1) if max_messages else floor_id
+        offset_id = start_offset_id
+        first_request = True
+        
+        while True:
+            request = self._build_page_request(entity, "search", offset_id, min_id, limit)
+            if first_request:
+                try:
+                    result = await self._send_with_retry(request, fail_fast=True)
+                except BadRequestError as e:
+                    raise _SearchUnavailable(e)
+                first_request = False
+            else:
+                result = await self._send_with_retry(request)
+            if result is None:
+                return
+            
+            messages = result.messages
+            if messages and not top_id:
+                top_id = messages[0].id + 1
+            
+            if messages:
+                offset_id = messages[-1].id
+            with self.timings.span("classification"):
+                audio_files = audio_classifier.classify_page(messages)
             
+            metrics.messages_classified.inc(len(messages))
+            metrics.audio_found.inc(len(audio_files))
+            logger.info(f"دریافت {len(audio_files)} فایل موسیقی با جستجوی سمت سرور")
+            
+            if len(messages) < limit:
+                # به انتهای محدوده رسیدیم
+                if min_id > 0:
+                    yield ScanPage(audio_files, min_id + 1, max(0, top_id - min_id - 1), True)
+                else:
+                    yield ScanPage(audio_files, offset_id, max(0, top_id - 1), False)
+                return
+            
+            yield ScanPage(audio_files, offset_id, top_id - offset_id, True)
+    
+    async def _iter_sharded_pages(self, entity, max_messages, start_offset_id, floor_id, mode, shards):
+        """اسکن موازی کانال با تقسیم محدوده شناسه پیام‌ها به چند بخش
+        
+        هر بخش با min_id و offset_id محدود می‌شود و همه بخش‌ها به صورت همزمان روی
+        همان کلاینت دریافت می‌شوند. نتایج به ترتیب شناسه (از جدید به قدیم) ادغام
+        می‌شوند تا معنای offset برای ادامه اسکن حفظ شود. همه درخواست‌ها از
+        کنترل‌کننده نرخ مشترک عبور می‌کنند، پس همزمانی بیشتر باعث فلاد بیشتر نمی‌شود.
+        در این حالت تعداد پیام‌های پردازش شده بر اساس محدوده شناسه‌ها شمرده می‌شود.
+        """
+        limit = 100
+        top_id = start_offset_id
+        if not top_id:
+            latest_id = await self._get_top_message_id(entity)
+            if latest_id is None:
+                return
+            if not latest_id:
+                yield ScanPage([], 0, 0, False)
+                return
+            top_id = latest_id + 1
+        
+        # پیام‌هایی با شناسه کوچک‌تر یا مساوی floor_id در این مرحله بررسی نمی‌شوند
+        if max_messages:
+            floor_id = max(floor_id, top_id - max_messages - 1)
+        span = top_id - 1 - floor_id
+        if span <= 0:
+            yield ScanPage([], top_id, 0, floor_id > 0)
+            return
+        
+        shards = max(1, min(shards, -(-span // limit)))
+        step = -(-span // shards)
+        ranges = []
+        for i in range(shards):
+            high = top_id - i * step
+            low = max(floor_id, high - step - 1)
+            ranges.append((low, high))
+        
+        logger.info(f"اسکن موازی شناسه‌های {floor_id + 1} تا {top_id - 1} در {shards} بخش")
+        
+        queues = [asyncio.Queue() for _ in ranges]
+        tasks = [
+            asyncio.ensure_future(self._scan_range(entity, mode, low, high, queue, limit))
+            for (low, high), queue in zip(ranges, queues)
+        ]
+        
+        offset_id = top_id
+        yielded = False
+        try:
+            for queue in queues:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        if isinstance(item, _SearchUnavailable):
+                            if not yielded:
+                                raise item
+                            # جستجو برای بخش‌های قبلی کار کرده است؛ این خطا شکست همین بخش است و
+                            # بازگشت به پیمایش تاریخچه باعث دریافت دوباره صفحه‌های تحویل شده می‌شود
+                            logger.warning(f"جستجوی یکی از بخش‌ها ناموفق بود ({item})")
+                        # یک بخش با شکست مواجه شد؛ اسکن تا آخرین offset پیوسته متوقف می‌شود
+                        yield ScanPage([], offset_id, top_id - offset_id, True)
+                        return
+                    audio_files, page_offset_id = item
+                    offset_id = page_offset_id
+                    yielded = True
+                    yield ScanPage(audio_files, offset_id, top_id - offset_id, True)
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        if floor_id > 0:
+            yield ScanPage([], floor_id + 1, top_id - floor_id - 1, True)
+        else:
+            yield ScanPage([], offset_id, top_id - 1, False)
+    
+    async def _scan_range(self, entity, mode, low, high, queue, limit):
+        """دریافت پیام‌های با شناسه بین low و high (انحصاری) و قرار دادن نتایج در صف
+        
+        هر صفحه به صورت (فایل‌های صوتی, offset) در صف قرار می‌گیرد؛ پایان با None و
+        شکست با یک شیء Exception مشخص می‌شود.
+        """
+        offset_id = high
+        first_request = True
+        try:
+            while True:
+                request = self._build_page_request(entity, mode, offset_id, low, limit)
+                try:
+                    result = await self._send_with_retry(request, fail_fast=first_request and mode == "search")
+                except BadRequestError as e:
+                    await queue.put(_SearchUnavailable(e))
+                    return
+                first_request = False
+                if result is None:
+                    await queue.put(RuntimeError("دریافت پیام‌های این بخش ناموفق بود"))
+                    return
+                
+                messages = result.messages
+                with self.timings.span("classification"):
+                    audio_files = audio_classifier.classify_page(messages)
+                metrics.messages_classified.inc(len(messages))
+                metrics.audio_found.inc(len(audio_files))
+                if messages:
+                    offset_id = messages[-1].id
+                await queue.put((audio_files, offset_id))
+                
+                if len(messages) < limit:
+                    return
+        finally:
+            await queue.put(None)
+    
+    def get_music_files(self, chat_id, progress_callback=None, max_messages=None, start_offset_id=0,
+                        page_callback=None, deduplicator=None, timings=None):
+        """دریافت همه فایل‌های موسیقی از کانال یا گروه (sync)
+        
+        این تابع collect_music_files را روی حلقه مشترک اجرا کرده و منتظر نتیجه می‌ماند.
+        
         Returns:
-            tuple: (فایل‌های موسیقی, آخرین offset_id, آیا پیام‌های بیشتری وجود دارد)
+            tuple: (فایل‌های موسیقی به صورت AudioRef, آخرین offset_id, آیا پیام‌های بیشتری وجود دارد)
         """
         if not self.is_connected:
             if not self.connect():
                 return [], 0, False
         
-        entity = self.get_entity(chat_id)
-        if not entity:
-            return [], 0, False
+        return self._run(self.collect_music_files(
+            chat_id, progress_callback, max_messages, start_offset_id, page_callback, deduplicator, timings
+        ))
+    
+    async def collect_music_files(self, chat_id, progress_callback=None, max_messages=None, start_offset_id=0,
+                                  page_callback=None, deduplicator=None, timings=None):
+        """دریافت همه فایل‌های موسیقی از کانال یا گروه (async)
         
-        music_files = []
-        offset_id = start_offset_id  # اضافه کردن امکان شروع از یک پیام خاص
-        limit = 100
-        # استفاده از مقدار ورودی کاربر برای تعیین محدودیت
-        messages_limit = max_messages  # اگر None باشد، یعنی محدودیتی نداریم
-        total_count = 100000  # یک مقدار بزرگ برای نمایش پیشرفت در حالت بدون محدودیت
-        if messages_limit:
-            total_count = messages_limit  # اگر محدودیت داریم، از آن استفاده می‌کنیم
-        processed = 0    # تعداد پیام‌های پردازش شده
-        has_more_messages = False  # آیا پیام‌های بیشتری وجود دارد؟
+        این تابع مصرف‌کننده iter_music_files است. کال‌بک‌ها روی حلقه مشترک
+        فراخوانی می‌شوند و نباید مسدودکننده باشند؛ ویرایش پیام‌های پیشرفت باید
+        از طریق progress_editor انجام شود.
         
-        # ابتدا سعی می‌کنیم تعداد تقریبی پیام‌ها را بدست آوریم
-        try:
-            # روش ساده‌تر برای برآورد تعداد پیام‌ها
-            logger.info(f"در حال محاسبه تعداد تقریبی پیام‌های کانال/گروه...")
+        Args:
+            chat_id: آدرس کانال یا گروه
+            progress_callback: تابع کال‌بک برای نمایش پیشرفت
+            max_messages: حداکثر تعداد پیام‌های قابل پردازش
+            start_offset_id: شناسه پیامی که پردازش از آن شروع می‌شود
+            page_callback: تابع کال‌بک که برای هر ScanPage دریافتی فراخوانی می‌شود
+            deduplicator: AudioDeduplicator برای حذف فایل‌های تکراری (اختیاری)
+            timings: ScanTimings برای ثبت زمان مراحل این اسکن (اختیاری)
             
-            # محدودیت تعداد پیام‌ها (اگر تعیین شده باشد)
-            if messages_limit:
-                logger.info(f"محدود کردن تعداد پیام‌های قابل پردازش به {messages_limit}")
-            else:
-                logger.info("🔄 بدون محدودیت: تمام پیام‌های کانال بررسی خواهند شد (این فرآیند ممکن است طولانی باشد)")
-                
+        Returns:
+            tuple: (فایل‌های موسیقی به صورت AudioRef, آخرین offset_id, آیا پیام‌های بیشتری وجود دارد)
+        """
+        self.timings = timings or ScanTimings()
+        try:
+            return await self._collect_music_files(chat_id, progress_callback, max_messages, start_offset_id,
+                                                   page_callback, deduplicator)
+        finally:
+            self.timings.finish()
+    
+    async def _collect_music_files(self, chat_id, progress_callback, max_messages, start_offset_id,
+                                   page_callback, deduplicator):
+        """بدنه collect_music_files (زمان‌سنجی مراحل در self.timings ثبت می‌شود)"""
+        try:
+            entity = await self._get_entity_async(chat_id)
         except Exception as e:
-            logger.error(f"خطا در دریافت تعداد پیام‌ها: {e}")
+            logger.error(f"خطا در دریافت اطلاعات کانال یا گروه: {e}")
+            return [], 0, False
         
-        async def get_messages():
-            nonlocal offset_id, music_files, processed, has_more_messages
-            retry_count = 0
+        # استفاده از مقدار ورودی کاربر برای تعیین محدودیت
+        total_count = 100000  # یک مقدار بزرگ برای نمایش پیشرفت در حالت بدون محدودیت
+        if max_messages:
+            total_count = max_messages  # اگر محدودیت داریم، از آن استفاده می‌کنیم
+            logger.info(f"محدود کردن تعداد پیام‌های قابل پردازش به {max_messages}")
+        else:
+            logger.info("🔄 بدون محدودیت: تمام پیام‌های کانال بررسی خواهند شد (این فرآیند ممکن است طولانی باشد)")
+        
+        music_files = []
+        offset_id = start_offset_id
+        has_more_messages = False
+        requests_before = self.request_count
+        async for page in self.iter_music_files(chat_id, max_messages, start_offset_id, entity=entity,
+                                                deduplicator=deduplicator):
+            music_files.extend(page.audio_files)
+            offset_id = page.offset_id
+            has_more_messages = page.has_more
+            self.timings.set_progress(page.processed)
             
-            while True:
-                # بررسی برای توقف پردازش پس از رسیدن به حداکثر تعداد پیام‌ها (اگر تعیین شده باشد)
-                if messages_limit and processed >= messages_limit:
-                    logger.info(f"رسیدن به حداکثر تعداد پیام‌های قابل پردازش ({messages_limit})")
-                    has_more_messages = True  # مشخص می‌کنیم که هنوز پیام‌های بیشتری وجود دارد
-                    break
+            with self.timings.span("callback"):
+                if page_callback:
+                    page_callback(page)
                 
-                try:
-                    # افزودن تاخیر بین درخواست‌ها برای جلوگیری از فلاد کنترل
-                    await asyncio.sleep(0.5)
-                    
-                    # اطلاع‌رسانی پیشرفت
-                    if progress_callback and processed % 20 == 0:
-                        progress_callback(total_count, processed)
-                    
-                    history = await self.client(GetHistoryRequest(
-                        peer=entity,
-                        offset_id=offset_id,
-                        offset_date=None,
-                        add_offset=0,
-                        limit=limit,
-                        max_id=0,
-                        min_id=0,
-                        hash=0
-                    ))
-                    
-                    if not history.messages:
-                        logger.info("پایان پیام‌های کانال")
-                        has_more_messages = False
-                        break
-                        
-                    messages = history.messages
-                    batch_size = len(messages)
-                    audio_count_in_batch = 0
-                    
-                    logger.info(f"دریافت {batch_size} پیام جدید (مجموع پردازش شده: {processed})")
-                    
-                    for message in messages:
-                        processed += 1
-                        
-                        # تشخیص دقیق‌تر فایل‌های صوتی
-                        is_audio = await self.is_audio_message_async(message)
-                        if is_audio:
-                            audio_count_in_batch += 1
-                            music_files.append(message)
-                        
-                        # به‌روزرسانی پیشرفت با هر 10 پیام
-                        if processed % 10 == 0 and progress_callback:
-                            progress_callback(total_count, processed)
-                        
-                        # بررسی برای توقف پردازش در داخل حلقه (اگر تعیین شده باشد)
-                        if messages_limit and processed >= messages_limit:
-                            logger.info(f"رسیدن به حداکثر تعداد پیام در حلقه داخلی ({messages_limit})")
-                            has_more_messages = True  # مشخص می‌کنیم که هنوز پیام‌های بیشتری وجود دارد
-                            break
-                    
-                    logger.info(f"یافتن {audio_count_in_batch} فایل صوتی در این دسته (مجموع: {len(music_files)})")
-                    
-                    if not messages:
-                        logger.info("پایان پیام‌ها")
-                        break
-                        
-                    offset_id = messages[-1].id
-                    
-                    if len(messages) < limit:
-                        logger.info("تعداد پیام‌های دریافتی کمتر از حد مجاز - پایان دریافت")
-                        break
-                    
-                    # استراحت کوتاه بین دسته‌ها
-                    await asyncio.sleep(1)
-                    
-                except Exception as e:
-                    retry_count += 1
-                    logger.error(f"خطا در دریافت پیام‌ها: {e}")
-                    
-                    # تلاش مجدد با تاخیر بیشتر
-                    wait_time = min(30, retry_count * 5)
-                    logger.info(f"انتظار برای {wait_time} ثانیه قبل از تلاش مجدد...")
-                    await asyncio.sleep(wait_time)
-                    
-                    # پس از چند تلاش ناموفق، خروج
-                    if retry_count >= 10:  # افزایش تعداد تلاش‌ها
-                        logger.error("تعداد تلاش‌های ناموفق بیش از حد مجاز - توقف پردازش")
-                        break
-                    
-        self.loop.run_until_complete(get_messages())
+                # اطلاع‌رسانی پیشرفت
+                if progress_callback:
+                    progress_callback(total_count, page.processed)
         
         if len(music_files) == 0:
             logger.warning("هیچ فایل موسیقی در این کانال یافت نشد!")
         else:
             logger.info(f"تعداد {len(music_files)} فایل موسیقی یافت شد")
+        
+        request_count = self.request_count - requests_before
+        if self.timings.shared:
+            logger.info("نتیجه از اسکن مشترک دریافت شد (بدون درخواست جدید به تلگرام)")
+        elif music_files:
+            logger.info(f"تعداد درخواست‌ها: {request_count} ({request_count / len(music_files):.3f} درخواست به ازای هر فایل)")
             
         return music_files, offset_id, has_more_messages
     
     def is_audio_message(self, message):
-        """بررسی می‌کند که آیا پیام شامل فایل صوتی است یا خیر (sync)"""
-        return self.loop.run_until_complete(self.is_audio_message_async(message))
+        """بررسی می‌کند که آیا پیام شامل فایل موسیقی است یا خیر (sync)
+        توجه: پیام‌های صوتی (voice) طبق قوانین audio_classifier نادیده گرفته می‌شوند."""
+        return audio_classifier.is_audio(message)
     
     async def is_audio_message_async(self, message):
-        """بررسی می‌کند که آیا پیام شامل فایل موسیقی است یا خیر (async)
-        توجه: این تابع فقط فایل‌های موسیقی واقعی را تشخیص می‌دهد و پیام‌های صوتی (voice) را نادیده می‌گیرد."""
-        if not isinstance(message, Message):
-            return False
-            
-        # بررسی فایل‌های موسیقی مستقیم
-        if hasattr(message, 'audio') and message.audio:
-            return True
+        """نسخه async برای سازگاری؛ برای یک صفحه کامل از audio_classifier.classify_page استفاده کنید"""
+        return audio_classifier.is_audio(message)
+        
+    def forward_chunk(self, audio_refs, target_bot):
+        """ارسال گروهی چند فایل موسیقی با یک درخواست برای هر بخش
+        
+        فایل‌ها به بخش‌هایی با حداکثر FORWARD_CHUNK_SIZE پیام از یک کانال مبدا تقسیم
+        شده و هر بخش با یک فراخوانی forward_messages ارسال می‌شود. اگر ارسال یک بخش
+        با خطایی غیر از FloodWait شکست بخورد، پیام‌های آن بخش تک‌به‌تک ارسال می‌شوند
+        تا فقط پیام‌های مشکل‌دار از دست بروند.
+        
+        Returns:
+            list: وضعیت موفقیت (True/False) به ترتیب audio_refs
             
-        # پیام‌های صوتی (voice) را نادیده می‌گیریم
-        if hasattr(message, 'voice') and message.voice:
-            return False
+        Raises:
+            FloodWaitError: اگر زمان FloodWait بیشتر از FORWARD_MAX_INLINE_WAIT باشد
+        """
+        if not self.is_connected:
+            if not self.connect():
+                return [False] * len(audio_refs)
+        
+        return self._run(self._forward_chunk_async(audio_refs, target_bot))
+    
+    def estimated_wait(self, target_bot=None):
+        """زمان تقریبی تا آزاد شدن اولین حساب برای درخواست بعدی (یا ارسال بعدی به target_bot)"""
+        return self.service.pool.estimated_wait(target_bot)
+    
+    async def _forward_messages(self, target_bot, message_ids, from_peer):
+        """ارسال پیام‌ها با یکی از حساب‌های pool
+        
+        اگر حساب انتخاب شده FloodWait بگیرد و حساب دیگری در دسترس باشد، همان
+        پیام‌ها بلافاصله با حساب بعدی ارسال می‌شوند. اگر همه حساب‌ها در FloodWait
+        باشند، FloodWaitError با زمان انتظار اولین حساب آزاد پرتاب می‌شود.
+        هر مقصد کنترل نرخ جداگانه‌ای دارد که داخل کنترل نرخ کل حساب اعمال می‌شود.
+        """
+        pool = self.service.pool
+        excluded = set()
+        flooded = False
+        while True:
+            account = pool.pick(excluded, target_bot)
+            if account is None:
+                if flooded:
+                    raise FloodWaitError(request=None, capture=int(pool.estimated_wait(target_bot)) + 1)
+                # هیچ حسابی چت مبدا را resolve نکرد؛ همان رفتار قبلی با حساب اصلی
+                account, source = pool.primary, from_peer
+            else:
+                try:
+                    source = await account.input_peer(from_peer)
+                except FloodWaitError:
+                    excluded.add(account)
+                    flooded = True
+                    continue
+                if source is None:
+                    excluded.add(account)
+                    continue
             
-        # بررسی سایر فایل‌ها برای ویژگی‌های صوتی
-        if hasattr(message, 'document') and message.document:
-            for attribute in message.document.attributes:
-                if isinstance(attribute, DocumentAttributeAudio):
-                    # فقط اگر voice نباشد آن را به عنوان موسیقی در نظر می‌گیریم
-                    if not getattr(attribute, 'voice', False):
-                        return True
-                    
-        # بررسی media
-        if hasattr(message, 'media'):
-            media = message.media
-            if hasattr(media, 'document'):
-                for attribute in media.document.attributes:
-                    if isinstance(attribute, DocumentAttributeAudio):
-                        # فقط اگر voice نباشد آن را به عنوان موسیقی در نظر می‌گیریم
-                        if not getattr(attribute, 'voice', False):
-                            return True
-                        
-        return False
-        
-    def forward_to_bot(self, message, target_bot):
-        """ارسال یک پیام به ربات دیگر"""
+            has_spare = pool.pick(excluded | {account}, target_bot) is not None
+            try:
+                return await account.call(
+                    lambda client: client.forward_messages(target_bot, message_ids, from_peer=source),
+                    max_flood_wait=0 if has_spare else FORWARD_MAX_INLINE_WAIT,
+                    target=target_bot
+                )
+            except FloodWaitError:
+                if not has_spare:
+                    raise
+                excluded.add(account)
+                flooded = True
+    
+    async def _forward_chunk_async(self, audio_refs, target_bot):
+        """نسخه async ارسال گروهی (روی حلقه مشترک)"""
+        results = []
+        for chunk in _split_forward_chunks(audio_refs, FORWARD_CHUNK_SIZE):
+            message_ids = [ref.message_id for ref in chunk]
+            try:
+                sent = await self._forward_messages(target_bot, message_ids, chunk[0].peer_id)
+                results.extend(message is not None for message in sent)
+            except FloodWaitError:
+                if results:
+                    # بخش‌های قبلی ارسال شده‌اند؛ فقط همان‌ها گزارش می‌شوند و بقیه بعداً ارسال می‌شوند
+                    return results
+                raise
+            except Exception as e:
+                logger.error(f"خطا در ارسال گروهی پیام‌ها به ربات هدف: {e} - ارسال تک‌به‌تک این بخش")
+                for ref in chunk:
+                    try:
+                        await self._forward_messages(target_bot, ref.message_id, ref.peer_id)
+                        results.append(True)
+                    except FloodWaitError:
+                        if results:
+                            return results
+                        raise
+                    except Exception as e:
+                        logger.error(f"خطا در ارسال پیام {ref.message_id} به ربات هدف: {e}")
+                        results.append(False)
+        return results
+    
+    def forward_to_bot(self, audio_ref, target_bot):
+        """ارسال یک فایل موسیقی (AudioRef) به ربات دیگر
+        
+        در صورت FloodWait طولانی‌تر از FORWARD_MAX_INLINE_WAIT، خطای FloodWaitError پرتاب می‌شود.
+        """
         if not self.is_connected:
             if not self.connect():
                 return False
         
         try:
-            async def _forward_message():
-                await self.client.forward_messages(target_bot, message)
-                
-            self.loop.run_until_complete(_forward_message())
+            self._run(self._forward_messages(target_bot, audio_ref.message_id, audio_ref.peer_id))
             return True
+        except FloodWaitError:
+            # محدودیت طولانی: زمان‌بندی مجدد به فراخواننده سپرده می‌شود
+            raise
         except Exception as e:
             logger.error(f"خطا در ارسال پیام به ربات هدف: {e}")
             return False 
\ No newline at end of file
@@ -0,0 +1,169 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from telethon import utils as tg_utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+from utils import logger
+from config import ENTITY_CACHE_PATH, ENTITY_CACHE_TTL
+
+_LINK_RE = re.compile(r"^(?:https?://)?(?:www\.)?(?:t|telegram)\.(?:me|dog)/(.+)$", re.IGNORECASE)
+_RESOLVE_RE = re.compile(r"^tg://resolve\?(?:.*&)?domain=([^&]+)", re.IGNORECASE)
+_USERNAME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_]{3,31}$")
+_NUMERIC_RE = re.compile(r"^-?\d+$")
+
+# نوع input peer -> (نام ذخیره شده, سازنده از شناسه و access_hash)
+_PEER_KINDS = {
+    InputPeerChannel: ("channel", lambda peer_id, access_hash: InputPeerChannel(peer_id, access_hash)),
+    InputPeerChat: ("chat", lambda peer_id, access_hash: InputPeerChat(peer_id)),
+    InputPeerUser: ("user", lambda peer_id, access_hash: InputPeerUser(peer_id, access_hash)),
+}
+_BUILDERS = {kind: build for kind, build in _PEER_KINDS.values()}
+
+
+def normalize_chat_input(chat_id):
+    """کلید یکسان برای شکل‌های مختلف آدرس یک چت؛ None اگر قابل تشخیص نباشد
+
+    مثال‌ها: "@Name"، "name"، "https://t.me/name/12" و "t.me/s/name" همه "@name" می‌شوند؛
+    "https://t.me/c/123/4" به "-100123" و لینک‌های دعوت به "+hash" تبدیل می‌شوند.
+    """
+    if isinstance(chat_id, int):
+        return str(chat_id)
+    text = str(chat_id).strip()
+    if _NUMERIC_RE.match(text):
+        return str(int(text))
+
+    match = _RESOLVE_RE.match(text)
+    if match:
+        text = match.group(1)
+    else:
+        match = _LINK_RE.match(text)
+        if match:
+            parts = match.group(1).split("?", 1)[0].strip("/").split("/")
+            if parts[0] == "s" and len(parts) > 1:
+                parts = parts[1:]
+            if parts[0] == "c" and len(parts) > 1 and parts[1].isdigit():
+                return f"-100{parts[1]}"
+            if parts[0] == "joinchat" and len(parts) > 1:
+                return f"+{parts[1]}"
+            if parts[0].startswith("+"):
+                return parts[0]
+            text = parts[0]
+
+    text = text.lstrip("@")
+    if _USERNAME_RE.match(text):
+        return f"@{text.lower()}"
+    return None
+
+
+class EntityCache:
+    """حافظه دائمی resolve چت‌ها (SQLite)
+
+    ورودی کاربر نرمال‌سازی شده و به input peer (شناسه و access_hash) حساب اصلی
+    نگاشت می‌شود تا resolve نام کاربری، که از محدودترین متدهای تلگرام از نظر
+    FloodWait است، برای هر چت حداکثر یک بار در هر ENTITY_CACHE_TTL انجام شود.
+    درخواست‌های همزمان برای یک چت یک resolve مشترک دارند و اگر تازه‌سازی یک
+    رکورد منقضی شده ناموفق باشد، همان رکورد قبلی استفاده می‌شود.
+    """
+
+    def __init__(self, path=ENTITY_CACHE_PATH, ttl=ENTITY_CACHE_TTL):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending = {}  # (حساب, کلید) -> Future resolve در حال اجرا روی حلقه مشترک
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entities ("
+                " account TEXT NOT NULL, key TEXT NOT NULL, kind TEXT NOT NULL, id INTEGER NOT NULL,"
+                " access_hash INTEGER, peer_id INTEGER NOT NULL, username TEXT, resolved_at REAL NOT NULL,"
+                " PRIMARY KEY (account, key)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entities_peer ON entities (peer_id)")
+
+    def get(self, account, key):
+        """(input peer, آیا هنوز معتبر است) برای کلید نرمال شده؛ None اگر ذخیره نشده باشد"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, id, access_hash, resolved_at FROM entities WHERE account = ? AND key = ?",
+                (account, key)
+            ).fetchone()
+        if row is None:
+            return None
+        kind, peer_id, access_hash, resolved_at = row
+        return _BUILDERS[kind](peer_id, access_hash), time.time() - resolved_at < self.ttl
+
+    def put(self, account, key, entity):
+        """ذخیره نتیجه resolve یک چت (چت‌هایی که input peer قابل ساخت ندارند ذخیره نمی‌شوند)"""
+        try:
+            input_peer = tg_utils.get_input_peer(entity)
+        except TypeError:
+            return
+        kind = _PEER_KINDS.get(type(input_peer))
+        if kind is None:
+            return
+        peer_id = getattr(input_peer, "channel_id", None) or getattr(input_peer, "chat_id", None) \
+            or getattr(input_peer, "user_id", None)
+        username = getattr(entity, "username", None)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (account, key, kind[0], peer_id, getattr(input_peer, "access_hash", None),
+                 tg_utils.get_peer_id(input_peer), username.lower() if username else None, time.time())
+            )
+
+    def username_for(self, peer_id):
+        """نام کاربری ذخیره شده برای یک چت (شناسه marked)؛ برای resolve آن در حساب‌های دیگر"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT username FROM entities WHERE peer_id = ? AND username IS NOT NULL LIMIT 1", (peer_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    async def resolve(self, account, chat_id, fetch):
+        """input peer چت از حافظه، یا با فراخوانی fetch() و ذخیره نتیجه
+
+        Args:
+            account: نام حسابی که access_hash برای آن معتبر است
+            chat_id: ورودی کاربر (نام کاربری، لینک یا شناسه)
+            fetch: تابعی بدون ورودی که coroutine resolve واقعی را می‌سازد
+        """
+        key = normalize_chat_input(chat_id)
+        if key is None:
+            return await fetch()
+
+        cached = self.get(account, key)
+        if cached is not None and cached[1]:
+            return cached[0]
+
+        pending = self._pending.get((account, key))
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = self._pending[(account, key)] = asyncio.get_event_loop().create_future()
+        try:
+            try:
+                entity = await fetch()
+            except Exception as e:
+                if cached is None:
+                    raise
+                logger.warning(f"تازه‌سازی اطلاعات {key} ناموفق بود ({e}) - استفاده از اطلاعات ذخیره شده قبلی")
+                entity = cached[0]
+            else:
+                self.put(account, key, entity)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # جلوگیری از هشدار خطای بازیابی نشده در نبود منتظر
+            raise
+        finally:
+            self._pending.pop((account, key), None)
+        future.set_result(entity)
+        return entity
+
+
+# حافظه مشترک resolve چت‌ها (غیرفعال اگر ENTITY_CACHE_PATH خالی باشد)
+entity_cache = EntityCache() if ENTITY_CACHE_PATH else None
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+import uuid
+from models import AudioRef
+from utils import logger
+from config import FORWARD_JOURNAL_PATH, FORWARD_JOURNAL_SYNC_INTERVAL, FORWARD_JOURNAL_COMPACT_SIZE
+
+
+class ForwardJournal:
+    """دفترچه افزایشی (append-only) ارسال فایل‌ها روی دیسک
+
+    برای هر کار ارسال (کاربر، کانال، مقصد، دسته) یک رکورد شروع با فهرست کامل
+    فایل‌ها ثبت می‌شود و پس از ارسال هر بخش، شناسه پیام‌های ارسال شده اضافه
+    می‌شود. نوشتن‌ها با group commit روی دیسک fsync می‌شوند: چند نوشتن همزمان
+    با یک fsync مشترک پایدار می‌شوند تا هزینه کم بماند. پس از راه‌اندازی مجدد،
+    کارهای ناتمام از همین دفترچه و بدون اسکن مجدد ادامه داده می‌شوند.
+
+    وضعیت کارهای ناتمام در حافظه هم نگه‌داری می‌شود تا دفترچه پس از پایان هر
+    کار، اگر دیگر کار ناتمامی نمانده یا حجمش از compact_size گذشته باشد، فقط با
+    فایل‌های باقیمانده کارهای ناتمام بازنویسی شود و بی‌نهایت رشد نکند.
+    """
+
+    def __init__(self, path=FORWARD_JOURNAL_PATH, sync_interval=FORWARD_JOURNAL_SYNC_INTERVAL,
+                 compact_size=FORWARD_JOURNAL_COMPACT_SIZE):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_size = compact_size
+        self._cond = threading.Condition()
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._thread = None
+        self._unfinished = self._load()
+        self._compact()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        """بازخوانی دفترچه و استخراج کارهای ناتمام"""
+        jobs = {}
+        if not os.path.exists(self.path):
+            return jobs
+
+        with open(self.path, encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # خط ناقص انتهای فایل پس از قطع ناگهانی
+                    continue
+                kind = record.get("type")
+                if kind == "start":
+                    record["sent"] = set(record.get("sent", []))
+                    jobs[record["job"]] = record
+                elif kind == "sent" and record["job"] in jobs:
+                    jobs[record["job"]]["sent"].update(record["ids"])
+                elif kind == "end":
+                    jobs.pop(record["job"], None)
+        return jobs
+
+    def _compact(self):
+        """بازنویسی دفترچه فقط با کارهای ناتمام (فایل‌های ارسال شده حذف می‌شوند)
+
+        در زمان اجرا فقط با در اختیار داشتن _cond و پس از پایدار شدن همه نوشتن‌ها فراخوانی می‌شود.
+        """
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as temp_file:
+            for job in self._unfinished.values():
+                remaining = [ref for ref in job["refs"] if ref[0] not in job["sent"]]
+                record = dict(job, refs=remaining, sent=[])
+                temp_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                job["refs"], job["sent"] = remaining, set()
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, self.path)
+
+    def _compact_running(self):
+        """فشرده‌سازی دفترچه در حین اجرا (با در اختیار داشتن _cond)"""
+        # پیش از بستن فایل، همه نوشتن‌ها پایدار شده باشند تا thread همگام‌سازی به فایل بسته شده دست نزند
+        while self._synced_seq < self._written_seq:
+            self._cond.wait()
+        self._file.close()
+        try:
+            self._compact()
+        except OSError as e:
+            logger.error(f"خطا در فشرده‌سازی دفترچه ارسال: {e}")
+        finally:
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def _append(self, record):
+        """افزودن یک رکورد و انتظار تا پایدار شدن آن روی دیسک (group commit)"""
+        with self._cond:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._written_seq += 1
+            seq = self._written_seq
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sync_loop, name="forward-journal", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            while self._synced_seq < seq:
+                self._cond.wait()
+
+    def _sync_loop(self):
+        while True:
+            with self._cond:
+                while self._synced_seq >= self._written_seq:
+                    self._cond.wait()
+            # کمی صبر برای جمع شدن نوشتن‌های همزمان دیگر
+            time.sleep(self.sync_interval)
+            with self._cond:
+                target = self._written_seq
+                self._file.flush()
+            os.fsync(self._file.fileno())
+            with self._cond:
+                self._synced_seq = max(self._synced_seq, target)
+                self._cond.notify_all()
+
+    def start(self, user_id, channel, target, batch_index, audio_refs):
+        """ثبت شروع یک کار ارسال و بازگرداندن شناسه آن"""
+        job_key = uuid.uuid4().hex
+        record = {
+            "type": "start",
+            "job": job_key,
+            "user_id": user_id,
+            "channel": channel,
+            "target": target,
+            "batch_index": batch_index,
+            "created_at": time.time(),
+            "refs": [ref.as_tuple() for ref in audio_refs],
+        }
+        self._append(record)
+        with self._cond:
+            self._unfinished[job_key] = dict(record, sent=set())
+        return job_key
+
+    def record_sent(self, job_key, message_ids):
+        """ثبت پایدار پیام‌هایی که ارسال (یا برای همیشه رد) شده‌اند"""
+        if message_ids:
+            self._append({"type": "sent", "job": job_key, "ids": list(message_ids)})
+            with self._cond:
+                job = self._unfinished.get(job_key)
+                if job is not None:
+                    job["sent"].update(message_ids)
+
+    def finish(self, job_key):
+        """ثبت پایان (یا لغو) یک کار ارسال و فشرده‌سازی دفترچه در صورت نیاز"""
+        self._append({"type": "end", "job": job_key})
+        with self._cond:
+            self._unfinished.pop(job_key, None)
+            if not self._unfinished or os.fstat(self._file.fileno()).st_size >= self.compact_size:
+                self._compact_running()
+
+    def unfinished_jobs(self):
+        """کارهای ناتمام (از اجرای قبلی) به همراه فایل‌های باقیمانده (AudioRef)"""
+        with self._cond:
+            return [
+                dict(job, refs=[AudioRef(*ref) for ref in job["refs"] if ref[0] not in job["sent"]])
+                for job in self._unfinished.values()
+            ]
+
+
+# دفترچه مشترک ارسال برای کل فرآیند (غیرفعال اگر FORWARD_JOURNAL_PATH خالی باشد)
+forward_journal = ForwardJournal() if FORWARD_JOURNAL_PATH else None
@@ -0,0 +1,102 @@
+import hashlib
+import math
+import sqlite3
+import threading
+from utils import logger
+from config import FORWARD_LEDGER_PATH, FORWARD_LEDGER_CAPACITY, FORWARD_LEDGER_ERROR_RATE
+
+
+class BloomFilter:
+    """فیلتر Bloom با حافظه ثابت برای بررسی سریع عضویت شناسه‌های عددی"""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.to_bytes(8, "little", signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class ForwardLedger:
+    """دفتر دائمی فایل‌هایی که قبلاً به هر مقصد ارسال شده‌اند
+
+    برای هر مقصد، یک فیلتر Bloom در حافظه جلوی مجموعه دقیق ذخیره شده در
+    SQLite قرار دارد: اکثر فایل‌های جدید بدون مراجعه به دیسک و در O(1) رد
+    می‌شوند و فقط پاسخ‌های مثبت فیلتر با جدول دقیق تأیید می‌شوند. حافظه
+    هر مقصد با FORWARD_LEDGER_CAPACITY و FORWARD_LEDGER_ERROR_RATE محدود است.
+    """
+
+    def __init__(self, path=FORWARD_LEDGER_PATH, capacity=FORWARD_LEDGER_CAPACITY,
+                 error_rate=FORWARD_LEDGER_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._filters = {}
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS forwarded ("
+                " target TEXT NOT NULL, document_id INTEGER NOT NULL,"
+                " PRIMARY KEY (target, document_id)) WITHOUT ROWID"
+            )
+
+    def _filter(self, target):
+        """فیلتر Bloom یک مقصد؛ در اولین استفاده از روی جدول دقیق ساخته می‌شود"""
+        bloom = self._filters.get(target)
+        if bloom is None:
+            bloom = BloomFilter(self.capacity, self.error_rate)
+            count = 0
+            for (document_id,) in self._conn.execute(
+                "SELECT document_id FROM forwarded WHERE target = ?", (target,)
+            ):
+                bloom.add(document_id)
+                count += 1
+            if count:
+                logger.info(f"بارگذاری {count} فایل ارسال شده قبلی برای مقصد {target}")
+            self._filters[target] = bloom
+        return bloom
+
+    def contains(self, target, document_id):
+        """آیا این فایل قبلاً به مقصد ارسال شده است؟"""
+        with self._lock:
+            if document_id not in self._filter(target):
+                return False
+            return self._conn.execute(
+                "SELECT 1 FROM forwarded WHERE target = ? AND document_id = ?",
+                (target, document_id)
+            ).fetchone() is not None
+
+    def filter_new(self, target, audio_refs):
+        """جدا کردن فایل‌هایی که هنوز به مقصد ارسال نشده‌اند؛ (فایل‌های جدید, تعداد تکراری)"""
+        new_refs = [ref for ref in audio_refs if not self.contains(target, ref.document_id)]
+        return new_refs, len(audio_refs) - len(new_refs)
+
+    def add(self, target, document_ids):
+        """ثبت فایل‌های ارسال شده به مقصد"""
+        document_ids = [document_id for document_id in document_ids if document_id]
+        if not document_ids:
+            return
+        with self._lock, self._conn:
+            bloom = self._filter(target)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO forwarded VALUES (?, ?)",
+                [(target, document_id) for document_id in document_ids]
+            )
+            for document_id in document_ids:
+                bloom.add(document_id)
+
+
+# دفتر مشترک ارسال‌ها برای کل فرآیند (غیرفعال اگر FORWARD_LEDGER_PATH خالی باشد)
+forward_ledger = ForwardLedger() if FORWARD_LEDGER_PATH else None
@@ -0,0 +1,220 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils import logger
+from config import FORWARD_WORKERS, FORWARD_USER_WEIGHTS
+import metrics
+
+
+class ForwardPipeline:
+    """یک خط لوله ارسال (مثلاً ارسال یک دسته به یک مقصد) در صف یک کاربر"""
+
+    __slots__ = ("user_id", "key", "step", "ready_at", "running", "cancelled", "thread")
+
+    def __init__(self, user_id, key, step, ready_at):
+        self.user_id = user_id
+        self.key = key
+        self.step = step
+        self.ready_at = ready_at
+        self.running = False
+        self.cancelled = False
+        self.thread = None  # شناسه thread اجرا کننده مرحله فعلی
+
+
+class _UserQueue:
+    """صف خط لوله‌های ارسال یک کاربر"""
+
+    __slots__ = ("weight", "pipelines", "paused", "credit")
+
+    def __init__(self, weight):
+        self.weight = weight
+        self.pipelines = collections.OrderedDict()  # کلید -> ForwardPipeline
+        self.paused = False
+        self.credit = 0
+
+
+class ForwardScheduler:
+    """زمان‌بند مشترک و منصفانه ارسال فایل‌ها برای همه کاربران
+
+    هر کاربر صف خودش را دارد و هر خط لوله در صف، با هر بار اجرای step یک
+    بخش از فایل‌ها را ارسال کرده و زمان انتظار تا مرحله بعد (یا None برای
+    پایان) را برمی‌گرداند. کاربران به صورت نوبتی وزن‌دار (weighted round-robin)
+    انتخاب می‌شوند: هر کاربر در نوبت خود حداکثر به اندازه وزنش مرحله آماده
+    اجرا می‌کند و حداکثر `workers` مرحله در کل ربات همزمان اجرا می‌شوند.
+    خط لوله‌ای که منتظر FloodWait است جایی در صف اشغال نمی‌کند، پس محدودیت
+    یک کاربر یا مقصد ارسال بقیه را متوقف نمی‌کند. توقف، ادامه و لغو عملیات
+    روی همین صف‌ها هستند؛ لغو یا جایگزینی یک خط لوله تا پایان مرحله در حال
+    اجرای آن صبر می‌کند تا دو مرحله از یک مقصد هیچ‌گاه همزمان اجرا نشوند.
+    """
+
+    def __init__(self, workers=FORWARD_WORKERS, weights=FORWARD_USER_WEIGHTS):
+        self.workers = workers
+        self.weights = dict(weights)
+        self._users = collections.OrderedDict()  # شناسه کاربر -> _UserQueue (به ترتیب نوبت)
+        self._running = 0
+        self._cond = threading.Condition()
+        self._executor = None
+        self._thread = None
+
+    @property
+    def running_count(self):
+        return self._running
+
+    @property
+    def queued_count(self):
+        with self._cond:
+            return sum(
+                1 for queue in self._users.values() for pipeline in queue.pipelines.values() if not pipeline.running
+            )
+
+    def submit(self, user_id, key, step, delay=0):
+        """افزودن (یا جایگزینی) خط لوله key در صف کاربر
+
+        Args:
+            user_id: شناسه کاربر صاحب خط لوله
+            key: کلید خط لوله در صف کاربر (مثلاً مقصد ارسال)؛ خط لوله قبلی با همین کلید لغو می‌شود
+            step: تابع بدون ورودی که یک مرحله را اجرا کرده و تاخیر تا مرحله بعد یا None را برمی‌گرداند
+            delay: تاخیر تا اجرای اولین مرحله (ثانیه)
+        """
+        with self._cond:
+            queue = self._users.get(user_id)
+            previous = queue.pipelines.pop(key, None) if queue is not None else None
+            if previous is not None:
+                previous.cancelled = True
+                self._wait_finished([previous])
+            queue = self._users.get(user_id)
+            if queue is None:
+                queue = self._users[user_id] = _UserQueue(self.weights.get(user_id, 1))
+            pipeline = queue.pipelines[key] = ForwardPipeline(user_id, key, step, time.monotonic() + delay)
+            self._ensure_started()
+            self._cond.notify_all()
+        return pipeline
+
+    def pause(self, user_id):
+        """توقف اجرای مراحل جدید برای کاربر
+
+        تا پایان مراحل در حال اجرای کاربر صبر می‌کند، تا پس از بازگشت هیچ مرحله‌ای
+        (و هیچ به‌روزرسانی پیشرفتی از آن) در جریان نباشد.
+        """
+        with self._cond:
+            queue = self._users.get(user_id)
+            if queue is None:
+                return False
+            queue.paused = True
+            self._wait_finished(list(queue.pipelines.values()))
+            return True
+
+    def resume(self, user_id):
+        """ادامه اجرای خط لوله‌های متوقف شده کاربر"""
+        with self._cond:
+            queue = self._users.get(user_id)
+            if queue is None:
+                return False
+            queue.paused = False
+            self._cond.notify_all()
+            return True
+
+    def is_paused(self, user_id):
+        with self._cond:
+            queue = self._users.get(user_id)
+            return queue is not None and queue.paused
+
+    def cancel(self, user_id, key=None):
+        """حذف یک خط لوله (یا همه خط لوله‌های کاربر اگر key تعیین نشود) از صف
+
+        تا پایان مرحله در حال اجرای خط لوله‌های لغو شده صبر می‌کند.
+        """
+        with self._cond:
+            queue = self._users.get(user_id)
+            if queue is None:
+                return
+            keys = list(queue.pipelines) if key is None else [key]
+            cancelled = []
+            for pipeline_key in keys:
+                pipeline = queue.pipelines.pop(pipeline_key, None)
+                if pipeline is not None:
+                    pipeline.cancelled = True
+                    cancelled.append(pipeline)
+            if key is None or not queue.pipelines:
+                del self._users[user_id]
+            self._wait_finished(cancelled)
+
+    def _wait_finished(self, pipelines):
+        """انتظار (با قفل گرفته شده) تا پایان مرحله در حال اجرای خط لوله‌ها
+
+        مرحله‌ای که خودش خط لوله‌اش را لغو می‌کند منتظر خودش نمی‌ماند.
+        """
+        current = threading.get_ident()
+        while any(pipeline.running and pipeline.thread != current for pipeline in pipelines):
+            self._cond.wait()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="forward")
+            self._thread = threading.Thread(target=self._dispatch_loop, name="forward-scheduler", daemon=True)
+            self._thread.start()
+
+    def _next_pipeline(self, now):
+        """انتخاب مرحله بعدی با نوبت‌دهی وزن‌دار؛ (خط لوله یا None, زمان انتظار تا اولین مرحله آماده)"""
+        wait = None
+        for _ in range(len(self._users)):
+            user_id, queue = next(iter(self._users.items()))
+            if not queue.paused:
+                waiting = [pipeline for pipeline in queue.pipelines.values() if not pipeline.running]
+                if waiting:
+                    pipeline = min(waiting, key=lambda candidate: candidate.ready_at)
+                    if pipeline.ready_at <= now:
+                        if queue.credit <= 0:
+                            queue.credit = queue.weight
+                        queue.credit -= 1
+                        if queue.credit <= 0:
+                            self._users.move_to_end(user_id)
+                        return pipeline, None
+                    delay = pipeline.ready_at - now
+                    wait = delay if wait is None else min(wait, delay)
+            # این کاربر مرحله آماده‌ای ندارد؛ نوبت به کاربر بعدی می‌رسد
+            queue.credit = 0
+            self._users.move_to_end(user_id)
+        return None, wait
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    wait = None
+                    if self._running < self.workers:
+                        pipeline, wait = self._next_pipeline(time.monotonic())
+                        if pipeline is not None:
+                            break
+                    self._cond.wait(wait)
+                pipeline.running = True
+                self._running += 1
+            self._executor.submit(self._run, pipeline)
+
+    def _run(self, pipeline):
+        pipeline.thread = threading.get_ident()
+        delay = None
+        try:
+            delay = pipeline.step()
+        except Exception as e:
+            logger.error(f"خطا در خط لوله ارسال {pipeline.key} برای کاربر {pipeline.user_id}: {e}")
+        finally:
+            with self._cond:
+                self._running -= 1
+                pipeline.running = False
+                queue = self._users.get(pipeline.user_id)
+                if delay is None or pipeline.cancelled:
+                    if queue is not None and queue.pipelines.get(pipeline.key) is pipeline:
+                        del queue.pipelines[pipeline.key]
+                        if not queue.pipelines:
+                            del self._users[pipeline.user_id]
+                else:
+                    pipeline.ready_at = time.monotonic() + delay
+                self._cond.notify_all()
+
+
+# زمان‌بند مشترک ارسال برای کل فرآیند
+forward_scheduler = ForwardScheduler()
+metrics.active_forwards.set_function(lambda: forward_scheduler.running_count)
+metrics.queued_forwards.set_function(lambda: forward_scheduler.queued_count)
@@ -1,14 +1,125 @@
 import logging
 from telegram import Update, ParseMode
 from telegram.ext import CallbackContext
+from telegram.utils.helpers import escape_markdown
 from downloader import MusicDownloader
+from dedup import AudioDeduplicator
+from jobs import scan_jobs, ScanJob, JobQueueFull
+from progress import progress_editor
+from forward_journal import forward_journal
+from forward_ledger import forward_ledger
+from forward_scheduler import forward_scheduler
+import metrics
+from scan_timing import ScanTimings
+from session_store import SessionStore
+from models import AudioRef
+from batch_store import BatchView
 from utils import split_into_batches, format_batch_info, format_progress_message
 from keyboard import start_keyboard, create_batch_keyboard, create_cancel_keyboard, create_forward_control_keyboard, create_continue_fetching_keyboard
-from config import TARGET_BOT, BATCH_SIZE
+from config import TARGET_BOTS, BATCH_SIZE, FORWARD_CHUNK_SIZE, SESSION_SWEEP_INTERVAL
+from utils import logger
+from telethon.errors import FloodWaitError
+import sys
 import time
 
-# ذخیره داده‌های کاربران
-user_data_store = {}
+def _dump_session(user_data):
+    """وضعیت فشرده جلسه برای ذخیره روی دیسک (فقط اطلاعات لازم برای ادامه کار با دسته‌ها)"""
+    if not user_data.get("music_files"):
+        return None
+    return {
+        "channel": user_data["channel"],
+        "refs": [ref.as_tuple() for ref in user_data["music_files"]],
+        "batch_size": user_data["batches"].batch_size,
+        "current_batch": user_data.get("current_batch", 0),
+        "batch_page": user_data.get("batch_page", 0),
+        "last_offset_id": user_data["last_offset_id"],
+        "has_more_messages": user_data["has_more_messages"],
+        "max_messages": user_data["max_messages"],
+        "batch_fetch_size": user_data["batch_fetch_size"],
+        "duplicates_dropped": user_data["deduplicator"].dropped,
+    }
+
+def _load_session(user_id, state):
+    """بازسازی جلسه از وضعیت ذخیره شده روی دیسک"""
+    refs = [AudioRef(*ref) for ref in state["refs"]]
+    deduplicator = AudioDeduplicator()
+    deduplicator.filter(refs)
+    deduplicator.dropped = state["duplicates_dropped"]
+    batches = split_into_batches(refs, state["batch_size"])
+    downloader = MusicDownloader()
+    downloader.connect()
+    return {
+        "downloader": downloader,
+        "channel": state["channel"],
+        "music_files": batches.items,
+        "batches": batches,
+        "current_batch": state["current_batch"],
+        "batch_page": state["batch_page"],
+        "forwards": {},
+        "is_forwarding": False,
+        "last_offset_id": state["last_offset_id"],
+        "has_more_messages": state["has_more_messages"],
+        "max_messages": state["max_messages"],
+        "batch_fetch_size": state["batch_fetch_size"],
+        "deduplicator": deduplicator,
+    }
+
+def _release_session(user_data):
+    """آزادسازی منابع جلسه‌ای که از حافظه خارج می‌شود"""
+    _cancel_scan_job(user_data)
+    if "downloader" in user_data:
+        user_data["downloader"].disconnect()
+
+def _close_session(user_id, user_data):
+    """پایان کامل جلسه کاربر: لغو اسکن و خط لوله‌های ارسال، ثبت پایان کارهای دفترچه و آزادسازی منابع"""
+    forward_scheduler.cancel(user_id)
+    _finish_forward_journal(user_data)
+    _release_session(user_data)
+
+def _session_is_busy(user_data):
+    """جلسه‌ای که اسکن یا ارسال فعال دارد از حافظه خارج نمی‌شود"""
+    scan_job = user_data.get("scan_job")
+    return user_data.get("is_forwarding") or (scan_job is not None and scan_job.is_active)
+
+def _measure_refs(refs):
+    """حجم تقریبی یک فهرست AudioRef (بایت)؛ هزینه هر فایل از روی نمونه‌ای از فایل‌ها تخمین زده می‌شود"""
+    sample = refs[:100]
+    per_ref = sum(
+        sys.getsizeof(ref) + sum(sys.getsizeof(getattr(ref, slot)) for slot in AudioRef.__slots__)
+        for ref in sample
+    ) / len(sample) if sample else 0
+    return sys.getsizeof(refs) + int(per_ref * len(refs))
+
+def _measure_session(user_data):
+    """حجم تقریبی حافظه یک جلسه (بایت): فایل‌ها، نماهای دسته، فهرست فایل‌های ارسال و کلیدهای حذف تکراری"""
+    refs = user_data.get("music_files") or []
+    size = sys.getsizeof(user_data) + _measure_refs(refs)
+    if user_data.get("batches") is not None:
+        size += sys.getsizeof(user_data["batches"])
+    for state in user_data.get("forwards", {}).values():
+        size += sys.getsizeof(state)
+        forward_refs = state["refs"]
+        if isinstance(forward_refs, BatchView):
+            # نمای دسته روی همان فهرست فایل‌های جلسه است که بالاتر شمرده شده‌اند
+            size += sys.getsizeof(forward_refs)
+        else:
+            size += _measure_refs(forward_refs)
+    if user_data.get("deduplicator") is not None:
+        size += user_data["deduplicator"].memory_usage()
+    return size
+
+# ذخیره داده‌های کاربران (با خروج جلسه‌های بیکار از حافظه و بارگذاری مجدد از دیسک)
+user_data_store = SessionStore(
+    dump=_dump_session,
+    load=_load_session,
+    release=_release_session,
+    is_busy=_session_is_busy,
+    measure=_measure_session
+)
+
+def schedule_session_sweep(job_queue):
+    """بررسی دوره‌ای جلسه‌ها برای خروج جلسه‌های بیکار و رعایت سقف حافظه"""
+    job_queue.run_repeating(lambda _: user_data_store.sweep(), SESSION_SWEEP_INTERVAL, first=SESSION_SWEEP_INTERVAL)
 
 def start_handler(update: Update, context: CallbackContext):
     """دستور شروع"""
@@ -44,8 +155,9 @@ def status_handler(update: Update, context: CallbackContext):
     
     if user_id in user_data_store:
         user_data = user_data_store[user_id]
-        total_files = len(user_data.get("music_files", []))
-        total_batches = len(user_data.get("batches", []))
+        batches = user_data.get("batches")
+        total_files = batches.file_count if batches is not None else 0
+        total_batches = len(batches) if batches is not None else 0
         current_batch = user_data.get("current_batch", 0)
         
         status_message = (
@@ -55,6 +167,20 @@ def status_handler(update: Update, context: CallbackContext):
             f"📌 دسته فعلی: {current_batch}/{total_batches}\n"
         )
         
+        scan_job = user_data.get("scan_job")
+        if scan_job is not None and scan_job.status == ScanJob.RUNNING:
+            status_message += "🔄 اسکن: در حال اجرا\n"
+        elif scan_job is not None and scan_job.status == ScanJob.QUEUED:
+            status_message += f"⏳ اسکن: در صف (جایگاه {scan_jobs.queue_position(scan_job)})\n"
+        
+        if user_data.get("forwards"):
+            status_message += "📤 ارسال:\n" + _format_forward_progress(user_data, markdown=True) + "\n"
+        
+        status_message += f"💾 حافظه جلسه: {user_data_store.memory_usage(user_id) // 1024} KB\n"
+        
+        if user_data.get("scan_timings") is not None:
+            status_message += "\n" + user_data["scan_timings"].format_summary()
+        
         update.message.reply_text(status_message, parse_mode=ParseMode.MARKDOWN)
     else:
         update.message.reply_text("هنوز هیچ داده‌ای وجود ندارد. لطفاً ابتدا یک کانال یا گروه را اسکن کنید.")
@@ -72,6 +198,14 @@ def request_channel_handler(update: Update, context: CallbackContext):
     
     context.user_data["waiting_for_channel"] = True
 
+def _store_scan_page(user_data):
+    """ساخت کال‌بکی که نتایج هر صفحه از اسکن را مستقیماً در داده‌های کاربر ذخیره می‌کند"""
+    def on_page(page):
+        # فایل‌های جدید دسته ناقص آخر را پر کرده و دسته‌های جدید باز می‌کنند (بدون دسته‌بندی مجدد)
+        user_data["batches"].extend(page.audio_files)
+        user_data["last_offset_id"] = page.offset_id
+    return on_page
+
 def process_channel_input(update: Update, context: CallbackContext):
     """پردازش آدرس کانال یا گروه ورودی"""
     user_id = update.effective_user.id
@@ -99,7 +233,6 @@ def process_channel_input(update: Update, context: CallbackContext):
     # ذخیره وضعیت پردازش
     context.user_data["processing_status"] = {
         "message_id": status_message.message_id,
-        "last_update": time.time(),
         "processed": 0,
         "total": 0
     }
@@ -109,25 +242,18 @@ def process_channel_input(update: Update, context: CallbackContext):
     downloader.connect()
     
     def update_progress(total, processed):
-        """به‌روزرسانی پیشرفت دانلود"""
-        now = time.time()
+        """به‌روزرسانی پیشرفت دانلود (ویرایش پیام به سرویس مرکزی سپرده می‌شود)"""
         status_data = context.user_data.get("processing_status", {})
-        last_update = status_data.get("last_update", 0)
+        status_data["processed"] = processed
+        status_data["total"] = total
         
-        # به‌روزرسانی پیام حداکثر هر 5 ثانیه یکبار (برای جلوگیری از فلاد)
-        if now - last_update >= 5:
-            progress_text = format_progress_message(total, processed)
-            try:
-                context.bot.edit_message_text(
-                    chat_id=user_id,
-                    message_id=status_message.message_id,
-                    text=f"در حال پردازش کانال...\n\n{progress_text}\n\nلطفاً صبر کنید. این فرآیند ممکن است چند دقیقه طول بکشد."
-                )
-                status_data["last_update"] = now
-                status_data["processed"] = processed
-                status_data["total"] = total
-            except Exception as e:
-                logger.error(f"خطا در به‌روزرسانی پیشرفت: {e}")
+        progress_text = format_progress_message(total, processed)
+        progress_editor.update(
+            context.bot,
+            user_id,
+            status_message.message_id,
+            f"در حال پردازش کانال...\n\n{progress_text}\n\nلطفاً صبر کنید. این فرآیند ممکن است چند دقیقه طول بکشد."
+        )
     
     # تعیین تعداد پیام‌های قابل پردازش در هر مرحله
     batch_fetch_size = 5000  # تعداد پیام‌هایی که در هر مرحله پردازش می‌شوند
@@ -138,42 +264,117 @@ def process_channel_input(update: Update, context: CallbackContext):
     else:
         effective_max_messages = max_messages
     
-    # دریافت فایل‌های موسیقی
-    music_files, last_offset_id, has_more_messages = downloader.get_music_files(
-        channel_input, 
-        update_progress, 
-        effective_max_messages
-    )
+    # ذخیره اطلاعات در کانتکست کاربر؛ فایل‌ها به صورت تدریجی و در حین اسکن اضافه می‌شوند
+    # (به صورت AudioRef فشرده و نه شیء کامل Message تلگرام)
+    batches = split_into_batches([], BATCH_SIZE)
+    user_data = {
+        "downloader": downloader,
+        "channel": channel_input,
+        "music_files": batches.items,
+        "batches": batches,
+        "current_batch": 0,
+        "is_forwarding": False,
+        "last_offset_id": 0,
+        "has_more_messages": False,
+        "max_messages": max_messages,  # محدودیت کلی تعیین شده توسط کاربر
+        "batch_fetch_size": batch_fetch_size,  # تعداد پیام‌هایی که در هر مرحله پردازش می‌شوند
+        "deduplicator": AudioDeduplicator(),  # حذف فایل‌های تکراری در تمام مراحل دریافت
+        "scan_timings": ScanTimings()  # زمان‌سنجی مراحل آخرین اسکن
+    }
+    # جلسه قبلی (اسکن، ارسال‌های در جریان و کارهای دفترچه آن) پیش از جایگزینی به طور کامل بسته می‌شود
+    previous = user_data_store.pop(user_id, None)
+    if previous is not None:
+        _close_session(user_id, previous)
+    context.user_data["waiting_for_channel"] = False
     
-    if not music_files:
+    def register_session(job):
+        # جلسه جدید همراه با کار اسکن فعالش ثبت می‌شود تا بررسی دوره‌ای حافظه آن را بیکار نبیند
+        user_data["scan_job"] = job
+        user_data_store[user_id] = user_data
+    
+    # اسکن به صورت کار پس‌زمینه اجرا می‌شود تا thread دیسپچر آزاد بماند
+    try:
+        job = scan_jobs.submit(
+            user_id,
+            lambda: downloader.collect_music_files(
+                channel_input,
+                update_progress,
+                effective_max_messages,
+                page_callback=_store_scan_page(user_data),
+                deduplicator=user_data["deduplicator"],
+                timings=user_data["scan_timings"]
+            ),
+            on_done=lambda job: _finish_channel_scan(context, user_id, status_message.message_id, job),
+            description=channel_input,
+            on_created=register_session
+        )
+    except JobQueueFull:
+        user_data_store.pop(user_id, None)
         context.bot.edit_message_text(
             chat_id=user_id,
             message_id=status_message.message_id,
-            text="❌ هیچ فایل موسیقی در این کانال یا گروه یافت نشد یا دسترسی به آن امکان‌پذیر نیست."
+            text="⚠️ صف اسکن در حال حاضر پر است. لطفاً چند دقیقه دیگر دوباره تلاش کنید."
         )
-        downloader.disconnect()
         return
     
-    # دسته‌بندی فایل‌ها
-    batches = split_into_batches(music_files, BATCH_SIZE)
+    position = scan_jobs.queue_position(job)
+    if position:
+        context.bot.edit_message_text(
+            chat_id=user_id,
+            message_id=status_message.message_id,
+            text=f"⏳ درخواست شما در صف اسکن قرار گرفت (جایگاه {position}). پس از آزاد شدن ظرفیت، پردازش آغاز می‌شود."
+        )
+
+def _track_scan_job(user_data):
+    """کال‌بک on_created برای ذخیره کار اسکن پیش از شروع آن (تا _scan_result کار را بشناسد)"""
+    def on_created(job):
+        user_data["scan_job"] = job
+    return on_created
+
+def _cancel_scan_job(user_data):
+    """لغو کار اسکن در حال اجرا یا در صف کاربر (در صورت وجود)"""
+    if user_data and user_data.get("scan_job") is not None:
+        user_data["scan_job"].cancel()
+
+def _scan_result(user_data, job):
+    """نتیجه یک کار اسکن پایان یافته؛ None اگر کار لغو یا با کار جدیدتری جایگزین شده باشد"""
+    if user_data is None or user_data.get("scan_job") is not job:
+        return None
+    if user_data.get("scan_timings") is not None:
+        user_data["scan_timings"].dump_trace(f"{job.user_id}_{job.job_id}")
+    if job.status == ScanJob.DONE:
+        return job.result
+    return [], user_data["last_offset_id"], user_data["has_more_messages"]
+
+def _finish_channel_scan(context: CallbackContext, user_id: int, status_message_id: int, job):
+    """نمایش نتیجه اسکن اولیه کانال پس از پایان کار پس‌زمینه"""
+    user_data = user_data_store.get(user_id)
+    result = _scan_result(user_data, job)
+    if result is None:
+        return
+    _, last_offset_id, has_more_messages = result
+    progress_editor.discard(user_id, status_message_id)
+    music_files = user_data["music_files"]
     
-    # ذخیره اطلاعات در کانتکست کاربر
-    user_data_store[user_id] = {
-        "downloader": downloader,
-        "channel": channel_input,
-        "music_files": music_files,
-        "batches": batches,
-        "current_batch": 0,
-        "is_forwarding": False,
-        "is_paused": False,
+    if not music_files:
+        context.bot.edit_message_text(
+            chat_id=user_id,
+            message_id=status_message_id,
+            text="❌ هیچ فایل موسیقی در این کانال یا گروه یافت نشد یا دسترسی به آن امکان‌پذیر نیست."
+        )
+        user_data["downloader"].disconnect()
+        user_data_store.pop(user_id, None)
+        return
+    
+    # دسته‌ها در حین اسکن به صورت افزایشی ساخته شده‌اند
+    batches = user_data["batches"]
+    user_data.update({
         "last_offset_id": last_offset_id,
-        "has_more_messages": has_more_messages,
-        "max_messages": max_messages,  # محدودیت کلی تعیین شده توسط کاربر
-        "batch_fetch_size": batch_fetch_size  # تعداد پیام‌هایی که در هر مرحله پردازش می‌شوند
-    }
+        "has_more_messages": has_more_messages
+    })
     
     # نمایش متن و کیبورد مناسب با توجه به وجود یا عدم وجود پیام‌های بیشتر
-    batch_info = format_batch_info(batches)
+    batch_info = format_batch_info(batches, user_data["deduplicator"].dropped)
     if has_more_messages:
         message_text = (
             f"✅ پردازش بخش اول کانال با موفقیت انجام شد!\n\n"
@@ -184,7 +385,7 @@ def process_channel_input(update: Update, context: CallbackContext):
         )
         context.bot.edit_message_text(
             chat_id=user_id,
-            message_id=status_message.message_id,
+            message_id=status_message_id,
             text=message_text,
             reply_markup=create_continue_fetching_keyboard()
         )
@@ -192,12 +393,69 @@ def process_channel_input(update: Update, context: CallbackContext):
         message_text = f"✅ پردازش کانال با موفقیت انجام شد!\n\n{batch_info}"
         context.bot.edit_message_text(
             chat_id=user_id,
-            message_id=status_message.message_id,
+            message_id=status_message_id,
             text=message_text,
             reply_markup=create_batch_keyboard(batches)
         )
+
+def _finish_continue_fetch(context: CallbackContext, user_id: int, status_message_id: int, previous_count: int, job):
+    """نمایش نتیجه ادامه دریافت فایل‌ها پس از پایان کار پس‌زمینه"""
+    user_data = user_data_store.get(user_id)
+    result = _scan_result(user_data, job)
+    if result is None:
+        return
+    _, new_offset_id, has_more_messages = result
+    progress_editor.discard(user_id, status_message_id)
     
-    context.user_data["waiting_for_channel"] = False
+    all_music_files = user_data["music_files"]
+    new_files_count = len(all_music_files) - previous_count
+    
+    if not new_files_count:
+        context.bot.edit_message_text(
+            chat_id=user_id,
+            message_id=status_message_id,
+            text="❌ هیچ فایل موسیقی جدیدی یافت نشد. احتمالاً به پایان پیام‌های کانال رسیده‌اید."
+        )
+        return
+        
+    # دسته‌ها در حین اسکن به صورت افزایشی به‌روز شده‌اند
+    batches = user_data["batches"]
+    
+    # ذخیره اطلاعات به‌روزشده
+    user_data.update({
+        "last_offset_id": new_offset_id,
+        "has_more_messages": has_more_messages
+    })
+    
+    # نمایش متن و کیبورد مناسب
+    batch_page = user_data.get("batch_page", 0)
+    batch_info = format_batch_info(batches, user_data["deduplicator"].dropped, batch_page)
+    if has_more_messages:
+        message_text = (
+            f"✅ دریافت فایل‌های جدید با موفقیت انجام شد!\n\n"
+            f"🎵 تعداد کل فایل‌های پیدا شده: {len(all_music_files)}\n"
+            f"🆕 تعداد فایل‌های جدید: {new_files_count}\n"
+            f"📁 دسته‌بندی شده در {len(batches)} دسته\n\n"
+            f"{batch_info}\n\n"
+            f"⚠️ هنوز پیام‌های بیشتری در کانال وجود دارد. می‌خواهید ادامه دهید؟"
+        )
+        reply_markup = create_continue_fetching_keyboard()
+    else:
+        message_text = (
+            f"✅ دریافت همه فایل‌ها با موفقیت انجام شد!\n\n"
+            f"🎵 تعداد کل فایل‌های پیدا شده: {len(all_music_files)}\n"
+            f"🆕 تعداد فایل‌های جدید: {new_files_count}\n"
+            f"📁 دسته‌بندی شده در {len(batches)} دسته\n\n"
+            f"{batch_info}"
+        )
+        reply_markup = create_batch_keyboard(batches, batch_page)
+    
+    context.bot.edit_message_text(
+        chat_id=user_id,
+        message_id=status_message_id,
+        text=message_text,
+        reply_markup=reply_markup
+    )
 
 def batch_selection_handler(update: Update, context: CallbackContext):
     """مدیریت انتخاب دسته"""
@@ -215,8 +473,7 @@ def batch_selection_handler(update: Update, context: CallbackContext):
     
     if callback_data == "cancel":
         query.edit_message_text("❌ عملیات لغو شد.")
-        if "downloader" in user_data:
-            user_data["downloader"].disconnect()
+        _close_session(user_id, user_data)
         user_data_store.pop(user_id, None)
         return
     
@@ -233,98 +490,219 @@ def batch_selection_handler(update: Update, context: CallbackContext):
                 "در حال آماده‌سازی برای ارسال..."
             )
             
-            # ارسال اولین فایل
+            # یک اسکن به همه مقصدها ارسال می‌شود؛ هر مقصد خط لوله، پیام وضعیت و وضعیت فلاد خودش را دارد
+            forward_scheduler.cancel(user_id)
+            _finish_forward_journal(user_data)
+            user_data["forwards"] = {}
             user_data["is_forwarding"] = True
-            user_data["is_paused"] = False
-            user_data["current_file_index"] = 0
-            
-            forward_status_message = context.bot.send_message(
-                chat_id=user_id,
-                text=f"⏳ در حال ارسال فایل‌های دسته {batch_index}...\n\n"
-                     f"0/{len(selected_batch)} ارسال شده",
-                reply_markup=create_forward_control_keyboard(batch_index, len(batches))
-            )
-            
-            user_data["forward_status_message"] = forward_status_message
-            
-            # شروع ارسال فایل‌ها
-            forward_batch_files(context, user_id)
+            for target in TARGET_BOTS:
+                _start_target_forward(context, user_id, user_data, target, batch_index, selected_batch)
 
-def forward_batch_files(context: CallbackContext, user_id: int):
-    """ارسال فایل‌های یک دسته"""
-    user_data = user_data_store.get(user_id)
+def _start_target_forward(context: CallbackContext, user_id, user_data, target, batch_index, refs,
+                          journal_job=None, intro=None):
+    """شروع خط لوله ارسال مستقل یک دسته به یک مقصد"""
+    # ثبت کار ارسال در دفترچه پایدار تا پس از راه‌اندازی مجدد قابل ادامه باشد
+    if journal_job is None and forward_journal is not None:
+        journal_job = forward_journal.start(user_id, user_data["channel"], target, batch_index, refs)
+    
+    state = {
+        "target": target,
+        "batch_index": batch_index,
+        "refs": refs,
+        "file_index": 0,
+        "failed": 0,
+        "skipped": 0,
+        "journal_job": journal_job,
+        "done": False,
+    }
+    state["status_message"] = context.bot.send_message(
+        chat_id=user_id,
+        text=f"{intro or f'⏳ در حال ارسال فایل‌های دسته {batch_index} به {target}...'}\n\n"
+             f"0/{len(refs)} ارسال شده",
+        reply_markup=create_forward_control_keyboard(user_data["current_batch"], len(user_data["batches"]))
+    )
+    user_data["forwards"][target] = state
     
-    if not user_data or not user_data["is_forwarding"] or user_data["is_paused"]:
+    # سپردن خط لوله به زمان‌بند مشترک ارسال (نوبت منصفانه بین کاربران)
+    forward_scheduler.submit(user_id, target, lambda: forward_batch_files(context, user_id, target))
+
+def _format_forward_progress(user_data, markdown=False):
+    """خلاصه پیشرفت ارسال به هر مقصد (یک خط برای هر مقصد)؛ با markdown=True نام مقصدها escape می‌شوند"""
+    lines = []
+    for state in user_data.get("forwards", {}).values():
+        target = escape_markdown(state['target']) if markdown else state['target']
+        line = f"  • {target}: {state['file_index']}/{len(state['refs'])} پردازش شده"
+        if state["failed"]:
+            line += f"، ⚠️ ناموفق: {state['failed']}"
+        if state["skipped"]:
+            line += f"، ⏭ رد شده: {state['skipped']}"
+        if state["done"]:
+            line += " ✅"
+        lines.append(line)
+    return "\n".join(lines)
+
+def _finish_forward_journal(user_data):
+    """ثبت پایان کارهای ارسال فعلی کاربر (برای همه مقصدها) در دفترچه"""
+    for state in user_data.get("forwards", {}).values():
+        job_key = state.pop("journal_job", None)
+        if job_key is not None:
+            forward_journal.finish(job_key)
+
+def resume_unfinished_forwards(job_queue):
+    """ادامه کارهای ارسال ناتمام از اجرای قبلی ربات (بدون اسکن مجدد)"""
+    if forward_journal is None:
+        return
+    jobs_by_user = {}
+    for job in forward_journal.unfinished_jobs():
+        jobs_by_user.setdefault(job["user_id"], []).append(job)
+    for user_id, jobs in jobs_by_user.items():
+        job_queue.run_once(lambda context, user_id=user_id, jobs=jobs: _resume_forward_jobs(context, user_id, jobs), 0)
+
+def _resume_forward_jobs(context: CallbackContext, user_id, jobs):
+    """بازسازی داده‌های کاربر از دفترچه و ادامه ارسال هر مقصد از اولین فایل ارسال نشده"""
+    pending = []
+    for job in jobs:
+        if job["refs"] and not any(other["target"] == job["target"] for other in pending):
+            pending.append(job)
+        else:
+            forward_journal.finish(job["job"])
+    if not pending:
         return
     
-    batch_index = user_data["current_batch"]
-    file_index = user_data["current_file_index"]
-    selected_batch = user_data["batches"][batch_index - 1]
+    downloader = MusicDownloader()
+    downloader.connect()
+    # فایل‌های باقیمانده به صورت یک دسته واحد نمایش داده می‌شوند
+    batches = split_into_batches(pending[0]["refs"], len(pending[0]["refs"]))
+    user_data = {
+        "downloader": downloader,
+        "channel": pending[0]["channel"],
+        "music_files": batches.items,
+        "batches": batches,
+        "current_batch": 1,
+        "forwards": {},
+        "is_forwarding": True,
+        "last_offset_id": 0,
+        "has_more_messages": False,
+        "max_messages": None,
+        "batch_fetch_size": 5000,
+        "deduplicator": AudioDeduplicator(),
+    }
+    user_data_store[user_id] = user_data
+    
+    for job in pending:
+        logger.info(f"ادامه ارسال ناتمام برای کاربر {user_id} به {job['target']}: {len(job['refs'])} فایل باقیمانده")
+        _start_target_forward(
+            context, user_id, user_data, job["target"], job["batch_index"], job["refs"], journal_job=job["job"],
+            intro=f"♻️ ادامه ارسال ناتمام دسته {job['batch_index']} از {job['channel']} به {job['target']} "
+                  f"پس از راه‌اندازی مجدد ربات..."
+        )
+
+def forward_batch_files(context: CallbackContext, user_id: int, target: str):
+    """یک مرحله از ارسال دسته به یک مقصد (حداکثر FORWARD_CHUNK_SIZE فایل)
+
+    توسط زمان‌بند ارسال اجرا می‌شود و تاخیر تا مرحله بعد (ثانیه) یا None
+    در صورت پایان ارسال را برمی‌گرداند.
+    """
+    user_data = user_data_store.get(user_id)
+    
+    if not user_data or not user_data["is_forwarding"]:
+        return None
+    
+    state = user_data["forwards"].get(target)
+    if state is None or state["done"]:
+        return None
+    
+    batch_index = state["batch_index"]
+    file_index = state["file_index"]
+    selected_batch = state["refs"]
+    status_message_id = state["status_message"].message_id
     
     if file_index >= len(selected_batch):
-        # اتمام ارسال دسته
+        # اتمام ارسال دسته به این مقصد
+        state["done"] = True
+        job_key = state.pop("journal_job", None)
+        if job_key is not None:
+            forward_journal.finish(job_key)
+        progress_editor.discard(user_id, status_message_id)
+        skipped = state["skipped"]
+        skipped_text = f"\n⏭ رد شده (قبلاً ارسال شده): {skipped}" if skipped else ""
         context.bot.edit_message_text(
             chat_id=user_id,
-            message_id=user_data["forward_status_message"].message_id,
-            text=f"✅ ارسال دسته {batch_index} با موفقیت انجام شد!\n\n"
-                f"{len(selected_batch)}/{len(selected_batch)} فایل ارسال شده",
-            reply_markup=create_forward_control_keyboard(batch_index, len(user_data["batches"]))
+            message_id=status_message_id,
+            text=f"✅ ارسال دسته {batch_index} به {target} با موفقیت انجام شد!\n\n"
+                f"{len(selected_batch) - state['failed'] - skipped}/{len(selected_batch)} فایل ارسال شده{skipped_text}",
+            reply_markup=create_forward_control_keyboard(user_data["current_batch"], len(user_data["batches"]))
         )
-        user_data["is_forwarding"] = False
-        return
+        if all(other["done"] for other in user_data["forwards"].values()):
+            user_data["is_forwarding"] = False
+        return None
     
-    # ارسال فایل بعدی
+    # ارسال بخش بعدی فایل‌ها با یک درخواست گروهی
     try:
-        message = selected_batch[file_index]
-        success = user_data["downloader"].forward_to_bot(message, TARGET_BOT)
+        chunk = selected_batch[file_index:file_index + FORWARD_CHUNK_SIZE]
         
-        user_data["current_file_index"] = file_index + 1
+        # فایل‌هایی که قبلاً (حتی در جلسات قبلی) به این مقصد ارسال شده‌اند دوباره ارسال نمی‌شوند
+        new_refs = chunk
+        if forward_ledger is not None:
+            new_refs, _ = forward_ledger.filter_new(target, chunk)
+        results = []
+        if new_refs:
+            started = time.monotonic()
+            results = user_data["downloader"].forward_chunk(new_refs, target)
+            metrics.forward_latency.observe(time.monotonic() - started, target=target)
+            metrics.forwards.inc(results.count(True), result="success", target=target)
+            metrics.forwards.inc(results.count(False), result="failed", target=target)
         
-        # بروزرسانی پیام وضعیت
-        try:
-            context.bot.edit_message_text(
-                chat_id=user_id,
-                message_id=user_data["forward_status_message"].message_id,
-                text=f"⏳ در حال ارسال فایل‌های دسته {batch_index}...\n\n"
-                    f"{file_index + 1}/{len(selected_batch)} ارسال شده",
-                reply_markup=create_forward_control_keyboard(batch_index, len(user_data["batches"]))
+        # تعداد فایل‌های پردازش شده از این بخش (در صورت ارسال ناقص، تا اولین فایل ارسال نشده)
+        processed = len(chunk) if len(results) == len(new_refs) else chunk.index(new_refs[len(results)])
+        if forward_ledger is not None:
+            forward_ledger.add(target, [ref.document_id for ref, ok in zip(new_refs, results) if ok])
+        
+        # ثبت پایدار پیش از پیشروی تا پس از قطع ناگهانی هیچ فایلی دوباره ارسال نشود
+        if state.get("journal_job"):
+            forward_journal.record_sent(state["journal_job"], [ref.message_id for ref in chunk[:processed]])
+        
+        file_index += processed
+        state["file_index"] = file_index
+        state["failed"] += results.count(False)
+        state["skipped"] += processed - len(results)
+        metrics.forwards.inc(processed - len(results), result="skipped", target=target)
+        
+        # بروزرسانی پیام وضعیت پس از هر بخش (بدون انتظار برای Bot API)؛ در حالت توقف پیام «⏸» دست نمی‌خورد
+        if not forward_scheduler.is_paused(user_id):
+            failed_text = f"\n⚠️ ناموفق: {state['failed']}" if state["failed"] else ""
+            if state["skipped"]:
+                failed_text += f"\n⏭ رد شده (قبلاً ارسال شده): {state['skipped']}"
+            progress_editor.update(
+                context.bot,
+                user_id,
+                status_message_id,
+                f"⏳ در حال ارسال فایل‌های دسته {batch_index} به {target}...\n\n"
+                f"{file_index}/{len(selected_batch)} پردازش شده{failed_text}",
+                reply_markup=create_forward_control_keyboard(user_data["current_batch"], len(user_data["batches"]))
             )
-        except Exception as e:
-            logger.error(f"خطا در به‌روزرسانی وضعیت: {e}")
         
-        # تاخیر برای جلوگیری از محدودیت فلاد
-        # ادامه با فایل بعدی پس از تاخیر
-        delay = 2  # تاخیر 2 ثانیه بین هر ارسال
-        context.job_queue.run_once(lambda _: forward_batch_files(context, user_id), delay)
+        # ادامه با بخش بعدی به محض آزاد شدن اولین حساب برای همین مقصد
+        return user_data["downloader"].estimated_wait(target)
+    
+    except FloodWaitError as e:
+        # خط لوله همین مقصد تا پایان FloodWait به تعویق می‌افتد و زمان‌بند در این فاصله خط لوله‌های دیگر را اجرا می‌کند
+        retry_time = e.seconds + 1
+        logger.info(f"محدودیت فلاد برای {target} اعمال شده، انتظار برای {retry_time} ثانیه...")
+        
+        # اطلاع‌رسانی به کاربر
+        context.bot.send_message(
+            chat_id=user_id,
+            text=f"⚠️ محدودیت ارسال تلگرام برای {target}: انتظار برای {retry_time} ثانیه قبل از ادامه ارسال..."
+        )
+        
+        return retry_time
     
     except Exception as e:
-        logger.error(f"خطا در ارسال فایل به ربات مقصد: {e}")
+        logger.error(f"خطا در ارسال فایل به مقصد {target}: {e}")
         
-        # اگر با محدودیت فلاد مواجه شدیم، تاخیر بیشتری اعمال می‌کنیم
-        if "RetryAfter" in str(e) or "Flood" in str(e):
-            retry_time = 30  # زمان انتظار پیش‌فرض
-            
-            # سعی در استخراج زمان انتظار از پیام خطا
-            import re
-            time_match = re.search(r'(\d+(\.\d+)?)', str(e))
-            if time_match:
-                try:
-                    retry_time = float(time_match.group(1)) + 1
-                except:
-                    pass
-            
-            logger.info(f"محدودیت فلاد اعمال شده، انتظار برای {retry_time} ثانیه...")
-            
-            # اطلاع‌رسانی به کاربر
-            context.bot.send_message(
-                chat_id=user_id,
-                text=f"⚠️ محدودیت ارسال تلگرام: انتظار برای {retry_time} ثانیه قبل از ادامه ارسال..."
-            )
-            
-            context.job_queue.run_once(lambda _: forward_batch_files(context, user_id), retry_time)
-        else:
-            # سایر خطاها - تلاش مجدد پس از 5 ثانیه
-            context.job_queue.run_once(lambda _: forward_batch_files(context, user_id), 5)
+        # سایر خطاها - تلاش مجدد پس از 5 ثانیه
+        return 5
 
 def button_handler(update: Update, context: CallbackContext):
     """مدیریت دکمه‌های اینلاین"""
@@ -343,30 +721,35 @@ def button_handler(update: Update, context: CallbackContext):
     if callback_data == "cancel":
         user_data["is_forwarding"] = False
         query.edit_message_text("❌ عملیات ارسال لغو شد.")
-        if "downloader" in user_data:
-            user_data["downloader"].disconnect()
+        _close_session(user_id, user_data)
         user_data_store.pop(user_id, None)
     
     elif callback_data == "pause":
-        user_data["is_paused"] = True
+        forward_scheduler.pause(user_id)
+        progress_editor.discard(user_id, query.message.message_id)
+        for state in user_data.get("forwards", {}).values():
+            progress_editor.discard(user_id, state["status_message"].message_id)
         query.edit_message_text(
             f"⏸ ارسال فایل‌ها متوقف شد.\n\n"
-            f"{user_data['current_file_index']}/{len(user_data['batches'][user_data['current_batch'] - 1])} ارسال شده",
+            f"{_format_forward_progress(user_data)}",
             reply_markup=create_forward_control_keyboard(user_data["current_batch"], len(user_data["batches"]))
         )
     
     elif callback_data == "resume":
-        user_data["is_paused"] = False
+        forward_scheduler.resume(user_id)
         query.edit_message_text(
             f"▶️ ارسال فایل‌ها از سر گرفته شد.\n\n"
-            f"{user_data['current_file_index']}/{len(user_data['batches'][user_data['current_batch'] - 1])} ارسال شده",
+            f"{_format_forward_progress(user_data)}",
             reply_markup=create_forward_control_keyboard(user_data["current_batch"], len(user_data["batches"]))
         )
-        
-        # ادامه ارسال
-        context.job_queue.run_once(lambda _: forward_batch_files(context, user_id), 1)
     
     elif callback_data == "continue_fetch":
+        # جلوگیری از اجرای همزمان دو اسکن برای یک کاربر
+        scan_job = user_data.get("scan_job")
+        if scan_job is not None and scan_job.is_active:
+            context.bot.send_message(chat_id=user_id, text="⏳ اسکن قبلی شما هنوز در حال انجام است.")
+            return
+        
         # ادامه دریافت فایل‌های موسیقی
         query.edit_message_text("🔄 در حال ادامه دریافت فایل‌های موسیقی...\nلطفاً صبر کنید. این فرآیند ممکن است چند دقیقه طول بکشد.")
         
@@ -394,97 +777,64 @@ def button_handler(update: Update, context: CallbackContext):
         status_message_id = query.message.message_id
         
         def update_progress(total, processed):
-            """به‌روزرسانی پیشرفت دانلود"""
-            now = time.time()
-            try:
-                if now - user_data.get("last_progress_update", 0) >= 5:
-                    progress_text = format_progress_message(total, processed)
-                    context.bot.edit_message_text(
-                        chat_id=user_id,
-                        message_id=status_message_id,
-                        text=f"در حال ادامه دریافت فایل‌های موسیقی...\n\n{progress_text}\n\nلطفاً صبر کنید."
-                    )
-                    user_data["last_progress_update"] = now
-            except Exception as e:
-                logger.error(f"خطا در به‌روزرسانی پیشرفت: {e}")
-        
-        # دریافت فایل‌های موسیقی جدید
-        downloader = user_data["downloader"]
-        new_music_files, new_offset_id, has_more_messages = downloader.get_music_files(
-            channel_input, 
-            update_progress, 
-            effective_max_messages, 
-            last_offset_id
-        )
-        
-        # ادغام فایل‌های جدید با قبلی
-        all_music_files = current_music_files + new_music_files
-        
-        if not new_music_files:
-            query.edit_message_text(
-                "❌ هیچ فایل موسیقی جدیدی یافت نشد. احتمالاً به پایان پیام‌های کانال رسیده‌اید."
+            """به‌روزرسانی پیشرفت دانلود (ویرایش پیام به سرویس مرکزی سپرده می‌شود)"""
+            progress_text = format_progress_message(total, processed)
+            progress_editor.update(
+                context.bot,
+                user_id,
+                status_message_id,
+                f"در حال ادامه دریافت فایل‌های موسیقی...\n\n{progress_text}\n\nلطفاً صبر کنید."
             )
-            return
-            
-        # به‌روزرسانی دسته‌ها
-        batches = split_into_batches(all_music_files, BATCH_SIZE)
-        
-        # ذخیره اطلاعات به‌روزشده
-        user_data.update({
-            "music_files": all_music_files,
-            "batches": batches,
-            "last_offset_id": new_offset_id,
-            "has_more_messages": has_more_messages
-        })
         
-        # نمایش متن و کیبورد مناسب
-        batch_info = format_batch_info(batches)
-        if has_more_messages:
-            message_text = (
-                f"✅ دریافت فایل‌های جدید با موفقیت انجام شد!\n\n"
-                f"🎵 تعداد کل فایل‌های پیدا شده: {len(all_music_files)}\n"
-                f"🆕 تعداد فایل‌های جدید: {len(new_music_files)}\n"
-                f"📁 دسته‌بندی شده در {len(batches)} دسته\n\n"
-                f"{batch_info}\n\n"
-                f"⚠️ هنوز پیام‌های بیشتری در کانال وجود دارد. می‌خواهید ادامه دهید؟"
+        # دریافت فایل‌های موسیقی جدید در پس‌زمینه؛ فایل‌ها در حین اسکن به لیست فعلی اضافه می‌شوند
+        downloader = user_data["downloader"]
+        previous_count = len(current_music_files)
+        timings = user_data["scan_timings"] = ScanTimings()
+        try:
+            scan_jobs.submit(
+                user_id,
+                lambda: downloader.collect_music_files(
+                    channel_input,
+                    update_progress,
+                    effective_max_messages,
+                    last_offset_id,
+                    page_callback=_store_scan_page(user_data),
+                    deduplicator=user_data["deduplicator"],
+                    timings=timings
+                ),
+                on_done=lambda job: _finish_continue_fetch(context, user_id, status_message_id, previous_count, job),
+                description=channel_input,
+                on_created=_track_scan_job(user_data)
             )
+        except JobQueueFull:
             query.edit_message_text(
-                text=message_text,
+                "⚠️ صف اسکن در حال حاضر پر است. لطفاً چند دقیقه دیگر دوباره تلاش کنید.",
                 reply_markup=create_continue_fetching_keyboard()
             )
-        else:
-            message_text = (
-                f"✅ دریافت همه فایل‌ها با موفقیت انجام شد!\n\n"
-                f"🎵 تعداد کل فایل‌های پیدا شده: {len(all_music_files)}\n"
-                f"🆕 تعداد فایل‌های جدید: {len(new_music_files)}\n"
-                f"📁 دسته‌بندی شده در {len(batches)} دسته\n\n"
-                f"{batch_info}"
-            )
-            query.edit_message_text(
-                text=message_text,
-                reply_markup=create_batch_keyboard(batches)
-            )
     
-    elif callback_data == "show_batches":
-        # نمایش دسته‌ها بدون ادامه دریافت
-        batch_info = format_batch_info(user_data["batches"])
+    elif callback_data == "show_batches" or callback_data.startswith("bp_"):
+        # نمایش دسته‌ها بدون ادامه دریافت؛ هر صفحه فقط دسته‌های قابل مشاهده خود را می‌سازد
+        if callback_data.startswith("bp_"):
+            user_data["batch_page"] = int(callback_data[3:])
+        batch_page = user_data.get("batch_page", 0)
+        batch_info = format_batch_info(user_data["batches"], user_data["deduplicator"].dropped, batch_page)
         message_text = f"📂 فایل‌های دریافت شده تا کنون:\n\n{batch_info}"
         query.edit_message_text(
             text=message_text,
-            reply_markup=create_batch_keyboard(user_data["batches"])
+            reply_markup=create_batch_keyboard(user_data["batches"], batch_page)
         )
     
     elif callback_data == "status":
         batch_index = user_data["current_batch"]
-        file_index = user_data["current_file_index"]
-        selected_batch = user_data["batches"][batch_index - 1]
         
         status_text = (
             f"📊 *وضعیت ارسال:*\n\n"
             f"📁 دسته فعلی: {batch_index}/{len(user_data['batches'])}\n"
-            f"🎵 فایل‌های ارسال شده: {file_index}/{len(selected_batch)}\n"
-            f"⏱ وضعیت: {'متوقف ⏸' if user_data['is_paused'] else 'در حال ارسال ▶️'}"
+            f"🎵 فایل‌های پردازش شده به تفکیک مقصد:\n{_format_forward_progress(user_data, markdown=True)}\n"
+            f"⏱ وضعیت: {'متوقف ⏸' if forward_scheduler.is_paused(user_id) else 'در حال ارسال ▶️'}"
         )
+        if user_data.get("scan_timings") is not None:
+            status_text += "\n\n" + user_data["scan_timings"].format_summary()
         
         context.bot.send_message(
             chat_id=user_id,
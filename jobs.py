@@ -0,0 +1,160 @@
+import asyncio
+import itertools
+import threading
+import time
+from utils import logger
+from config import SCAN_WORKERS, SCAN_QUEUE_SIZE
+from client_service import client_service
+import metrics
+
+
+class JobQueueFull(Exception):
+    """صف کارهای پس‌زمینه پر است"""
+
+
+class ScanJob:
+    """شناسه و وضعیت یک کار اسکن پس‌زمینه"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, job_id, user_id, description):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.description = description
+        self.status = ScanJob.QUEUED
+        self.result = None
+        self.error = None
+        self.future = None  # concurrent.futures.Future روی حلقه مشترک
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def is_active(self):
+        return self.status in (ScanJob.QUEUED, ScanJob.RUNNING)
+
+    def cancel(self):
+        """لغو کار (در صف یا در حال اجرا)"""
+        if self.future is not None and self.is_active:
+            self.future.cancel()
+            self.status = ScanJob.CANCELLED
+            self.finished_at = time.time()
+            return True
+        return False
+
+
+class JobManager:
+    """اجرای کارهای اسکن در پس‌زمینه با تعداد محدود worker و یک صف
+
+    کارها به صورت coroutine روی حلقه رویداد مشترک اجرا می‌شوند و حداکثر
+    `workers` کار همزمان اجرا می‌شود؛ بقیه به ترتیب ورود در صف منتظر می‌مانند.
+    هندلرها بلافاصله یک ScanJob دریافت می‌کنند و thread دیسپچر مسدود نمی‌شود.
+    کال‌بک پایان کار در thread pool اجرا می‌شود تا فراخوانی‌های Bot API
+    حلقه مشترک را مسدود نکنند.
+    """
+
+    def __init__(self, service=client_service, workers=SCAN_WORKERS, max_queued=SCAN_QUEUE_SIZE):
+        self.service = service
+        self.workers = workers
+        self.max_queued = max_queued
+        self._semaphore = None  # روی حلقه مشترک و در اولین استفاده ساخته می‌شود
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @property
+    def running_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == ScanJob.RUNNING)
+
+    @property
+    def queued_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == ScanJob.QUEUED)
+
+    def queue_position(self, job):
+        """جایگاه کار در صف (0 یعنی در حال اجرا یا پایان یافته)"""
+        if job.status != ScanJob.QUEUED:
+            return 0
+        with self._lock:
+            return sum(
+                1 for other in self._jobs.values()
+                if other.status == ScanJob.QUEUED and other.job_id <= job.job_id
+            )
+
+    def submit(self, user_id, coro_factory, on_done=None, description="", on_created=None):
+        """ثبت یک کار اسکن جدید
+
+        Args:
+            user_id: شناسه کاربر صاحب کار
+            coro_factory: تابعی بدون ورودی که coroutine اسکن را می‌سازد
+            on_done: کال‌بک پایان کار که با ScanJob فراخوانی می‌شود (در thread pool)
+            description: توضیح کوتاه برای لاگ و نمایش وضعیت
+            on_created: کال‌بکی که پیش از زمان‌بندی اجرا با ScanJob فراخوانی می‌شود، تا فراخواننده
+                کار را ذخیره کند حتی اگر اسکن (مثلاً از حافظه نتایج) بلافاصله تمام شود
+
+        Returns:
+            ScanJob
+        """
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == ScanJob.QUEUED)
+            if queued >= self.max_queued:
+                raise JobQueueFull()
+            job = ScanJob(next(self._ids), user_id, description)
+            self._jobs[job.job_id] = job
+
+        if on_created is not None:
+            on_created(job)
+        job.future = self.service.submit(self._run(job, coro_factory))
+        job.future.add_done_callback(lambda _: self._finish(job, on_done))
+        return job
+
+    async def _run(self, job, coro_factory):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        async with self._semaphore:
+            job.status = ScanJob.RUNNING
+            job.started_at = time.time()
+            logger.info(f"شروع کار اسکن #{job.job_id} برای کاربر {job.user_id}: {job.description}")
+            return await coro_factory()
+
+    def _finish(self, job, on_done):
+        """ثبت نتیجه کار و فراخوانی کال‌بک پایان در thread pool"""
+        future = job.future
+        if future.cancelled():
+            job.status = ScanJob.CANCELLED
+        elif future.exception() is not None:
+            job.status = ScanJob.FAILED
+            job.error = future.exception()
+            logger.error(f"خطا در کار اسکن #{job.job_id}: {job.error}")
+        else:
+            job.status = ScanJob.DONE
+            job.result = future.result()
+        job.finished_at = time.time()
+
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+
+        if on_done is not None and job.status != ScanJob.CANCELLED:
+            # این کال‌بک ممکن است در thread دیگری (مثلاً هنگام پایان فوری کار) اجرا شود
+            self.service.loop.call_soon_threadsafe(
+                self.service.loop.run_in_executor, None, self._call_on_done, on_done, job
+            )
+
+    @staticmethod
+    def _call_on_done(on_done, job):
+        try:
+            on_done(job)
+        except Exception as e:
+            logger.error(f"خطا در پردازش نتیجه کار اسکن #{job.job_id}: {e}")
+
+
+# مدیر مشترک کارهای اسکن برای کل فرآیند
+scan_jobs = JobManager()
+metrics.active_jobs.set_function(lambda: scan_jobs.running_count)
+metrics.queued_jobs.set_function(lambda: scan_jobs.queued_count)
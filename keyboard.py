@@ -1,4 +1,5 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+from config import BATCH_PAGE_SIZE
 
 def start_keyboard():
     """دکمه‌های منوی اصلی"""
@@ -8,17 +9,31 @@ def start_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
-def create_batch_keyboard(batches):
-    """ساخت کیبورد انتخاب دسته‌ها"""
+def create_batch_keyboard(batches, page=0, page_size=BATCH_PAGE_SIZE):
+    """ساخت کیبورد انتخاب دسته‌ها (فقط دسته‌های صفحه page به همراه دکمه‌های پیمایش)"""
+    page, page_count, indexes = batches.page(page, page_size)
     keyboard = []
     row = []
     
-    for i in range(1, len(batches) + 1):
-        row.append(InlineKeyboardButton(f"دسته {i}", callback_data=f"batch_{i}"))
+    for i in indexes:
+        row.append(InlineKeyboardButton(f"دسته {i + 1}", callback_data=f"batch_{i + 1}"))
         
-        if len(row) == 3 or i == len(batches):
+        if len(row) == 3:
             keyboard.append(row)
             row = []
+    if row:
+        keyboard.append(row)
+    
+    # پیمایش صفحه‌ها با داده کوتاه bp_<صفحه>
+    if page_count > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("⏮", callback_data="bp_0"))
+            navigation.append(InlineKeyboardButton("◀️", callback_data=f"bp_{page - 1}"))
+        if page < page_count - 1:
+            navigation.append(InlineKeyboardButton("▶️", callback_data=f"bp_{page + 1}"))
+            navigation.append(InlineKeyboardButton("⏭", callback_data=f"bp_{page_count - 1}"))
+        keyboard.append(navigation)
     
     keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="cancel")])
     
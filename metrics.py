@@ -0,0 +1,219 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import logger
+from config import METRICS_HOST, METRICS_PORT
+
+# مرزهای پیش‌فرض هیستوگرام‌های زمان (ثانیه)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """پایه معیارها: نگه‌داری مقادیر به ازای هر ترکیب برچسب‌ها"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"برچسب‌های نامعتبر برای {self.name}: {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """شمارنده صعودی"""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """مقدار لحظه‌ای؛ می‌تواند هنگام خواندن از یک تابع محاسبه شود"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """محاسبه مقدار (بدون برچسب) در زمان هر بار خواندن معیارها"""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                return [(self.name, (), (), self._function())]
+            except Exception as e:
+                logger.error(f"خطا در محاسبه معیار {self.name}: {e}")
+                return []
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    """توزیع مقادیر در سطل‌های تجمعی به همراه مجموع و تعداد"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), cumulative))
+                samples.append((f"{self.name}_sum", key, (), total))
+                samples.append((f"{self.name}_count", key, (), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """مجموعه معیارهای فرآیند و تولید خروجی با قالب متنی Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+# معیارهای اسکن
+pages_fetched = registry.counter(
+    "tgmusic_pages_fetched_total", "صفحه‌های دریافت شده از تلگرام", ("mode",))
+messages_classified = registry.counter(
+    "tgmusic_messages_classified_total", "پیام‌های بررسی شده برای تشخیص فایل صوتی")
+audio_found = registry.counter(
+    "tgmusic_audio_found_total", "فایل‌های صوتی یافت شده در اسکن")
+scan_cache_lookups = registry.counter(
+    "tgmusic_scan_cache_lookups_total", "درخواست‌های اسکن پاسخ داده شده از حافظه نتایج اسکن", ("result",))
+request_latency = registry.histogram(
+    "tgmusic_request_latency_seconds", "زمان پاسخ درخواست‌های دریافت پیام (بدون انتظار کنترل نرخ)", ("request",))
+
+# معیارهای کنترل نرخ
+flood_waits = registry.counter(
+    "tgmusic_flood_waits_total", "تعداد FloodWaitهای دریافت شده")
+flood_wait_duration = registry.histogram(
+    "tgmusic_flood_wait_seconds", "مدت FloodWaitهای دریافت شده",
+    buckets=(1, 5, 10, 30, 60, 300, 900, 3600))
+
+# معیارهای ارسال
+forwards = registry.counter(
+    "tgmusic_forwards_total", "فایل‌های ارسال شده به مقصد", ("result", "target"))
+forward_latency = registry.histogram(
+    "tgmusic_forward_chunk_seconds", "زمان ارسال هر بخش از فایل‌ها", ("target",))
+
+# معیارهای جلسه‌های کاربران
+session_memory = registry.gauge(
+    "tgmusic_session_memory_bytes", "حجم تقریبی حافظه جلسه‌های کاربران در آخرین بررسی")
+sessions_evicted = registry.counter(
+    "tgmusic_sessions_evicted_total", "جلسه‌های خارج شده از حافظه", ("reason",))
+
+# معیارهای صف کارها
+active_jobs = registry.gauge(
+    "tgmusic_scan_jobs_active", "کارهای اسکن در حال اجرا")
+queued_jobs = registry.gauge(
+    "tgmusic_scan_jobs_queued", "کارهای اسکن منتظر در صف")
+active_forwards = registry.gauge(
+    "tgmusic_forward_steps_active", "مراحل ارسال در حال اجرا در زمان‌بند ارسال")
+queued_forwards = registry.gauge(
+    "tgmusic_forward_pipelines_queued", "خط لوله‌های ارسال منتظر نوبت در زمان‌بند ارسال")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # جلوگیری از لاگ هر درخواست scrape
+        pass
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """راه‌اندازی سرور HTTP معیارها در یک thread پس‌زمینه (غیرفعال اگر port صفر باشد)"""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"راه‌اندازی سرور معیارها روی {host}:{port} ناموفق بود: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"معیارها در آدرس http://{host}:{port}/metrics در دسترس هستند")
+    return server
@@ -0,0 +1,67 @@
+from telethon import utils as tg_utils
+from telethon.tl.types import DocumentAttributeAudio
+
+
+class AudioRef:
+    """نمایش فشرده یک فایل موسیقی
+
+    به جای نگه‌داشتن کل شیء Message تلگرام (به همراه media، entities و ...)
+    فقط اطلاعاتی که برای ارسال و نمایش لازم است ذخیره می‌شود.
+    """
+    __slots__ = ("message_id", "peer_id", "document_id", "size", "duration", "title", "performer")
+
+    def __init__(self, message_id, peer_id, document_id=0, size=0, duration=0, title=None, performer=None):
+        self.message_id = message_id    # شناسه پیام در کانال مبدا
+        self.peer_id = peer_id          # شناسه کانال یا گروه مبدا (marked id)
+        self.document_id = document_id  # شناسه سند در تلگرام
+        self.size = size                # حجم فایل به بایت
+        self.duration = duration        # مدت زمان به ثانیه
+        self.title = title
+        self.performer = performer
+
+    @classmethod
+    def from_message(cls, message):
+        """ساخت AudioRef از یک پیام تلگرام"""
+        document = message.document
+        duration = 0
+        title = None
+        performer = None
+        if document is not None:
+            for attribute in document.attributes:
+                if isinstance(attribute, DocumentAttributeAudio):
+                    duration = attribute.duration or 0
+                    title = attribute.title or None
+                    performer = attribute.performer or None
+                    break
+
+        return cls(
+            message_id=message.id,
+            peer_id=tg_utils.get_peer_id(message.peer_id),
+            document_id=document.id if document is not None else 0,
+            size=document.size if document is not None else 0,
+            duration=duration,
+            title=title,
+            performer=performer,
+        )
+
+    def as_tuple(self):
+        """نمایش فشرده برای ذخیره‌سازی (به همان ترتیب آرگومان‌های سازنده)"""
+        return (self.message_id, self.peer_id, self.document_id, self.size, self.duration, self.title, self.performer)
+
+    @property
+    def display_name(self):
+        """نام قابل نمایش فایل (خواننده - عنوان)"""
+        if self.performer and self.title:
+            return f"{self.performer} - {self.title}"
+        return self.title or self.performer or f"#{self.message_id}"
+
+    def __eq__(self, other):
+        if not isinstance(other, AudioRef):
+            return NotImplemented
+        return self.peer_id == other.peer_id and self.message_id == other.message_id
+
+    def __hash__(self):
+        return hash((self.peer_id, self.message_id))
+
+    def __repr__(self):
+        return f"AudioRef(peer_id={self.peer_id}, message_id={self.message_id}, document_id={self.document_id})"
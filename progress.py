@@ -0,0 +1,131 @@
+import threading
+import time
+from telegram.error import BadRequest, RetryAfter
+from utils import logger
+from config import PROGRESS_CHAT_INTERVAL, PROGRESS_GLOBAL_RATE
+
+
+class ProgressEditor:
+    """سرویس مرکزی ویرایش پیام‌های وضعیت با ادغام و کنترل نرخ
+
+    هر به‌روزرسانی فقط آخرین متن یک پیام وضعیت را ثبت می‌کند و بلافاصله
+    بازمی‌گردد؛ یک thread جداگانه ویرایش‌ها را با رعایت حداقل فاصله برای هر
+    چت و سقف نرخ کلی ربات ارسال می‌کند. ویرایش‌هایی که متن آن‌ها تغییری
+    نکرده است ارسال نمی‌شوند. بنابراین اسکن و ارسال فایل‌ها هرگز منتظر
+    درخواست‌های Bot API نمی‌مانند.
+
+    هر پیام یک شماره نسل دارد که با discard افزایش می‌یابد؛ ویرایش‌های نسل
+    قبلی (در انتظار، در حال ارسال یا منتظر تلاش مجدد) دیگر ارسال نمی‌شوند و
+    discard تا پایان ویرایش در حال ارسال همان پیام صبر می‌کند، تا متن نهایی
+    هیچ‌گاه با یک ویرایش «در حال انجام» دیرهنگام بازنویسی نشود.
+    """
+
+    def __init__(self, chat_interval=PROGRESS_CHAT_INTERVAL, global_rate=PROGRESS_GLOBAL_RATE):
+        self.chat_interval = chat_interval  # حداقل فاصله بین دو ویرایش در یک چت (ثانیه)
+        self.global_interval = 1.0 / global_rate
+        self._pending = {}      # (chat_id, message_id) -> (bot, text, reply_markup, نسل)
+        self._last_sent = {}    # (chat_id, message_id) -> (text, reply_markup)
+        self._generations = {}  # (chat_id, message_id) -> نسل فعلی (فقط برای پیام‌هایی که discard شده‌اند)
+        self._in_flight = None  # پیامی که ویرایش آن در حال ارسال است
+        self._chat_next = {}  # chat_id -> زمان مجاز ویرایش بعدی
+        self._global_next = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def update(self, bot, chat_id, message_id, text, reply_markup=None):
+        """ثبت آخرین وضعیت یک پیام برای ویرایش (بدون انتظار)"""
+        markup = reply_markup.to_json() if reply_markup is not None else None
+        key = (chat_id, message_id)
+        with self._cond:
+            if self._last_sent.get(key) == (text, markup):
+                self._pending.pop(key, None)
+                return
+            self._pending[key] = (bot, text, reply_markup, self._generations.get(key, 0))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="progress-editor", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def discard(self, chat_id, message_id):
+        """حذف ویرایش‌های قبلی یک پیام (پیش از جایگزینی آن با پیام نهایی)
+
+        پس از بازگشت این متد هیچ ویرایش قبلی دیگری برای این پیام ارسال نمی‌شود.
+        """
+        key = (chat_id, message_id)
+        with self._cond:
+            self._generations[key] = self._generations.pop(key, 0) + 1
+            # محدود نگه داشتن حافظه برای پیام‌های قدیمی
+            if len(self._generations) > 10000:
+                self._generations.pop(next(iter(self._generations)))
+            self._pending.pop(key, None)
+            self._last_sent.pop(key, None)
+            while self._in_flight == key:
+                self._cond.wait()
+
+    def _next_ready(self):
+        """انتخاب پیامی که زودتر از بقیه مجاز به ویرایش است؛ (key, زمان انتظار)"""
+        now = time.monotonic()
+        best_key, best_wait = None, None
+        for key in self._pending:
+            wait = max(self._chat_next.get(key[0], 0.0), self._global_next) - now
+            if best_wait is None or wait < best_wait:
+                best_key, best_wait = key, wait
+        return best_key, best_wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    key, wait = self._next_ready()
+                    if key is None:
+                        self._cond.wait()
+                    elif wait > 0:
+                        self._cond.wait(wait)
+                    else:
+                        break
+                bot, text, reply_markup, generation = self._pending.pop(key)
+                now = time.monotonic()
+                self._chat_next[key[0]] = now + self.chat_interval
+                self._global_next = now + self.global_interval
+                self._in_flight = key
+
+            try:
+                self._send(key, bot, text, reply_markup, generation)
+            finally:
+                with self._cond:
+                    self._in_flight = None
+                    self._cond.notify_all()
+
+    def _is_current(self, key, generation):
+        return self._generations.get(key, 0) == generation
+
+    def _send(self, key, bot, text, reply_markup, generation):
+        chat_id, message_id = key
+        try:
+            bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=reply_markup)
+        except RetryAfter as e:
+            logger.warning(f"محدودیت ویرایش پیام در Bot API: انتظار برای {e.retry_after} ثانیه")
+            with self._cond:
+                self._global_next = time.monotonic() + e.retry_after
+                # در صورت نبود به‌روزرسانی جدیدتر (و اگر پیام در این فاصله discard نشده باشد)، همین ویرایش دوباره تلاش می‌شود
+                if self._is_current(key, generation):
+                    self._pending.setdefault(key, (bot, text, reply_markup, generation))
+            return
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.error(f"خطا در به‌روزرسانی پیام وضعیت: {e}")
+        except Exception as e:
+            logger.error(f"خطا در به‌روزرسانی پیام وضعیت: {e}")
+
+        markup = reply_markup.to_json() if reply_markup is not None else None
+        with self._cond:
+            if not self._is_current(key, generation):
+                return
+            self._last_sent[key] = (text, markup)
+            # محدود نگه داشتن حافظه برای پیام‌های قدیمی
+            if len(self._last_sent) > 10000:
+                self._last_sent.pop(next(iter(self._last_sent)))
+
+
+# سرویس مشترک ویرایش پیام‌های وضعیت برای کل فرآیند
+progress_editor = ProgressEditor()
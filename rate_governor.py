@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+from telethon.errors import FloodWaitError
+from utils import logger
+import metrics
+from config import RATE_LIMIT_INITIAL, RATE_LIMIT_MIN, RATE_LIMIT_MAX, RATE_LIMIT_BURST
+
+
+class RateGovernor:
+    """کنترل‌کننده نرخ درخواست‌ها (token bucket با AIMD)
+
+    هر حساب pool یک کنترل‌کننده نرخ دارد که همه درخواست‌های آن حساب (دریافت
+    تاریخچه، get_entity، ارسال و ...) از آن عبور می‌کنند؛ کنترل‌کننده مشترک
+    governor متعلق به حساب اصلی است. ارسال به هر مقصد از یک کنترل‌کننده جداگانه
+    همان حساب هم عبور می‌کند که داخل بودجه کل حساب اعمال می‌شود (Account).
+    در صورت دریافت FloodWaitError همه درخواست‌های همین کنترل‌کننده دقیقاً به
+    اندازه e.seconds منتظر می‌مانند و نرخ یک بار در هر دوره فلاد نصف می‌شود؛
+    در نبود فلاد، نرخ به تدریج تا سقف مجاز افزایش می‌یابد.
+
+    همه درخواست‌ها روی حلقه رویداد مشترک client_service اجرا می‌شوند؛ وضعیت با
+    threading.Lock محافظت می‌شود چون estimated_wait از threadهای دیگر (مانند
+    زمان‌بند ارسال) هم خوانده می‌شود.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_INITIAL, min_rate=RATE_LIMIT_MIN, max_rate=RATE_LIMIT_MAX,
+                 burst=RATE_LIMIT_BURST, increase_step=0.05, calm_period=30):
+        self.rate = rate                    # نرخ فعلی (درخواست در ثانیه)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst                  # حداکثر توکن‌های ذخیره شده
+        self.increase_step = increase_step  # افزایش نرخ به ازای هر درخواست موفق
+        self.calm_period = calm_period      # مدت زمان بدون فلاد پیش از افزایش نرخ
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.last_flood = 0.0
+        self.flood_waits = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """افزودن توکن‌ها بر اساس زمان سپری شده"""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def _try_acquire(self):
+        """برداشتن یک توکن در صورت امکان؛ 0 در صورت موفقیت، وگرنه زمان انتظار تا تلاش بعدی"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def estimated_wait(self):
+        """زمان تقریبی انتظار تا در دسترس بودن توکن بعدی (بدون رزرو)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    async def acquire(self):
+        """انتظار تا زمانی که ارسال یک درخواست مجاز باشد
+
+        پس از هر انتظار وضعیت دوباره بررسی می‌شود: اگر در این فاصله FloodWait
+        رسیده باشد (blocked_until جلو رفته یا نرخ کم شده)، درخواست ارسال نمی‌شود
+        و انتظار ادامه می‌یابد.
+        """
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def on_flood_wait(self, seconds):
+        """ثبت FloodWait: توقف همه درخواست‌ها به مدت seconds و کاهش نرخ
+
+        نرخ در هر بازه فلاد فقط یک بار نصف می‌شود: FloodWait درخواست‌هایی که
+        پیش از شروع توقف فعلی ارسال شده بودند و داخل همان بازه می‌رسند، فقط
+        زمان توقف را (در صورت نیاز) تمدید می‌کنند.
+        """
+        with self._lock:
+            now = time.monotonic()
+            new_window = now >= self.blocked_until
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            if new_window:
+                self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            self.last_flood = now
+            self.flood_waits += 1
+            rate = self.rate
+        metrics.flood_waits.inc()
+        metrics.flood_wait_duration.observe(seconds)
+        if new_window:
+            logger.warning(f"محدودیت فلاد: توقف همه درخواست‌ها به مدت {seconds} ثانیه (نرخ جدید: {rate:.2f} درخواست در ثانیه)")
+        else:
+            logger.info(f"محدودیت فلاد ({seconds} ثانیه) در بازه توقف فعلی دریافت شد - نرخ تغییری نکرد")
+
+    def on_success(self):
+        """ثبت درخواست موفق: افزایش تدریجی نرخ در صورت نبود فلاد اخیر"""
+        with self._lock:
+            if time.monotonic() - self.last_flood >= self.calm_period:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    async def call(self, coro_factory, max_flood_wait=None):
+        """اجرای یک درخواست تلگرام تحت کنترل نرخ
+
+        Args:
+            coro_factory: تابعی بدون ورودی که coroutine درخواست را می‌سازد
+            max_flood_wait: اگر زمان FloodWait بیشتر از این مقدار باشد، خطا به
+                فراخواننده بازگردانده می‌شود (پس از ثبت در وضعیت مشترک)
+
+        Returns:
+            نتیجه درخواست
+        """
+        while True:
+            await self.acquire()
+            try:
+                result = await coro_factory()
+            except FloodWaitError as e:
+                self.on_flood_wait(e.seconds)
+                if max_flood_wait is not None and e.seconds > max_flood_wait:
+                    raise
+                continue
+            self.on_success()
+            return result
+
+
+# کنترل‌کننده نرخ حساب اصلی که همه کاربران از آن استفاده می‌کنند (حساب‌های اضافی pool کنترل‌کننده خودشان را دارند)
+governor = RateGovernor()
@@ -0,0 +1,132 @@
+import asyncio
+import collections
+import copy
+import time
+from utils import logger
+from config import SCAN_CACHE_TTL, SCAN_CACHE_SIZE
+import metrics
+
+
+class _CacheEntry:
+    """نتیجه (کامل یا در حال دریافت) یک اسکن در حافظه"""
+
+    __slots__ = ("pages", "complete", "error", "created_at", "changed", "task", "consumers")
+
+    def __init__(self):
+        self.pages = []
+        self.complete = False
+        self.error = None
+        self.created_at = time.monotonic()
+        self.changed = asyncio.Event()
+        self.task = None
+        self.consumers = 0
+
+
+class ScanResultCache:
+    """حافظه مشترک نتایج اسکن برای همه کاربران با اسکن تک‌پرواز (single-flight)
+
+    کلید هر نتیجه شامل شناسه چت resolve شده و بازه پیام‌ها (offset شروع و سقف
+    پیام‌ها) به همراه حالت اسکن است. اگر چند کاربر همزمان یک بازه را بخواهند
+    فقط یک اسکن واقعی اجرا می‌شود و صفحه‌های آن به محض دریافت به همه منتظرها
+    داده می‌شود؛ درخواست‌های بعدی تا پایان مدت اعتبار (TTL) بلافاصله از حافظه
+    پاسخ داده می‌شوند. با پر شدن ظرفیت، قدیمی‌ترین نتیجه استفاده نشده (LRU) حذف
+    می‌شود. همه متدها فقط روی حلقه رویداد مشترک فراخوانی می‌شوند.
+    """
+
+    def __init__(self, ttl=SCAN_CACHE_TTL, max_entries=SCAN_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.complete and time.monotonic() - entry.created_at > self.ttl:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _evict(self):
+        """حذف قدیمی‌ترین نتایج کامل تا رسیدن به ظرفیت (اسکن‌های در حال اجرا حذف نمی‌شوند)"""
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                return
+            if self._entries[key].complete:
+                del self._entries[key]
+
+    def _discard(self, key, entry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    async def _produce(self, key, entry, pages):
+        """اجرای اسکن واقعی و انتشار صفحه‌ها برای همه منتظرها"""
+        try:
+            async for page in pages:
+                entry.pages.append(page)
+                entry.changed.set()
+                entry.changed = asyncio.Event()
+            entry.complete = True
+            entry.created_at = time.monotonic()
+            self._evict()
+        except asyncio.CancelledError:
+            self._discard(key, entry)
+            raise
+        except Exception as e:
+            entry.error = e
+            self._discard(key, entry)
+        finally:
+            entry.changed.set()
+
+    async def iter_pages(self, key, page_source, timings=None):
+        """صفحه‌های اسکن بازه key؛ از حافظه، از اسکن در حال اجرای مشترک یا با شروع اسکن جدید
+
+        Args:
+            key: کلید بازه اسکن
+            page_source: تابعی بدون ورودی که async generator صفحه‌های اسکن واقعی را می‌سازد
+            timings: ScanTimings این مصرف‌کننده؛ اگر نتیجه مشترک باشد منبع آن و زمان انتظار برای
+                صفحه‌ها در آن ثبت می‌شود (اختیاری)
+        """
+        entry = self._lookup(key)
+        shared_timings = None
+        if entry is None:
+            metrics.scan_cache_lookups.inc(result="miss")
+            entry = self._entries[key] = _CacheEntry()
+            entry.task = asyncio.ensure_future(self._produce(key, entry, page_source()))
+            self._evict()
+        else:
+            result = "hit" if entry.complete else "joined"
+            metrics.scan_cache_lookups.inc(result=result)
+            logger.info(f"استفاده از نتیجه اسکن مشترک برای {key[0]} ({len(entry.pages)} صفحه آماده)")
+            if timings is not None:
+                timings.shared = result
+                shared_timings = timings
+        self._entries.move_to_end(key)
+
+        entry.consumers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(entry.pages):
+                    # هر مصرف‌کننده نسخه خودش از ScanPage را می‌گیرد (لیست فایل‌ها فقط خواندنی و مشترک است)
+                    yield copy.copy(entry.pages[index])
+                    index += 1
+                if entry.complete:
+                    return
+                if entry.error is not None:
+                    raise entry.error
+                if shared_timings is None:
+                    await entry.changed.wait()
+                else:
+                    with shared_timings.span("shared"):
+                        await entry.changed.wait()
+        finally:
+            entry.consumers -= 1
+            # اگر همه منتظرها رفته باشند، اسکن ناتمام بی‌استفاده است و متوقف می‌شود
+            if entry.consumers == 0 and not entry.complete and not entry.task.done():
+                entry.task.cancel()
+                self._discard(key, entry)
+
+
+# حافظه مشترک نتایج اسکن (غیرفعال اگر SCAN_CACHE_SIZE صفر باشد)
+scan_cache = ScanResultCache() if SCAN_CACHE_SIZE > 0 else None
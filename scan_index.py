@@ -0,0 +1,133 @@
+import sqlite3
+import threading
+import time
+from models import AudioRef
+from config import SCAN_INDEX_PATH
+
+
+class ScanIndex:
+    """نمایه دائمی اسکن کانال‌ها روی دیسک (SQLite)
+
+    برای هر کانال، فایل‌های موسیقی یافت شده و بازه‌های شناسه‌ای که کامل اسکن
+    شده‌اند ذخیره می‌شوند تا درخواست‌های تکراری فقط پیام‌های جدیدتر و
+    بازه‌های اسکن نشده را از تلگرام دریافت کنند.
+
+    برای هر کانال شناسه قوانین تشخیص و حالت اسکنی که نتایج با آن ذخیره شده‌اند
+    نگه‌داری می‌شود؛ با تغییر آن‌ها نتایج قبلی کانال باطل و حذف می‌شوند.
+    """
+
+    def __init__(self, path=SCAN_INDEX_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio ("
+                " peer_id INTEGER NOT NULL, message_id INTEGER NOT NULL, document_id INTEGER,"
+                " size INTEGER, duration INTEGER, title TEXT, performer TEXT,"
+                " PRIMARY KEY (peer_id, message_id))"
+            )
+            # بازه‌های [low, high] از شناسه پیام‌ها که به طور کامل اسکن شده‌اند
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS scanned_ranges ("
+                " peer_id INTEGER NOT NULL, low INTEGER NOT NULL, high INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL, PRIMARY KEY (peer_id, low))"
+            )
+            # قوانین تشخیص و حالت اسکنی که اطلاعات هر کانال با آن ذخیره شده است
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                " peer_id INTEGER PRIMARY KEY, fingerprint TEXT NOT NULL)"
+            )
+
+    def ensure_fingerprint(self, peer_id, fingerprint):
+        """حذف اطلاعات کانال اگر با قوانین یا حالت اسکن دیگری ذخیره شده باشد
+
+        اطلاعات بدون شناسه ذخیره شده (از نسخه‌های قبلی) هم حذف می‌شوند.
+
+        Returns:
+            True اگر اطلاعات ذخیره شده با شناسه متفاوتی باطل شده باشد
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT fingerprint FROM fingerprints WHERE peer_id = ?", (peer_id,)
+            ).fetchone()
+            if row is not None and row[0] == fingerprint:
+                return False
+            self._delete(peer_id)
+            self._conn.execute("INSERT INTO fingerprints VALUES (?, ?)", (peer_id, fingerprint))
+        return row is not None
+
+    def find_range(self, peer_id, message_id):
+        """بازه اسکن شده‌ای که شامل message_id است را برمی‌گرداند (low, high) یا None"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT low, high FROM scanned_ranges WHERE peer_id = ? AND low <= ? AND high >= ?",
+                (peer_id, message_id, message_id)
+            ).fetchone()
+
+    def next_range_below(self, peer_id, message_id):
+        """بالاترین شناسه اسکن شده کمتر از message_id (یا 0 اگر وجود نداشته باشد)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(high) FROM scanned_ranges WHERE peer_id = ? AND high < ?",
+                (peer_id, message_id)
+            ).fetchone()
+        return row[0] or 0
+
+    def add_page(self, peer_id, audio_refs, low, high):
+        """ثبت فایل‌های یک صفحه و علامت‌گذاری بازه [low, high] به عنوان اسکن شده"""
+        if low > high:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO audio VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (peer_id, ref.message_id, ref.document_id, ref.size, ref.duration, ref.title, ref.performer)
+                    for ref in audio_refs
+                ]
+            )
+            # ادغام با بازه‌های همپوشان یا مجاور
+            rows = self._conn.execute(
+                "SELECT low, high FROM scanned_ranges WHERE peer_id = ? AND low <= ? AND high >= ?",
+                (peer_id, high + 1, low - 1)
+            ).fetchall()
+            for row_low, row_high in rows:
+                low = min(low, row_low)
+                high = max(high, row_high)
+            self._conn.execute(
+                "DELETE FROM scanned_ranges WHERE peer_id = ? AND low <= ? AND high >= ?",
+                (peer_id, high + 1, low - 1)
+            )
+            self._conn.execute(
+                "INSERT INTO scanned_ranges VALUES (?, ?, ?, ?)",
+                (peer_id, low, high, time.time())
+            )
+
+    def iter_audio(self, peer_id, low, before_id, chunk_size=100):
+        """فایل‌های ذخیره شده با low <= شناسه < before_id را از جدید به قدیم در دسته‌های chunk_size برمی‌گرداند"""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT message_id, peer_id, document_id, size, duration, title, performer FROM audio"
+                    " WHERE peer_id = ? AND message_id >= ? AND message_id < ?"
+                    " ORDER BY message_id DESC LIMIT ?",
+                    (peer_id, low, before_id, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [AudioRef(*row) for row in rows]
+            before_id = rows[-1][0]
+
+    def _delete(self, peer_id):
+        self._conn.execute("DELETE FROM audio WHERE peer_id = ?", (peer_id,))
+        self._conn.execute("DELETE FROM scanned_ranges WHERE peer_id = ?", (peer_id,))
+        self._conn.execute("DELETE FROM fingerprints WHERE peer_id = ?", (peer_id,))
+
+    def clear(self, peer_id):
+        """حذف همه اطلاعات ذخیره شده یک کانال"""
+        with self._lock, self._conn:
+            self._delete(peer_id)
+
+
+# نمایه مشترک برای کل فرآیند (غیرفعال اگر SCAN_INDEX_PATH خالی باشد)
+scan_index = ScanIndex() if SCAN_INDEX_PATH else None
@@ -0,0 +1,144 @@
+import collections
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from utils import logger
+from config import SCAN_TRACE_DIR
+
+# مراحل اسکن و عنوان نمایشی آن‌ها (به ترتیب نمایش)
+PHASES = (
+    ("network", "انتظار شبکه (درخواست تلگرام)"),
+    ("pacing", "انتظار کنترل نرخ و فلاد"),
+    ("classification", "تشخیص فایل‌های صوتی"),
+    ("callback", "کال‌بک‌های صفحه و پیشرفت"),
+    ("backoff", "تاخیر تلاش مجدد"),
+    ("shared", "انتظار برای اسکن مشترک"),
+)
+
+# منبع نتیجه اسکن مشترک -> عنوان نمایشی
+SHARED_SOURCES = {
+    "hit": "از حافظه نتایج اسکن",
+    "joined": "از اسکن در حال اجرای کاربر دیگر",
+}
+
+# حداکثر رویدادهای نگه‌داری شده برای فایل trace هر اسکن
+MAX_TRACE_EVENTS = 100000
+
+# بازه محاسبه سرعت لحظه‌ای (ثانیه)
+RATE_WINDOW = 10
+
+
+class ScanTimings:
+    """زمان‌سنجی سبک مراحل یک کار اسکن
+
+    برای هر مرحله مجموع زمان و تعداد دفعات نگه‌داری می‌شود. در اسکن موازی
+    (چند بخش همزمان) زمان مراحل با هم همپوشانی دارند و مجموع آن‌ها می‌تواند از
+    زمان کل بیشتر باشد. اگر SCAN_TRACE_DIR تعیین شده باشد، رویدادها برای ساخت
+    فایل trace (قالب Chrome trace / Perfetto) هم ذخیره می‌شوند.
+    اگر نتیجه از اسکن مشترک (scan_cache) گرفته شود، shared منبع آن را نشان
+    می‌دهد و زمان انتظار برای صفحه‌ها در مرحله shared ثبت می‌شود؛ زمان شبکه و
+    کنترل نرخ فقط برای کاربری ثبت می‌شود که اسکن واقعی را اجرا کرده است.
+    """
+
+    def __init__(self, trace=bool(SCAN_TRACE_DIR)):
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.totals = dict.fromkeys((name for name, _ in PHASES), 0.0)
+        self.counts = dict.fromkeys(self.totals, 0)
+        self.processed = 0
+        self.shared = None  # "hit" یا "joined" اگر نتیجه از اسکن مشترک گرفته شده باشد
+        self._samples = collections.deque([(self.started_at, 0)])
+        self._events = [] if trace else None
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, started=None):
+        """ثبت مدت یک مرحله"""
+        with self._lock:
+            self.totals[phase] += seconds
+            self.counts[phase] += 1
+            if self._events is not None and len(self._events) < MAX_TRACE_EVENTS:
+                start = (started if started is not None else time.monotonic() - seconds) - self.started_at
+                self._events.append((phase, start, seconds))
+
+    @contextmanager
+    def span(self, phase):
+        """زمان‌سنجی یک بخش از کد به عنوان مرحله phase"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(phase, time.monotonic() - started, started)
+
+    def set_progress(self, processed):
+        """ثبت تعداد پیام‌های پردازش شده برای محاسبه سرعت"""
+        now = time.monotonic()
+        with self._lock:
+            self.processed = processed
+            self._samples.append((now, processed))
+            while len(self._samples) > 2 and now - self._samples[1][0] > RATE_WINDOW:
+                self._samples.popleft()
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def current_rate(self):
+        """سرعت پردازش در چند ثانیه اخیر (پیام در ثانیه)"""
+        with self._lock:
+            (first_time, first_count), (last_time, last_count) = self._samples[0], self._samples[-1]
+        if self.finished_at is None:
+            last_time = time.monotonic()
+        duration = last_time - first_time
+        return (last_count - first_count) / duration if duration > 0 else 0.0
+
+    def format_summary(self):
+        """متن خلاصه زمان مراحل برای نمایش به کاربر"""
+        elapsed = self.elapsed
+        lines = [f"⏱ *زمان‌بندی اسکن* ({elapsed:.1f} ثانیه، {self.processed} پیام):"]
+        if self.shared:
+            lines.append(f"  • ♻️ نتیجه {SHARED_SOURCES[self.shared]} (بدون درخواست جدید به تلگرام)")
+        for name, title in PHASES:
+            seconds = self.totals[name]
+            if not self.counts[name]:
+                continue
+            share = seconds / elapsed * 100 if elapsed > 0 else 0
+            lines.append(f"  • {title}: {seconds:.1f} ثانیه ({share:.0f}%)")
+        if sum(self.totals.values()) > elapsed * 1.05:
+            lines.append("  (در اسکن موازی زمان مراحل با هم همپوشانی دارند)")
+        if self.finished_at is None:
+            lines.append(f"  • سرعت فعلی: {self.current_rate:.0f} پیام در ثانیه")
+        else:
+            lines.append(f"  • سرعت میانگین: {self.processed / elapsed if elapsed > 0 else 0:.0f} پیام در ثانیه")
+        return "\n".join(lines)
+
+    def dump_trace(self, name, directory=SCAN_TRACE_DIR):
+        """ذخیره رویدادهای اسکن به صورت فایل trace؛ مسیر فایل یا None"""
+        if self._events is None or not directory:
+            return None
+        with self._lock:
+            events = list(self._events)
+        phase_ids = {phase: index for index, (phase, _) in enumerate(PHASES)}
+        trace = {
+            "traceEvents": [
+                {"name": phase, "ph": "X", "pid": 1, "tid": phase_ids[phase],
+                 "ts": round(start * 1e6), "dur": round(duration * 1e6)}
+                for phase, start, duration in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+        path = os.path.join(directory, f"scan_{name}_{int(time.time())}.json")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(trace, f)
+        except OSError as e:
+            logger.error(f"خطا در ذخیره فایل trace اسکن: {e}")
+            return None
+        logger.info(f"فایل trace اسکن در {path} ذخیره شد")
+        return path
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from utils import logger
+from config import SESSION_IDLE_TTL, SESSION_MEMORY_BUDGET, SESSION_SPILL_DIR, SESSION_SPILL_TTL
+import metrics
+
+
+class SessionStore:
+    """نگه‌داری محدود داده‌های جلسه کاربران در حافظه
+
+    هر جلسه زمان آخرین دسترسی و حجم تقریبی حافظه‌اش را دارد. جلسه‌هایی که
+    بیش از SESSION_IDLE_TTL بدون استفاده مانده‌اند، و در صورت عبور مجموع حافظه
+    از SESSION_MEMORY_BUDGET قدیمی‌ترین جلسه‌های بیکار، از حافظه خارج می‌شوند:
+    منابع آن‌ها آزاد شده و وضعیت فشرده‌شان روی دیسک نوشته می‌شود تا اگر کاربر
+    برگشت، با اولین دسترسی دوباره بارگذاری شوند. جلسه‌های مشغول (اسکن یا ارسال
+    در حال اجرا) هیچ‌گاه خارج نمی‌شوند.
+
+    رفتار وابسته به محتوای جلسه از طریق توابع زیر تعیین می‌شود:
+        dump(session) -> dict قابل ذخیره با json (یا None برای عدم ذخیره)
+        load(user_id, state) -> جلسه بازسازی شده
+        release(session): آزادسازی منابع جلسه
+        is_busy(session) -> آیا جلسه در حال استفاده است
+        measure(session) -> حجم تقریبی حافظه جلسه (بایت)
+    """
+
+    def __init__(self, dump, load, release, is_busy, measure, idle_ttl=SESSION_IDLE_TTL,
+                 memory_budget=SESSION_MEMORY_BUDGET, spill_dir=SESSION_SPILL_DIR, spill_ttl=SESSION_SPILL_TTL):
+        self._dump = dump
+        self._load = load
+        self._release = release
+        self._is_busy = is_busy
+        self._measure = measure
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.spill_ttl = spill_ttl
+        self._sessions = {}
+        self._last_access = {}
+        self._sizes = {}  # حجم اندازه‌گیری شده در آخرین بررسی
+        self._lock = threading.RLock()
+
+    def _spill_path(self, user_id):
+        return os.path.join(self.spill_dir, f"{user_id}.json")
+
+    def _remove_spill(self, user_id):
+        if self.spill_dir:
+            try:
+                os.remove(self._spill_path(user_id))
+            except FileNotFoundError:
+                pass
+
+    def _reload(self, user_id):
+        """بارگذاری جلسه ذخیره شده روی دیسک (در صورت وجود)"""
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(user_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"خطا در خواندن جلسه ذخیره شده کاربر {user_id}: {e}")
+            self._remove_spill(user_id)
+            return None
+
+        session = self._load(user_id, state)
+        os.remove(path)
+        self._sessions[user_id] = session
+        self._last_access[user_id] = time.monotonic()
+        logger.info(f"جلسه کاربر {user_id} از دیسک بارگذاری شد")
+        return session
+
+    def get(self, user_id, default=None):
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = self._reload(user_id)
+                if session is None:
+                    return default
+            self._last_access[user_id] = time.monotonic()
+            return session
+
+    def __getitem__(self, user_id):
+        session = self.get(user_id)
+        if session is None:
+            raise KeyError(user_id)
+        return session
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __setitem__(self, user_id, session):
+        with self._lock:
+            self._sessions[user_id] = session
+            self._last_access[user_id] = time.monotonic()
+            self._remove_spill(user_id)
+
+    def pop(self, user_id, default=None):
+        """حذف کامل جلسه (از حافظه و دیسک) بدون آزادسازی منابع"""
+        with self._lock:
+            self._last_access.pop(user_id, None)
+            self._sizes.pop(user_id, None)
+            self._remove_spill(user_id)
+            return self._sessions.pop(user_id, default)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def memory_usage(self, user_id):
+        """حجم تقریبی حافظه جلسه کاربر (بایت)؛ 0 اگر جلسه در حافظه نباشد"""
+        with self._lock:
+            session = self._sessions.get(user_id)
+        return self._measure(session) if session is not None else 0
+
+    def report(self):
+        """[(شناسه کاربر, حجم تقریبی حافظه, ثانیه‌های بیکاری)] به ترتیب حجم"""
+        now = time.monotonic()
+        with self._lock:
+            sessions = list(self._sessions.items())
+            last_access = dict(self._last_access)
+        usage = [
+            (user_id, self._measure(session), now - last_access.get(user_id, now))
+            for user_id, session in sessions
+        ]
+        return sorted(usage, key=lambda item: item[1], reverse=True)
+
+    def _evict(self, user_id, reason):
+        """خارج کردن یک جلسه از حافظه: ذخیره وضعیت فشرده روی دیسک و آزادسازی منابع"""
+        session = self._sessions.pop(user_id)
+        self._last_access.pop(user_id, None)
+        size = self._sizes.pop(user_id, 0)
+
+        spilled = False
+        if self.spill_dir:
+            state = self._dump(session)
+            if state is not None:
+                try:
+                    os.makedirs(self.spill_dir, exist_ok=True)
+                    temp_path = f"{self._spill_path(user_id)}.tmp"
+                    with open(temp_path, "w", encoding="utf-8") as f:
+                        json.dump(state, f, ensure_ascii=False)
+                    os.replace(temp_path, self._spill_path(user_id))
+                    spilled = True
+                except OSError as e:
+                    logger.error(f"خطا در ذخیره جلسه کاربر {user_id} روی دیسک: {e}")
+
+        try:
+            self._release(session)
+        except Exception as e:
+            logger.error(f"خطا در آزادسازی منابع جلسه کاربر {user_id}: {e}")
+        metrics.sessions_evicted.inc(reason=reason)
+        logger.info(
+            f"جلسه کاربر {user_id} ({size // 1024} KB) به دلیل {reason} از حافظه خارج شد"
+            f"{' و روی دیسک ذخیره شد' if spilled else ''}"
+        )
+
+    def sweep(self):
+        """خارج کردن جلسه‌های بیکار منقضی و رعایت سقف حافظه؛ تعداد جلسه‌های خارج شده"""
+        now = time.monotonic()
+        evicted = 0
+        with self._lock:
+            idle = []
+            for user_id, session in list(self._sessions.items()):
+                self._sizes[user_id] = self._measure(session)
+                if not self._is_busy(session):
+                    idle.append(user_id)
+
+            # قدیمی‌ترین جلسه‌ها اول
+            idle.sort(key=lambda user_id: self._last_access.get(user_id, 0))
+            for user_id in idle:
+                if now - self._last_access.get(user_id, now) > self.idle_ttl:
+                    self._evict(user_id, "idle")
+                    evicted += 1
+
+            total = sum(self._sizes.values())
+            for user_id in idle:
+                if total <= self.memory_budget:
+                    break
+                if user_id in self._sessions:
+                    total -= self._sizes.get(user_id, 0)
+                    self._evict(user_id, "memory")
+                    evicted += 1
+
+            metrics.session_memory.set(sum(self._sizes.values()))
+        self._cleanup_spill()
+        return evicted
+
+    def _cleanup_spill(self):
+        """حذف جلسه‌های ذخیره شده روی دیسک که بیش از SESSION_SPILL_TTL از آن‌ها گذشته است"""
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return
+        cutoff = time.time() - self.spill_ttl
+        for entry in os.scandir(self.spill_dir):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# تنظیمات پیش از import ماژول‌ها: هیچ فایلی در پوشه پروژه ساخته نشود و سرور معیارها اجرا نشود
+_TEMP_DIR = tempfile.mkdtemp(prefix="tg_music_tests_")
+os.environ["METRICS_PORT"] = "0"
+os.environ["SCAN_INDEX_PATH"] = ""
+os.environ["SCAN_CACHE_SIZE"] = "0"
+os.environ["ENTITY_CACHE_PATH"] = ""
+os.environ["FORWARD_LEDGER_PATH"] = ""
+os.environ["FORWARD_JOURNAL_PATH"] = os.path.join(_TEMP_DIR, "forward_journal.log")
+# کنترل‌کننده نرخ مشترک (governor) سرعت کلاینت‌های جعلی را محدود نکند
+os.environ["RATE_LIMIT_INITIAL"] = os.environ["RATE_LIMIT_MAX"] = os.environ["RATE_LIMIT_BURST"] = "1000000"
+os.environ["SESSION_SPILL_DIR"] = os.path.join(_TEMP_DIR, "session_spill")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from telethon.errors import FloodWaitError
+from accounts import Account, AccountPool
+from rate_governor import RateGovernor
+
+
+class FloodingClient:
+    """کلاینت ساختگی که اولین ارسال را با FloodWait رد می‌کند"""
+
+    def __init__(self, flood_seconds):
+        self.flood_seconds = flood_seconds
+        self.calls = 0
+
+    async def forward_messages(self, target, message_ids, from_peer=None):
+        self.calls += 1
+        if self.calls == 1:
+            raise FloodWaitError(None, capture=self.flood_seconds)
+        return message_ids
+
+
+def test_forward_flood_wait_reaches_account_governor():
+    account = Account("main", FloodingClient(30), RateGovernor(rate=10))
+
+    async def forward():
+        return await account.call(
+            lambda client: client.forward_messages("@target", [1, 2]), max_flood_wait=0, target="@target"
+        )
+
+    with pytest.raises(FloodWaitError):
+        asyncio.run(forward())
+    # FloodWait ارسال هم مقصد و هم کل حساب را متوقف می‌کند
+    assert account.governor.estimated_wait() > 25
+    assert account.forward_governor("@target").estimated_wait() > 25
+    assert account.estimated_wait("@other") > 25
+
+
+def test_forward_is_limited_by_account_budget():
+    account = Account("main", FloodingClient(0), RateGovernor(rate=10, burst=1))
+    account.governor.on_flood_wait(30)  # حساب به دلیل یک درخواست دیگر در FloodWait است
+    pool = AccountPool()
+    pool.add(account)
+    assert pool.estimated_wait("@target") > 25
@@ -0,0 +1,45 @@
+import pytest
+from batch_store import BatchStore, BatchView
+
+
+def test_extend_fills_last_batch_before_opening_new_ones():
+    store = BatchStore(list(range(5)), batch_size=4)
+    assert len(store) == 2 and store.batch_length(1) == 1
+
+    store.extend(range(5, 10))
+    assert len(store) == 3
+    assert [list(batch) for batch in store] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert store.file_count == 10
+    assert store.batch_length(2) == 2 and store.batch_length(3) == 0
+
+
+def test_views_share_items_and_keep_their_bounds():
+    items = list(range(6))
+    store = BatchStore(items, batch_size=4)
+    last = store[-1]
+    assert isinstance(last, BatchView) and last._items is items
+    assert (len(last), last[0], last[-1], last[0:1]) == (2, 4, 5, [4])
+
+    # فایل‌هایی که بعداً به دسته آخر اضافه شوند در نمای در حال ارسال ظاهر نمی‌شوند
+    store.extend([6, 7])
+    assert list(last) == [4, 5]
+    assert list(store[1]) == [4, 5, 6, 7]
+
+
+def test_out_of_range_indexes_raise():
+    store = BatchStore(list(range(3)), batch_size=2)
+    with pytest.raises(IndexError):
+        store[2]
+    with pytest.raises(IndexError):
+        store[0][2]
+    with pytest.raises(ValueError):
+        BatchStore([], batch_size=0)
+
+
+def test_page_clamps_to_valid_range():
+    store = BatchStore(list(range(25)), batch_size=2)  # 13 دسته
+    assert store.page(0, 5) == (0, 3, range(0, 5))
+    assert store.page(2, 5) == (2, 3, range(10, 13))
+    assert store.page(9, 5) == (2, 3, range(10, 13))
+    assert store.page(-1, 5) == (0, 3, range(0, 5))
+    assert BatchStore([], batch_size=2).page(0, 5) == (0, 1, range(0, 0))
@@ -0,0 +1,64 @@
+from telethon.tl.types import (
+    Message, PeerChannel, MessageMediaDocument, Document, DocumentAttributeAudio, DocumentAttributeFilename
+)
+from classifier import AudioClassifier
+from models import AudioRef
+
+CHANNEL_ID = 1234
+
+
+def _message(message_id, mime_type="audio/mpeg", duration=180, size=4_000_000, voice=False, audio=True):
+    attributes = [DocumentAttributeFilename(file_name=f"track_{message_id}.mp3")]
+    if audio:
+        attributes.append(DocumentAttributeAudio(duration=duration, voice=voice, title=f"Track {message_id}",
+                                                 performer="Artist"))
+    document = Document(id=1000 + message_id, access_hash=0, file_reference=b"", date=None, mime_type=mime_type,
+                        size=size, dc_id=2, attributes=attributes)
+    return Message(id=message_id, peer_id=PeerChannel(CHANNEL_ID), date=None, message="",
+                   media=MessageMediaDocument(document=document))
+
+
+def _ids(refs):
+    return [ref.message_id for ref in refs]
+
+
+def test_page_is_classified_like_the_per_message_path():
+    classifier = AudioClassifier(min_duration=0, max_duration=0, min_size=0, max_size=0, mime_types=None)
+    page = [
+        _message(1),
+        Message(id=2, peer_id=PeerChannel(CHANNEL_ID), date=None, message="متن"),
+        _message(3, audio=False),
+        _message(4, mime_type="audio/ogg", voice=True),
+        _message(5, mime_type="audio/flac"),
+    ]
+    refs = classifier.classify_page(page)
+    assert _ids(refs) == [1, 5]
+    expected = [AudioRef.from_message(message) for message in page if classifier.is_audio(message)]
+    assert [ref.as_tuple() for ref in refs] == [ref.as_tuple() for ref in expected]
+    assert refs[0].peer_id == -1000000000000 - CHANNEL_ID
+
+
+def test_mime_type_rule():
+    classifier = AudioClassifier(min_duration=0, max_duration=0, min_size=0, max_size=0,
+                                 mime_types=["audio/mpeg", "audio/flac"])
+    page = [_message(1), _message(2, mime_type="audio/x-wav"), _message(3, mime_type="audio/flac")]
+    assert _ids(classifier.classify_page(page)) == [1, 3]
+
+
+def test_duration_and_size_rules():
+    classifier = AudioClassifier(min_duration=60, max_duration=600, min_size=1_000_000, max_size=0, mime_types=None)
+    page = [
+        _message(1, duration=30),
+        _message(2, duration=60),
+        _message(3, duration=601),
+        _message(4, size=500_000),
+        _message(5, size=50_000_000),
+    ]
+    assert _ids(classifier.classify_page(page)) == [2, 5]
+
+
+def test_voice_notes_are_excluded_only_when_configured():
+    page = [_message(1, mime_type="audio/ogg", voice=True), _message(2)]
+    rules = dict(min_duration=0, max_duration=0, min_size=0, max_size=0, mime_types=None)
+    assert _ids(AudioClassifier(exclude_voice=True, **rules).classify_page(page)) == [2]
+    assert _ids(AudioClassifier(exclude_voice=False, **rules).classify_page(page)) == [1, 2]
@@ -0,0 +1,29 @@
+import asyncio
+import client_service
+from client_service import ClientService
+
+
+class UnreachableClient:
+    """TelegramClient ساختگی که اتصال آن با خطا مواجه می‌شود"""
+
+    instances = []
+
+    def __init__(self, name, api_id, api_hash, **kwargs):
+        self.name = name
+        self.disconnected = False
+        UnreachableClient.instances.append(self)
+
+    async def connect(self):
+        raise ConnectionError("network unreachable")
+
+    async def disconnect(self):
+        self.disconnected = True
+
+
+def test_failed_extra_account_is_disconnected(monkeypatch):
+    monkeypatch.setattr(client_service, "TelegramClient", UnreachableClient)
+    service = ClientService(session_name="main")
+
+    asyncio.run(service._connect_extra_account("extra"))
+    assert service.pool.accounts == []
+    assert [client.disconnected for client in UnreachableClient.instances] == [True]
@@ -0,0 +1,40 @@
+from dedup import AudioDeduplicator
+from models import AudioRef
+
+
+def _ref(message_id, document_id, title=None, performer=None, duration=0, size=0):
+    return AudioRef(message_id, -1001, document_id, size, duration, title, performer)
+
+
+def test_document_mode_drops_repeated_documents_across_pages():
+    deduplicator = AudioDeduplicator("document")
+    first = deduplicator.filter([_ref(1, 10), _ref(2, 11), _ref(3, 10)])
+    second = deduplicator.filter([_ref(4, 11), _ref(5, 12)])
+    assert [ref.message_id for ref in first + second] == [1, 2, 5]
+    assert deduplicator.dropped == 2
+
+
+def test_metadata_mode_drops_reuploads():
+    deduplicator = AudioDeduplicator("metadata")
+    refs = [
+        _ref(1, 10, "Song", "Artist", 200, 5000),
+        _ref(2, 20, " song ", "ARTIST", 200, 5000),  # همان آهنگ با سند دیگر
+        _ref(3, 30, "Song", "Artist", 201, 5000),
+        _ref(4, 40),  # بدون عنوان: فقط شناسه سند بررسی می‌شود
+    ]
+    assert [ref.message_id for ref in deduplicator.filter(refs)] == [1, 3, 4]
+    assert AudioDeduplicator("document").filter(refs) == refs
+
+
+def test_off_mode_keeps_everything():
+    deduplicator = AudioDeduplicator("off")
+    refs = [_ref(1, 10), _ref(2, 10)]
+    assert deduplicator.filter(refs) == refs
+    assert deduplicator.dropped == 0
+
+
+def test_memory_usage_grows_with_keys():
+    deduplicator = AudioDeduplicator("metadata")
+    empty = deduplicator.memory_usage()
+    deduplicator.filter([_ref(i, 1000 + i, f"Song {i}") for i in range(1000)])
+    assert deduplicator.memory_usage() > empty + 1000 * 2 * 28
@@ -0,0 +1,167 @@
+import pytest
+from telethon.errors import BadRequestError, ServerError
+from telethon.tl.functions.messages import SearchRequest
+from benchmark import FakeTelegramClient, FakeClientService, BENCH_CHANNEL_ID
+from downloader import MusicDownloader, _split_forward_chunks
+from models import AudioRef
+
+MESSAGES = 4000
+SHARDS = 4
+# مرز بالای بخش دوم در اسکن موازی 4000 پیام با 4 بخش
+SECOND_SHARD_HIGH = MESSAGES + 1 - MESSAGES // SHARDS
+
+
+class FailingSearchClient(FakeTelegramClient):
+    """کلاینت جعلی که اولین جستجوی یک offset مشخص را یک بار با خطای error_factory رد می‌کند"""
+
+    def __init__(self, fail_offset, error_factory, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_offset = fail_offset
+        self.error_factory = error_factory
+        self.failed = False
+        self.history_requests = 0
+
+    async def __call__(self, request):
+        if isinstance(request, SearchRequest):
+            if not self.failed and (self.fail_offset is None or request.offset_id == self.fail_offset):
+                self.failed = True
+                self.requests += 1
+                raise self.error_factory(request)
+        elif request.limit > 1:
+            self.history_requests += 1
+        return await super().__call__(request)
+
+
+class ForwardClient(FakeTelegramClient):
+    """کلاینت جعلی که فراخوانی‌های forward_messages را ثبت می‌کند و ارسال گروهی شامل bad_id را رد می‌کند"""
+
+    def __init__(self, bad_id=None, **kwargs):
+        super().__init__(**kwargs)
+        self.bad_id = bad_id
+        self.forward_calls = []
+
+    async def forward_messages(self, entity, messages, from_peer=None):
+        self.forward_calls.append(messages)
+        ids = messages if isinstance(messages, list) else [messages]
+        if self.bad_id in ids:
+            raise BadRequestError(None, "MESSAGE_ID_INVALID")
+        return await super().forward_messages(entity, messages, from_peer)
+
+
+def _scan(client, shards=SHARDS, mode="search", max_messages=None, start_offset_id=0):
+    service = FakeClientService(client)
+    downloader = MusicDownloader(service=service)
+    assert downloader.connect()
+
+    async def scan():
+        refs, pages = [], []
+        async for page in downloader.iter_music_files(f"bench:{BENCH_CHANNEL_ID}", max_messages, start_offset_id,
+                                                      mode=mode, shards=shards):
+            refs.extend(page.audio_files)
+            pages.append(page)
+        return refs, pages
+
+    try:
+        return downloader._run(scan())
+    finally:
+        service.stop()
+
+
+def test_transient_error_on_later_shard_is_retried():
+    client = FailingSearchClient(SECOND_SHARD_HIGH, lambda request: ServerError(request, "INTERNAL"),
+                                 message_count=MESSAGES)
+    refs, pages = _scan(client)
+    message_ids = [ref.message_id for ref in refs]
+    assert client.failed
+    assert len(message_ids) == len(set(message_ids)) == len(client._audio_ids)
+    assert client.history_requests == 0
+    assert not pages[-1].has_more
+
+
+def test_search_rejected_after_pages_does_not_rescan_history():
+    client = FailingSearchClient(SECOND_SHARD_HIGH, lambda request: BadRequestError(request, "SEARCH_NOT_AVAILABLE"),
+                                 message_count=MESSAGES)
+    refs, pages = _scan(client)
+    message_ids = [ref.message_id for ref in refs]
+    assert len(message_ids) == len(set(message_ids))
+    assert client.history_requests == 0
+    # اسکن در آخرین offset پیوسته متوقف می‌شود و قابل ادامه است
+    assert pages[-1].has_more
+    assert SECOND_SHARD_HIGH <= pages[-1].offset_id < MESSAGES
+
+
+@pytest.mark.parametrize("shards", [1, SHARDS])
+def test_unsupported_search_falls_back_to_history(shards):
+    client = FailingSearchClient(None, lambda request: BadRequestError(request, "SEARCH_NOT_AVAILABLE"),
+                                 message_count=MESSAGES)
+    refs, pages = _scan(client, shards)
+    message_ids = [ref.message_id for ref in refs]
+    assert client.history_requests > 0
+    assert len(message_ids) == len(set(message_ids)) == len(client._audio_ids)
+    assert not pages[-1].has_more
+
+
+def test_search_finds_same_audio_as_history_with_fewer_requests():
+    history_client = FakeTelegramClient(message_count=MESSAGES)
+    search_client = FakeTelegramClient(message_count=MESSAGES)
+    history_refs, _ = _scan(history_client, shards=1, mode="history")
+    search_refs, search_pages = _scan(search_client, shards=1, mode="search")
+
+    assert [ref.message_id for ref in search_refs] == [ref.message_id for ref in history_refs]
+    # فیلتر سمت سرور فقط صفحه‌های موسیقی را برمی‌گرداند (پیام‌های voice هم حذف می‌شوند)
+    assert len(search_refs) == len(search_client._audio_ids)
+    assert search_client.requests * 2 < history_client.requests
+    # محدوده شناسه‌های پوشش داده شده (تا جدیدترین فایل موسیقی) پردازش شده شمرده می‌شود
+    assert search_pages[-1].processed == search_client._audio_ids[-1] and not search_pages[-1].has_more
+
+
+def test_search_respects_message_limit_and_resumes_from_offset():
+    client = FakeTelegramClient(message_count=MESSAGES)
+    first_refs, first_pages = _scan(client, shards=1, max_messages=1000)
+    assert first_pages[-1].has_more and first_pages[-1].offset_id == MESSAGES - 999
+    assert first_pages[-1].processed == 1000
+    assert all(ref.message_id > MESSAGES - 1000 for ref in first_refs)
+
+    rest_refs, rest_pages = _scan(client, shards=1, start_offset_id=first_pages[-1].offset_id)
+    assert not rest_pages[-1].has_more
+    message_ids = [ref.message_id for ref in first_refs + rest_refs]
+    assert message_ids == sorted(client._audio_ids, reverse=True)
+
+
+def _refs(message_ids, peer_id=-1000000000000 - BENCH_CHANNEL_ID):
+    return [AudioRef(message_id, peer_id, document_id=message_id) for message_id in message_ids]
+
+
+def _forward(client, refs):
+    service = FakeClientService(client)
+    downloader = MusicDownloader(service=service)
+    assert downloader.connect()
+    try:
+        return downloader.forward_chunk(refs, "@target")
+    finally:
+        service.stop()
+
+
+def test_forward_chunks_are_split_by_size_and_source_chat():
+    refs = _refs(range(1, 151)) + _refs([7, 8], peer_id=-1002) + _refs([9])
+    chunks = list(_split_forward_chunks(refs, 100))
+    assert [len(chunk) for chunk in chunks] == [100, 50, 2, 1]
+    assert all(len({ref.peer_id for ref in chunk}) == 1 for chunk in chunks)
+    assert [ref for chunk in chunks for ref in chunk] == refs
+
+
+def test_forward_chunk_sends_one_request_per_hundred_messages():
+    client = ForwardClient(message_count=10)
+    results = _forward(client, _refs(range(1, 251)))
+    assert results == [True] * 250
+    assert [len(call) for call in client.forward_calls] == [100, 100, 50]
+    assert client.forwarded == 250
+
+
+def test_failed_bulk_forward_falls_back_to_single_messages():
+    client = ForwardClient(bad_id=3, message_count=10)
+    results = _forward(client, _refs(range(1, 6)))
+    # فقط پیام مشکل‌دار از دست می‌رود
+    assert results == [True, True, False, True, True]
+    assert client.forward_calls[0] == [1, 2, 3, 4, 5]
+    assert client.forward_calls[1:] == [1, 2, 3, 4, 5]
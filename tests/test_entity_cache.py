@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from telethon.tl.types import Channel, ChatPhotoEmpty, InputPeerChannel
+import downloader as downloader_module
+from benchmark import FakeTelegramClient, FakeClientService, BENCH_CHANNEL_ID
+from downloader import MusicDownloader
+from entity_cache import EntityCache, normalize_chat_input
+
+USERNAME = "bench_channel"
+
+
+def _channel(access_hash=7):
+    return Channel(id=BENCH_CHANNEL_ID, title="Bench", photo=ChatPhotoEmpty(), date=None,
+                   access_hash=access_hash, username=USERNAME)
+
+
+class ChannelClient(FakeTelegramClient):
+    """کلاینت جعلی که کانال را با access_hash و نام کاربری برمی‌گرداند و resolveها را می‌شمارد"""
+
+    def __init__(self, access_hash=7, **kwargs):
+        super().__init__(message_count=10, **kwargs)
+        self.access_hash = access_hash
+        self.entity_lookups = 0
+        self.input_lookups = 0
+
+    async def get_entity(self, chat_id):
+        self.entity_lookups += 1
+        return _channel(self.access_hash)
+
+    async def get_input_entity(self, peer):
+        self.input_lookups += 1
+        return InputPeerChannel(BENCH_CHANNEL_ID, self.access_hash)
+
+
+def test_chat_input_is_normalized():
+    for chat_id in ("@Bench_Channel", "bench_channel", "https://t.me/bench_channel/12", "t.me/s/bench_channel",
+                    "tg://resolve?domain=bench_channel"):
+        assert normalize_chat_input(chat_id) == "@bench_channel"
+    assert normalize_chat_input("https://t.me/c/123/4") == "-100123"
+    assert normalize_chat_input("https://t.me/joinchat/AbC") == "+AbC"
+    assert normalize_chat_input(" -100123 ") == "-100123"
+    assert normalize_chat_input("not a chat!") is None
+
+
+def test_resolve_uses_cache_until_ttl_expires(tmp_path):
+    cache = EntityCache(str(tmp_path / "entities.db"), ttl=3600)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return _channel()
+
+    async def resolve_twice():
+        first = await cache.resolve("main", "@bench_channel", fetch)
+        second = await cache.resolve("main", "https://t.me/bench_channel", fetch)
+        return first, second
+
+    first, second = asyncio.run(resolve_twice())
+    assert len(calls) == 1
+    assert second == InputPeerChannel(BENCH_CHANNEL_ID, 7)
+    assert cache.username_for(-1000000000000 - BENCH_CHANNEL_ID) == USERNAME
+    # access_hash برای هر حساب جداگانه است
+    assert cache.get("other", "@bench_channel") is None
+
+    cache.ttl = 0
+    asyncio.run(cache.resolve("main", "@bench_channel", fetch))
+    assert len(calls) == 2
+
+
+def test_expired_entry_is_used_when_refresh_fails(tmp_path):
+    cache = EntityCache(str(tmp_path / "entities.db"), ttl=0)
+    cache.put("main", "@bench_channel", _channel())
+
+    async def failing_fetch():
+        raise ConnectionError("offline")
+
+    peer = asyncio.run(cache.resolve("main", "@bench_channel", failing_fetch))
+    assert peer == InputPeerChannel(BENCH_CHANNEL_ID, 7)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.resolve("main", "@another_channel", failing_fetch))
+
+
+def test_concurrent_resolves_share_one_fetch(tmp_path):
+    cache = EntityCache(str(tmp_path / "entities.db"), ttl=3600)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return _channel()
+
+    async def resolve_many():
+        return await asyncio.gather(*(cache.resolve("main", "@bench_channel", fetch) for _ in range(5)))
+
+    results = asyncio.run(resolve_many())
+    assert len(calls) == 1
+    assert all(peer == results[0] for peer in results)
+
+
+def test_only_extra_accounts_resolve_cached_chat_again(tmp_path, monkeypatch):
+    cache = EntityCache(str(tmp_path / "entities.db"), ttl=3600)
+    cache.put("benchmark", "@bench_channel", _channel(access_hash=7))  # resolve ذخیره شده از اجرای قبلی
+    monkeypatch.setattr(downloader_module, "entity_cache", cache)
+    primary, extra = ChannelClient(access_hash=7), ChannelClient(access_hash=8)
+    service = FakeClientService(primary, [extra])
+    downloader = MusicDownloader(service=service)
+    assert downloader.connect()
+    primary_account, extra_account = service.pool.accounts
+
+    async def resolve_and_lookup():
+        entity = await downloader._get_entity_async("@bench_channel")
+        return entity, await primary_account.input_peer(entity), await extra_account.input_peer(entity)
+
+    try:
+        entity, primary_peer, extra_peer = downloader._run(resolve_and_lookup())
+    finally:
+        service.stop()
+
+    assert primary.entity_lookups == 0 and entity == InputPeerChannel(BENCH_CHANNEL_ID, 7)
+    # حساب اصلی از input peer ذخیره شده استفاده می‌کند و فقط حساب اضافی با نام کاربری resolve می‌کند
+    assert primary.input_lookups == 0 and primary_peer.access_hash == 7
+    assert extra.input_lookups == 1 and extra_peer.access_hash == 8
@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+from forward_journal import ForwardJournal
+from models import AudioRef
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _refs(*message_ids):
+    return [AudioRef(message_id, -1001, document_id=message_id + 1000) for message_id in message_ids]
+
+
+def _records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_unfinished_jobs_resume_after_restart(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = ForwardJournal(path, sync_interval=0)
+    job_key = journal.start(7, "@channel", "@target", 2, _refs(1, 2, 3, 4))
+    journal.record_sent(job_key, [1, 2])
+
+    # یک خط ناقص در انتهای فایل (قطع ناگهانی در حین نوشتن) نادیده گرفته می‌شود
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"type": "sent", "job"')
+
+    restarted = ForwardJournal(path, sync_interval=0)
+    jobs = restarted.unfinished_jobs()
+    assert len(jobs) == 1
+    assert jobs[0]["job"] == job_key
+    assert (jobs[0]["user_id"], jobs[0]["target"], jobs[0]["batch_index"]) == (7, "@target", 2)
+    assert [ref.message_id for ref in jobs[0]["refs"]] == [3, 4]
+    # بازخوانی دفترچه را فشرده کرده است: فقط رکورد شروع با فایل‌های باقیمانده
+    assert [record["type"] for record in _records(path)] == ["start"]
+
+
+def test_finishing_last_job_compacts_journal(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = ForwardJournal(path, sync_interval=0)
+    job_key = journal.start(7, "@channel", "@target", 1, _refs(1, 2))
+    journal.record_sent(job_key, [1, 2])
+    journal.finish(job_key)
+
+    assert os.path.getsize(path) == 0
+    assert journal.unfinished_jobs() == []
+    # نوشتن پس از فشرده‌سازی در فایل جدید ادامه می‌یابد
+    other = journal.start(7, "@channel", "@target", 2, _refs(5))
+    assert [record["job"] for record in _records(path)] == [other]
+
+
+def test_size_threshold_compacts_while_jobs_are_unfinished(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = ForwardJournal(path, sync_interval=0, compact_size=1)
+    running = journal.start(1, "@channel", "@target", 1, _refs(1, 2, 3))
+    journal.record_sent(running, [1])
+    finished = journal.start(2, "@channel", "@target", 1, _refs(10, 11))
+    journal.finish(finished)
+
+    records = _records(path)
+    assert len(records) == 1
+    assert records[0]["job"] == running
+    assert [ref[0] for ref in records[0]["refs"]] == [2, 3]
+
+    journal.record_sent(running, [2])
+    restarted = ForwardJournal(path, sync_interval=0)
+    assert [ref.message_id for ref in restarted.unfinished_jobs()[0]["refs"]] == [3]
+
+
+def test_empty_path_disables_journal(tmp_path):
+    env = dict(os.environ, FORWARD_JOURNAL_PATH="")
+    result = subprocess.run(
+        [sys.executable, "-c", "import forward_journal; assert forward_journal.forward_journal is None"],
+        cwd=str(tmp_path), env=dict(env, PYTHONPATH=ROOT), capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,54 @@
+import random
+from forward_ledger import BloomFilter, ForwardLedger
+from models import AudioRef
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    rng = random.Random(1)
+    added = {rng.getrandbits(62) for _ in range(10000)}
+    for value in added:
+        bloom.add(value)
+
+    assert all(value in bloom for value in added)
+    probes = [value for value in (rng.getrandbits(62) for _ in range(20000)) if value not in added]
+    false_positives = sum(1 for value in probes if value in bloom)
+    assert false_positives / len(probes) < 0.02
+
+
+def test_bloom_filter_accepts_negative_ids():
+    bloom = BloomFilter(capacity=100, error_rate=0.01)
+    bloom.add(-5)
+    assert -5 in bloom
+
+
+def test_ledger_filters_forwarded_files_per_target(tmp_path):
+    ledger = ForwardLedger(str(tmp_path / "ledger.db"), capacity=1000, error_rate=0.01)
+    refs = [AudioRef(message_id, -1001, document_id=message_id + 100) for message_id in range(1, 6)]
+    ledger.add("@a", [101, 102, 0])
+
+    new_refs, skipped = ledger.filter_new("@a", refs)
+    assert [ref.document_id for ref in new_refs] == [103, 104, 105]
+    assert skipped == 2
+    # هر مقصد دفتر جداگانه دارد
+    assert ledger.filter_new("@b", refs) == (refs, 0)
+    assert not ledger.contains("@a", 0)
+
+
+def test_ledger_survives_restart(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    ForwardLedger(path, capacity=1000, error_rate=0.01).add("@a", [7, 8])
+
+    restarted = ForwardLedger(path, capacity=1000, error_rate=0.01)
+    assert restarted.contains("@a", 7) and restarted.contains("@a", 8)
+    assert not restarted.contains("@a", 9)
+
+
+def test_bloom_false_positive_is_confirmed_against_table(tmp_path):
+    ledger = ForwardLedger(str(tmp_path / "ledger.db"), capacity=1000, error_rate=0.01)
+    ledger.add("@a", [1])
+    # فیلتر Bloom اشباع شده به همه شناسه‌ها پاسخ مثبت می‌دهد؛ جدول دقیق پاسخ نهایی را تعیین می‌کند
+    bloom = ledger._filter("@a")
+    bloom.bits = bytearray(b"\xff" * len(bloom.bits))
+    assert ledger.contains("@a", 1)
+    assert not ledger.contains("@a", 2)
@@ -0,0 +1,171 @@
+import threading
+import time
+from forward_scheduler import ForwardScheduler
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class Pipeline:
+    """خط لوله ساختگی با تعداد مرحله ثابت که ترتیب اجرای مراحل را ثبت می‌کند"""
+
+    def __init__(self, log, name, steps, delay=0):
+        self.log = log
+        self.name = name
+        self.remaining = steps
+        self.delay = delay
+
+    def step(self):
+        self.log.append(self.name)
+        self.remaining -= 1
+        return self.delay if self.remaining > 0 else None
+
+
+def test_weighted_round_robin_between_users():
+    scheduler = ForwardScheduler(workers=1, weights={1: 3})
+    log = []
+    # هر دو کاربر همزمان آماده می‌شوند
+    scheduler.submit(1, "@a", Pipeline(log, 1, 30).step, delay=0.05)
+    scheduler.submit(2, "@a", Pipeline(log, 2, 30).step, delay=0.05)
+
+    assert _wait_until(lambda: len(log) == 60)
+    assert log[:16].count(1) == 12 and log[:16].count(2) == 4
+
+
+def test_flood_waiting_pipeline_does_not_block_others():
+    scheduler = ForwardScheduler(workers=1)
+    log = []
+    scheduler.submit(1, "@flooded", Pipeline(log, "flooded", 2, delay=30).step)
+    scheduler.submit(1, "@other", Pipeline(log, "other", 5).step)
+    assert _wait_until(lambda: log.count("other") == 5)
+    assert log.count("flooded") == 1
+    assert scheduler.queued_count == 1
+
+
+def test_pause_resume_and_cancel():
+    scheduler = ForwardScheduler(workers=2)
+    log = []
+    scheduler.submit(1, "@a", Pipeline(log, "a", 1000, delay=0.01).step)
+    assert _wait_until(lambda: len(log) > 0)
+
+    assert scheduler.pause(1) and scheduler.is_paused(1)
+    time.sleep(0.05)
+    paused_at = len(log)
+    time.sleep(0.1)
+    assert len(log) == paused_at
+
+    scheduler.resume(1)
+    assert _wait_until(lambda: len(log) > paused_at)
+
+    scheduler.cancel(1)
+    time.sleep(0.05)
+    cancelled_at = len(log)
+    time.sleep(0.1)
+    assert len(log) == cancelled_at
+    assert not scheduler.is_paused(1) and scheduler.queued_count == 0
+
+
+def test_resubmitting_same_key_replaces_pipeline():
+    scheduler = ForwardScheduler(workers=1)
+    log = []
+    blocker = threading.Event()
+
+    def blocking_step():
+        log.append("old")
+        blocker.wait(5)
+        return 0
+
+    scheduler.submit(1, "@a", blocking_step)
+    assert _wait_until(lambda: log == ["old"])
+    submitted = threading.Event()
+    threading.Thread(
+        target=lambda: (scheduler.submit(1, "@a", Pipeline(log, "new", 2).step), submitted.set()), daemon=True
+    ).start()
+    # خط لوله جدید تا پایان مرحله در حال اجرای خط لوله قبلی ثبت نمی‌شود
+    time.sleep(0.05)
+    assert not submitted.is_set()
+    blocker.set()
+    assert submitted.wait(5)
+    assert _wait_until(lambda: log.count("new") == 2)
+    time.sleep(0.05)
+    assert log == ["old", "new", "new"]
+
+
+def test_cancel_waits_for_running_step():
+    scheduler = ForwardScheduler(workers=2)
+    started, release, finished = threading.Event(), threading.Event(), threading.Event()
+
+    def slow_step():
+        started.set()
+        release.wait(5)
+        finished.set()
+        return 0
+
+    scheduler.submit(1, "@a", slow_step)
+    assert started.wait(5)
+    cancelled = threading.Event()
+    threading.Thread(target=lambda: (scheduler.cancel(1), cancelled.set()), daemon=True).start()
+    time.sleep(0.05)
+    assert not cancelled.is_set()
+
+    release.set()
+    assert cancelled.wait(5)
+    assert finished.is_set()
+
+
+def test_step_can_cancel_its_own_pipeline():
+    scheduler = ForwardScheduler(workers=1)
+    log = []
+
+    def self_cancelling_step():
+        log.append("step")
+        scheduler.cancel(1, "@a")
+        return 0
+
+    scheduler.submit(1, "@a", self_cancelling_step)
+    assert _wait_until(lambda: scheduler.running_count == 0 and log == ["step"])
+    time.sleep(0.05)
+    assert log == ["step"] and scheduler.queued_count == 0
+
+
+def test_failing_step_ends_only_its_pipeline():
+    scheduler = ForwardScheduler(workers=1)
+    log = []
+
+    def failing_step():
+        raise RuntimeError("خطای آزمایشی")
+
+    scheduler.submit(1, "@broken", failing_step)
+    scheduler.submit(1, "@ok", Pipeline(log, "ok", 3).step)
+    assert _wait_until(lambda: log.count("ok") == 3)
+    assert _wait_until(lambda: scheduler.queued_count == 0 and scheduler.running_count == 0)
+
+
+def test_pause_waits_for_running_step():
+    scheduler = ForwardScheduler(workers=2)
+    started, release, log = threading.Event(), threading.Event(), []
+
+    def slow_step():
+        log.append("step")
+        started.set()
+        release.wait(5)
+        return 0.01
+
+    scheduler.submit(1, "@a", slow_step)
+    assert started.wait(5)
+    paused = threading.Event()
+    threading.Thread(target=lambda: (scheduler.pause(1), paused.set()), daemon=True).start()
+    time.sleep(0.05)
+    assert not paused.is_set()
+
+    release.set()
+    assert paused.wait(5)
+    # پس از بازگشت pause هیچ مرحله‌ای در حال اجرا نیست و مرحله جدیدی شروع نمی‌شود
+    assert scheduler.running_count == 0
+    time.sleep(0.05)
+    assert log == ["step"]
+    scheduler.cancel(1)
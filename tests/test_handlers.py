@@ -0,0 +1,178 @@
+import threading
+import time
+from types import SimpleNamespace
+import handlers
+from benchmark import FakeTelegramClient, FakeClientService
+from config import BATCH_PAGE_SIZE
+from downloader import MusicDownloader
+from models import AudioRef
+
+USER_ID = 4242
+TARGET = "@target"
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+    def edit_message_text(self, chat_id=None, message_id=None, text=None, **kwargs):
+        self.edits.append((message_id, text))
+
+
+class FakeScanJobs:
+    """صف اسکن ساختگی که کارها را فقط ثبت می‌کند"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, user_id, fn, on_done=None, description=None, on_created=None):
+        job = SimpleNamespace(cancelled=False, is_active=True)
+        job.cancel = lambda: setattr(job, "cancelled", True)
+        if on_created is not None:
+            on_created(job)
+        self.submitted.append(job)
+        return job
+
+    def queue_position(self, job):
+        return 0
+
+
+def _fake_downloader():
+    downloader = MusicDownloader(FakeClientService(FakeTelegramClient(message_count=100)))
+    downloader.connect()
+    return downloader
+
+
+def _channel_update(text):
+    message = SimpleNamespace(text=text, reply_text=lambda text, **kwargs: SimpleNamespace(message_id=99))
+    return SimpleNamespace(effective_user=SimpleNamespace(id=USER_ID), message=message)
+
+
+def test_replacing_session_tears_down_running_forward(monkeypatch):
+    monkeypatch.setattr(handlers, "MusicDownloader", _fake_downloader)
+    monkeypatch.setattr(handlers, "scan_jobs", FakeScanJobs())
+
+    refs = [AudioRef(message_id, -1001, document_id=message_id) for message_id in range(1, 11)]
+    job_key = handlers.forward_journal.start(USER_ID, "@old", TARGET, 1, refs)
+    old_scan_job = SimpleNamespace(cancelled=False, is_active=False)
+    old_scan_job.cancel = lambda: setattr(old_scan_job, "cancelled", True)
+    old = {
+        "downloader": _fake_downloader(),
+        "scan_job": old_scan_job,
+        "is_forwarding": True,
+        "forwards": {TARGET: {"target": TARGET, "journal_job": job_key}},
+    }
+    handlers.user_data_store[USER_ID] = old
+
+    # یک مرحله ارسال جلسه قبلی در حال اجراست
+    started, release, steps = threading.Event(), threading.Event(), []
+
+    def step():
+        steps.append(1)
+        started.set()
+        release.wait(5)
+        return 0.01
+
+    pipeline = handlers.forward_scheduler.submit(USER_ID, TARGET, step)
+    assert started.wait(5)
+
+    context = SimpleNamespace(bot=FakeBot(), user_data={})
+    worker = threading.Thread(target=handlers.process_channel_input, args=(_channel_update("@new"), context))
+    worker.start()
+    release.set()
+    worker.join(5)
+
+    assert pipeline.cancelled
+    assert _wait_until(lambda: not pipeline.running)
+    time.sleep(0.05)
+    assert steps == [1]
+    assert handlers.forward_scheduler.queued_count == 0
+    assert job_key not in [job["job"] for job in handlers.forward_journal.unfinished_jobs()]
+    assert old_scan_job.cancelled
+    assert not old["downloader"].is_connected
+
+    session = handlers.user_data_store.get(USER_ID)
+    assert session is not old and session["channel"] == "@new"
+    handlers.user_data_store.pop(USER_ID)
+
+
+class RecordingEditor:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, bot, chat_id, message_id, text, reply_markup=None):
+        self.updates.append(text)
+
+    def discard(self, chat_id, message_id):
+        pass
+
+
+def test_paused_forward_step_keeps_paused_message(monkeypatch):
+    editor = RecordingEditor()
+    monkeypatch.setattr(handlers, "progress_editor", editor)
+    refs = [AudioRef(message_id, -1001, document_id=message_id) for message_id in range(1, 6)]
+    batches = handlers.split_into_batches(refs, 5)
+    handlers.user_data_store[USER_ID] = {
+        "downloader": _fake_downloader(),
+        "batches": batches,
+        "current_batch": 1,
+        "is_forwarding": True,
+        "forwards": {TARGET: {
+            "target": TARGET, "batch_index": 1, "refs": batches[0], "file_index": 0, "failed": 0,
+            "skipped": 0, "journal_job": None, "done": False,
+            "status_message": SimpleNamespace(message_id=5),
+        }},
+    }
+    # خط لوله‌ای در صف کاربر تا ارسال‌های او قابل توقف باشند
+    handlers.forward_scheduler.submit(USER_ID, TARGET, lambda: None, delay=60)
+    try:
+        assert handlers.forward_scheduler.pause(USER_ID)
+        context = SimpleNamespace(bot=FakeBot())
+        handlers.forward_batch_files(context, USER_ID, TARGET)
+        assert handlers.user_data_store[USER_ID]["forwards"][TARGET]["file_index"] == 5
+        assert editor.updates == []
+
+        handlers.forward_scheduler.resume(USER_ID)
+        handlers.user_data_store[USER_ID]["forwards"][TARGET]["file_index"] = 0
+        handlers.forward_batch_files(context, USER_ID, TARGET)
+        assert len(editor.updates) == 1
+    finally:
+        handlers.forward_scheduler.cancel(USER_ID)
+        handlers.user_data_store.pop(USER_ID)
+
+
+def test_batch_page_navigation_edits_the_batch_list():
+    edits = []
+    query = SimpleNamespace(
+        data="bp_3",
+        answer=lambda: None,
+        edit_message_text=lambda text, reply_markup=None: edits.append((text, reply_markup)),
+    )
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=USER_ID), callback_query=query)
+    refs = [AudioRef(message_id, -1001) for message_id in range(1, 2001)]
+    handlers.user_data_store[USER_ID] = {
+        "batches": handlers.split_into_batches(refs, 10),
+        "deduplicator": SimpleNamespace(dropped=0),
+    }
+    try:
+        handlers.button_handler(update, SimpleNamespace(bot=FakeBot()))
+        assert handlers.user_data_store[USER_ID]["batch_page"] == 3
+    finally:
+        handlers.user_data_store.pop(USER_ID)
+
+    text, markup = edits[-1]
+    first_batch = 3 * BATCH_PAGE_SIZE + 1
+    assert f"📁 دسته {first_batch}:" in text
+    assert markup.inline_keyboard[0][0].callback_data == f"batch_{first_batch}"
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+import pytest
+from jobs import JobManager, JobQueueFull, ScanJob
+
+
+class LoopService:
+    """سرویس ساختگی با یک حلقه رویداد در thread جداگانه (مانند client_service)"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+@pytest.fixture
+def service():
+    service = LoopService()
+    yield service
+    service.stop()
+
+
+def test_job_is_visible_to_on_done_of_instant_scan(service):
+    manager = JobManager(service=service, workers=2)
+    user_data = {}
+    seen = []
+    finished = threading.Event()
+
+    async def instant_scan():
+        return "result"
+
+    def on_done(job):
+        seen.append(user_data.get("scan_job") is job)
+        finished.set()
+
+    job = manager.submit(1, instant_scan, on_done=on_done,
+                         on_created=lambda created: user_data.__setitem__("scan_job", created))
+    assert finished.wait(5)
+    assert seen == [True]
+    assert job.status == ScanJob.DONE and job.result == "result"
+
+
+def test_submit_rejects_when_queue_is_full(service):
+    manager = JobManager(service=service, workers=1, max_queued=1)
+    release = threading.Event()
+
+    async def blocked_scan():
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+
+    running = manager.submit(1, blocked_scan)
+    while running.status != ScanJob.RUNNING:
+        time.sleep(0.01)
+    queued = manager.submit(2, blocked_scan)
+    with pytest.raises(JobQueueFull):
+        manager.submit(3, blocked_scan)
+    assert manager.queue_position(queued) == 1
+    release.set()
+    queued.future.result(5)
@@ -0,0 +1,46 @@
+from batch_store import BatchStore
+from keyboard import create_batch_keyboard
+from utils import format_batch_info
+
+
+def _store(batch_count, batch_size=2):
+    return BatchStore(list(range(batch_count * batch_size - 1)), batch_size=batch_size)
+
+
+def _callbacks(markup):
+    return [[button.callback_data for button in row] for row in markup.inline_keyboard]
+
+
+def test_single_page_has_no_navigation():
+    rows = _callbacks(create_batch_keyboard(_store(4), page=0, page_size=6))
+    assert rows == [["batch_1", "batch_2", "batch_3"], ["batch_4"], ["cancel"]]
+
+
+def test_middle_page_shows_only_its_batches_and_all_navigation():
+    rows = _callbacks(create_batch_keyboard(_store(1000), page=5, page_size=6))
+    assert rows[:2] == [["batch_31", "batch_32", "batch_33"], ["batch_34", "batch_35", "batch_36"]]
+    assert rows[2] == ["bp_0", "bp_4", "bp_6", "bp_166"]
+    assert rows[-1] == ["cancel"]
+
+
+def test_edge_pages_hide_unavailable_navigation():
+    store = _store(13)
+    assert _callbacks(create_batch_keyboard(store, page=0, page_size=6))[-2] == ["bp_1", "bp_2"]
+    last = _callbacks(create_batch_keyboard(store, page=99, page_size=6))
+    assert last[0] == ["batch_13"] and last[-2] == ["bp_0", "bp_1"]
+
+
+def test_batch_info_lists_only_the_requested_page():
+    text = format_batch_info(_store(1000), duplicates_dropped=7, page=1, page_size=3)
+    assert "1999 فایل در 1000 دسته" in text
+    assert [line for line in text.splitlines() if line.startswith("📁")] == [
+        "📁 دسته 4: شامل 2 فایل موسیقی",
+        "📁 دسته 5: شامل 2 فایل موسیقی",
+        "📁 دسته 6: شامل 2 فایل موسیقی",
+    ]
+    assert "📄 صفحه 2 از 334" in text
+    assert "🔁 فایل‌های تکراری حذف شده: 7" in text
+
+    last_page = format_batch_info(_store(1000), page=333, page_size=3)
+    assert "📁 دسته 1000: شامل 1 فایل موسیقی" in last_page
+    assert "تکراری" not in last_page
@@ -0,0 +1,63 @@
+import socket
+import urllib.request
+import pytest
+import metrics
+from metrics import MetricsRegistry
+
+
+def test_counter_and_gauge_rendering():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_forwards_total", "ارسال‌ها", ("result", "target"))
+    counter.inc(2, result="success", target='@a"b')
+    counter.inc(result="success", target='@a"b')
+    gauge = registry.gauge("test_queue", "صف")
+    gauge.set_function(lambda: 4)
+
+    assert registry.render() == (
+        "# HELP test_forwards_total ارسال‌ها\n"
+        "# TYPE test_forwards_total counter\n"
+        'test_forwards_total{result="success",target="@a\\"b"} 3\n'
+        "# HELP test_queue صف\n"
+        "# TYPE test_queue gauge\n"
+        "test_queue 4\n"
+    )
+    with pytest.raises(ValueError):
+        counter.inc(result="success")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_latency_seconds", "زمان", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        'test_latency_seconds_bucket{le="0.1"} 1',
+        'test_latency_seconds_bucket{le="1"} 3',
+        'test_latency_seconds_bucket{le="+Inf"} 4',
+        "test_latency_seconds_sum 4.25",
+        "test_latency_seconds_count 4",
+    ]
+
+
+def test_failing_gauge_function_is_skipped():
+    registry = MetricsRegistry()
+    registry.gauge("test_broken", "خراب").set_function(lambda: 1 / 0)
+    assert registry.render() == "# HELP test_broken خراب\n# TYPE test_broken gauge\n"
+
+
+def test_metrics_endpoint_serves_registry():
+    # پورت 0 سرور را غیرفعال می‌کند؛ یک پورت آزاد انتخاب می‌شود
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    assert metrics.start_metrics_server("127.0.0.1", 0) is None
+    server = metrics.start_metrics_server("127.0.0.1", port)
+    assert server is not None
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode("utf-8")
+        assert "# TYPE tgmusic_forwards_total counter" in body
+    finally:
+        server.shutdown()
@@ -0,0 +1,48 @@
+import sys
+from benchmark import FakeTelegramClient, BENCH_CHANNEL_ID
+from models import AudioRef
+
+
+def _audio_message(client):
+    message_id = client._audio_ids[0]
+    return client._make_message(message_id)
+
+
+def test_from_message_keeps_only_forwarding_and_display_fields():
+    client = FakeTelegramClient(message_count=100)
+    message = _audio_message(client)
+    ref = AudioRef.from_message(message)
+
+    assert ref.message_id == message.id
+    assert ref.peer_id == -1000000000000 - BENCH_CHANNEL_ID
+    assert ref.document_id == message.document.id and ref.size == message.document.size
+    assert ref.duration == 30 + message.id % 300
+    assert ref.display_name == f"Artist {message.id % 97} - Track {message.id}"
+    assert not hasattr(ref, "__dict__")
+
+
+def test_text_message_gives_empty_audio_fields():
+    client = FakeTelegramClient(message_count=100, audio_ratio=0, voice_ratio=0)
+    ref = AudioRef.from_message(client._make_message(1))
+    assert (ref.document_id, ref.size, ref.duration, ref.title, ref.performer) == (0, 0, 0, None, None)
+    assert ref.display_name == "#1"
+
+
+def test_tuple_round_trip_and_identity():
+    ref = AudioRef(12, -1001, document_id=99, size=3000, duration=200, title="Song", performer=None)
+    restored = AudioRef(*ref.as_tuple())
+    assert restored.as_tuple() == ref.as_tuple()
+    assert restored.display_name == "Song"
+    # هویت فایل فقط با کانال مبدا و شناسه پیام تعیین می‌شود
+    assert ref == AudioRef(12, -1001) and hash(ref) == hash(AudioRef(12, -1001))
+    assert ref != AudioRef(12, -1002)
+
+
+def test_ref_is_much_smaller_than_message():
+    client = FakeTelegramClient(message_count=100)
+    message = _audio_message(client)
+    ref = AudioRef.from_message(message)
+    ref_size = sys.getsizeof(ref)
+    message_size = sys.getsizeof(message) + sys.getsizeof(message.__dict__) + sys.getsizeof(message.media) \
+        + sys.getsizeof(message.document) + sys.getsizeof(message.document.__dict__)
+    assert ref_size * 3 < message_size
@@ -0,0 +1,77 @@
+import threading
+import time
+from telegram.error import RetryAfter
+from progress import ProgressEditor
+
+
+class SlowBot:
+    """Bot ساختگی که ویرایش‌ها را ثبت می‌کند و می‌تواند اولین ویرایش را تا آزادسازی نگه دارد"""
+
+    def __init__(self, block_first=False, retry_first=False):
+        self.edits = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.block_first = block_first
+        self.retry_first = retry_first
+
+    def edit_message_text(self, chat_id, message_id, text, reply_markup=None):
+        first = not self.started.is_set()
+        self.started.set()
+        if first and self.block_first:
+            self.release.wait(5)
+        if first and self.retry_first:
+            raise RetryAfter(0)
+        self.edits.append(text)
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_discard_waits_for_in_flight_edit():
+    editor = ProgressEditor(chat_interval=0, global_rate=1000)
+    bot = SlowBot(block_first=True)
+    editor.update(bot, 1, 10, "در حال انجام")
+    assert bot.started.wait(5)
+
+    discarded = threading.Event()
+    threading.Thread(target=lambda: (editor.discard(1, 10), discarded.set()), daemon=True).start()
+    time.sleep(0.05)
+    assert not discarded.is_set()  # ویرایش قبلی هنوز در حال ارسال است
+
+    bot.release.set()
+    assert discarded.wait(5)
+    bot.edit_message_text(1, 10, "نهایی")
+    time.sleep(0.05)
+    assert bot.edits == ["در حال انجام", "نهایی"]
+
+
+def test_stale_edit_is_not_retried_after_discard():
+    editor = ProgressEditor(chat_interval=0, global_rate=1000)
+    bot = SlowBot(block_first=True, retry_first=True)
+    editor.update(bot, 1, 10, "در حال انجام")
+    assert bot.started.wait(5)
+    # discard در حین ویرایش در حال ارسال (که با RetryAfter پایان می‌یابد) فراخوانی می‌شود
+    discarded = threading.Event()
+    threading.Thread(target=lambda: (editor.discard(1, 10), discarded.set()), daemon=True).start()
+    time.sleep(0.05)
+    bot.release.set()
+    assert discarded.wait(5)
+    time.sleep(0.1)
+    assert bot.edits == []
+
+
+def test_updates_are_coalesced_and_unchanged_text_skipped():
+    editor = ProgressEditor(chat_interval=0.2, global_rate=1000)
+    bot = SlowBot()
+    editor.update(bot, 1, 10, "1")
+    assert _wait_until(lambda: bot.edits == ["1"])
+    for text in ("2", "3", "4"):
+        editor.update(bot, 1, 10, text)
+    assert _wait_until(lambda: bot.edits == ["1", "4"])
+    editor.update(bot, 1, 10, "4")
+    time.sleep(0.3)
+    assert bot.edits == ["1", "4"]
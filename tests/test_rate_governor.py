@@ -0,0 +1,71 @@
+import asyncio
+import math
+import time
+from telethon.errors import FloodWaitError
+from rate_governor import RateGovernor
+
+
+class FakeServer:
+    """سرور تلگرام ساختگی: اولین درخواست یک بازه فلاد شروع می‌کند و هر درخواستی که داخل آن برسد FloodWait می‌گیرد"""
+
+    def __init__(self, flood_seconds, latency):
+        self.flood_seconds = flood_seconds
+        self.latency = latency
+        self.blocked_until = None
+        self.calls = 0
+
+    async def request(self):
+        arrived = time.monotonic()
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.blocked_until is None:
+            self.blocked_until = arrived + self.flood_seconds
+        if arrived < self.blocked_until:
+            raise FloodWaitError(None, capture=math.ceil(self.blocked_until - arrived))
+        return "ok"
+
+
+def test_concurrent_floods_halve_rate_once():
+    governor = RateGovernor(rate=20, min_rate=0.2, max_rate=20, burst=6)
+    server = FakeServer(flood_seconds=1, latency=0.1)
+
+    async def run():
+        started = time.monotonic()
+        results = await asyncio.gather(*(governor.call(server.request) for _ in range(6)))
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(run())
+    assert results == ["ok"] * 6
+    # همه درخواست‌های همزمان داخل یک بازه فلاد بودند: فقط یک بار نصف شدن نرخ
+    assert governor.rate == 10
+    # هر درخواست یک بار فلاد گرفته و پس از پایان توقف یک بار دیگر ارسال شده است
+    assert server.calls == 12
+    assert elapsed < 2
+
+
+def test_flood_after_window_halves_again():
+    governor = RateGovernor(rate=8, min_rate=0.2, max_rate=20, burst=5)
+    governor.on_flood_wait(5)
+    governor.on_flood_wait(5)
+    assert governor.rate == 4
+
+    governor.blocked_until = time.monotonic() - 1  # بازه قبلی تمام شده است
+    governor.on_flood_wait(5)
+    assert governor.rate == 2
+    assert governor.flood_waits == 3
+
+
+def test_acquire_rechecks_flood_after_waiting():
+    governor = RateGovernor(rate=10, min_rate=0.2, max_rate=20, burst=1)
+
+    async def run():
+        await governor.acquire()  # برداشتن تنها توکن؛ درخواست بعدی حدود 0.1 ثانیه منتظر می‌ماند
+        waiter = asyncio.ensure_future(governor.acquire())
+        await asyncio.sleep(0.02)
+        governor.on_flood_wait(1)  # فلاد در حین انتظار
+        started = time.monotonic()
+        await waiter
+        return time.monotonic() - started
+
+    waited = asyncio.run(run())
+    assert waited >= 0.9
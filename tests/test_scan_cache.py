@@ -0,0 +1,145 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from scan_cache import ScanResultCache
+from scan_timing import ScanTimings
+
+
+class Source:
+    """منبع صفحه‌های اسکن ساختگی که تعداد اسکن‌های واقعی را می‌شمارد"""
+
+    def __init__(self, pages=3, delay=0.01, fail_after=None):
+        self.pages = pages
+        self.delay = delay
+        self.fail_after = fail_after
+        self.runs = 0
+        self.cancelled = 0
+
+    async def scan(self):
+        self.runs += 1
+        try:
+            for index in range(self.pages):
+                if self.fail_after is not None and index == self.fail_after:
+                    raise RuntimeError("خطای اسکن")
+                await asyncio.sleep(self.delay)
+                yield SimpleNamespace(index=index)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+async def _collect(cache, key, source, limit=None, timings=None):
+    pages = []
+    async for page in cache.iter_pages(key, source.scan, timings):
+        pages.append(page.index)
+        if limit is not None and len(pages) >= limit:
+            break
+    return pages
+
+
+def test_concurrent_requests_share_one_scan():
+    cache = ScanResultCache(ttl=60, max_entries=4)
+    source = Source()
+
+    async def run():
+        first = asyncio.ensure_future(_collect(cache, "key", source))
+        await asyncio.sleep(0.015)  # درخواست دوم در حین اسکن اول می‌رسد
+        second = await _collect(cache, "key", source)
+        third = await _collect(cache, "key", source)  # از حافظه
+        return await first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == second == third == [0, 1, 2]
+    assert source.runs == 1
+
+
+def test_consumers_get_their_own_page_copies():
+    cache = ScanResultCache(ttl=60, max_entries=4)
+    source = Source(pages=1)
+
+    async def run():
+        async for page in cache.iter_pages("key", source.scan):
+            page.index = "changed"
+        return await _collect(cache, "key", source)
+
+    assert asyncio.run(run()) == [0]
+
+
+def test_expired_results_are_scanned_again():
+    cache = ScanResultCache(ttl=0.05, max_entries=4)
+    source = Source(pages=1, delay=0)
+
+    async def run():
+        await _collect(cache, "key", source)
+        await asyncio.sleep(0.1)
+        await _collect(cache, "key", source)
+
+    asyncio.run(run())
+    assert source.runs == 2
+
+
+def test_scan_is_cancelled_when_all_consumers_leave():
+    cache = ScanResultCache(ttl=60, max_entries=4)
+    source = Source(pages=100)
+
+    async def run():
+        pages = await _collect(cache, "key", source, limit=1)
+        await asyncio.sleep(0.05)
+        return pages
+
+    assert asyncio.run(run()) == [0]
+    assert source.cancelled == 1
+    assert cache._lookup("key") is None
+
+
+def test_errors_reach_all_consumers_and_are_not_cached():
+    cache = ScanResultCache(ttl=60, max_entries=4)
+    source = Source(pages=3, fail_after=1)
+
+    async def run():
+        results = await asyncio.gather(
+            _collect(cache, "key", source), _collect(cache, "key", source), return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await _collect(cache, "key", source)
+
+    asyncio.run(run())
+    assert source.runs == 2
+
+
+def test_least_recently_used_complete_results_are_evicted():
+    cache = ScanResultCache(ttl=60, max_entries=2)
+    source = Source(pages=1, delay=0)
+
+    async def run():
+        for key in ("a", "b"):
+            await _collect(cache, key, source)
+        await _collect(cache, "a", source)  # "a" به تازگی استفاده شده است
+        await _collect(cache, "c", source)
+
+    asyncio.run(run())
+    assert cache._lookup("a") is not None and cache._lookup("c") is not None
+    assert cache._lookup("b") is None
+    assert source.runs == 3
+
+
+def test_shared_consumers_record_their_own_timings():
+    cache = ScanResultCache(ttl=60, max_entries=4)
+    source = Source()
+    owner, joined, hit = ScanTimings(), ScanTimings(), ScanTimings()
+
+    async def run():
+        first = asyncio.ensure_future(_collect(cache, "key", source, timings=owner))
+        await asyncio.sleep(0.015)
+        await _collect(cache, "key", source, timings=joined)
+        await first
+        await _collect(cache, "key", source, timings=hit)
+
+    asyncio.run(run())
+    assert owner.shared is None and joined.shared == "joined" and hit.shared == "hit"
+    # کاربر پیوسته زمان انتظار خودش برای صفحه‌های اسکن مشترک را می‌بیند
+    assert joined.counts["shared"] > 0 and joined.totals["shared"] > 0
+    assert hit.counts["shared"] == 0
+    assert "اسکن در حال اجرای کاربر دیگر" in joined.format_summary()
+    assert "♻️" not in owner.format_summary()
@@ -0,0 +1,69 @@
+import downloader as downloader_module
+from benchmark import FakeTelegramClient, FakeClientService, BENCH_CHANNEL_ID
+from classifier import AudioClassifier
+from downloader import MusicDownloader
+from models import AudioRef
+from scan_index import ScanIndex
+
+PEER_ID = -1001
+
+
+def _index_with_page(tmp_path, fingerprint):
+    index = ScanIndex(str(tmp_path / "index.db"))
+    index.ensure_fingerprint(PEER_ID, fingerprint)
+    index.add_page(PEER_ID, [AudioRef(5, PEER_ID, 105), AudioRef(3, PEER_ID, 103)], 1, 10)
+    return index
+
+
+def test_same_fingerprint_keeps_scanned_ranges(tmp_path):
+    index = _index_with_page(tmp_path, "mode=search;a")
+    assert index.ensure_fingerprint(PEER_ID, "mode=search;a") is False
+    assert index.find_range(PEER_ID, 7) == (1, 10)
+    assert [ref.message_id for refs in index.iter_audio(PEER_ID, 1, 11) for ref in refs] == [5, 3]
+
+
+def test_changed_fingerprint_invalidates_channel(tmp_path):
+    index = _index_with_page(tmp_path, "mode=search;a")
+    index.add_page(-1002, [AudioRef(1, -1002, 1)], 1, 1)
+
+    assert index.ensure_fingerprint(PEER_ID, "mode=history;a") is True
+    assert index.find_range(PEER_ID, 7) is None
+    assert list(index.iter_audio(PEER_ID, 1, 11)) == []
+    # کانال‌های دیگر دست نخورده می‌مانند
+    assert index.find_range(-1002, 1) == (1, 1)
+
+
+def test_classifier_fingerprint_tracks_rules():
+    base = AudioClassifier(mime_types=["audio/mpeg", "audio/flac"])
+    assert base.fingerprint == AudioClassifier(mime_types=["audio/flac", "audio/mpeg"]).fingerprint
+    assert base.fingerprint != AudioClassifier(mime_types=["audio/mpeg"]).fingerprint
+    assert base.fingerprint != AudioClassifier(mime_types=["audio/mpeg", "audio/flac"], min_duration=60).fingerprint
+
+
+def test_exhausted_budget_stops_before_next_unscanned_segment(tmp_path, monkeypatch):
+    client = FakeTelegramClient(message_count=1000)
+    peer_id = -1000000000000 - BENCH_CHANNEL_ID
+    index = ScanIndex(str(tmp_path / "index.db"))
+    index.ensure_fingerprint(peer_id, f"mode=history;{downloader_module.audio_classifier.fingerprint}")
+    # دو بازه قبلاً اسکن شده با یک شکاف اسکن نشده (101 تا 600) بین آن‌ها
+    index.add_page(peer_id, [], 601, 700)
+    index.add_page(peer_id, [], 1, 100)
+    monkeypatch.setattr(downloader_module, "scan_index", index)
+
+    service = FakeClientService(client)
+    downloader = MusicDownloader(service=service)
+    assert downloader.connect()
+
+    async def scan():
+        return [page async for page in downloader.iter_music_files(
+            f"bench:{BENCH_CHANNEL_ID}", max_messages=300, mode="history", shards=1)]
+
+    try:
+        pages = downloader._run(scan())
+    finally:
+        service.stop()
+
+    # سقف 300 پیام دقیقاً با بخش 701 تا 1000 پر شده و شکاف 101 تا 600 دریافت نمی‌شود
+    assert pages[-1].processed == 300
+    assert pages[-1].has_more and pages[-1].offset_id == 601
+    assert index.find_range(peer_id, 500) is None
@@ -0,0 +1,84 @@
+import os
+import time
+from session_store import SessionStore
+
+
+def _store(tmp_path, **kwargs):
+    released = []
+    store = SessionStore(
+        dump=lambda session: {"files": session["files"]},
+        load=lambda user_id, state: {"files": state["files"], "reloaded": True},
+        release=released.append,
+        is_busy=lambda session: session.get("busy", False),
+        measure=lambda session: len(session["files"]),
+        spill_dir=str(tmp_path / "spill"),
+        **kwargs
+    )
+    return store, released
+
+
+def test_idle_session_is_spilled_and_reloaded(tmp_path):
+    store, released = _store(tmp_path, idle_ttl=0, memory_budget=1000)
+    session = {"files": [1, 2, 3]}
+    store[1] = session
+    time.sleep(0.01)
+
+    assert store.sweep() == 1
+    assert len(store) == 0
+    assert released == [session]
+    assert os.path.exists(tmp_path / "spill" / "1.json")
+
+    reloaded = store[1]
+    assert reloaded == {"files": [1, 2, 3], "reloaded": True}
+    assert len(store) == 1
+    # پس از بارگذاری مجدد فایل روی دیسک حذف می‌شود
+    assert not os.path.exists(tmp_path / "spill" / "1.json")
+
+
+def test_busy_sessions_are_never_evicted(tmp_path):
+    store, released = _store(tmp_path, idle_ttl=0, memory_budget=0)
+    store[1] = {"files": [1] * 10, "busy": True}
+    time.sleep(0.01)
+
+    assert store.sweep() == 0
+    assert 1 in store and released == []
+
+
+def test_memory_budget_evicts_least_recently_used(tmp_path):
+    store, released = _store(tmp_path, idle_ttl=3600, memory_budget=15)
+    for user_id in (1, 2, 3):
+        store[user_id] = {"files": list(range(10))}
+        time.sleep(0.01)
+    store.get(1)  # کاربر 1 به تازگی استفاده شده است
+
+    assert store.sweep() == 2
+    assert [user_id for user_id, _, _ in store.report()] == [1]
+    assert store.get(2)["reloaded"] and store.get(3)["reloaded"]
+
+
+def test_pop_and_replace_remove_spilled_state(tmp_path):
+    store, _ = _store(tmp_path, idle_ttl=0, memory_budget=1000)
+    store[1] = {"files": [1]}
+    store[2] = {"files": [2]}
+    time.sleep(0.01)
+    store.sweep()
+
+    store.pop(1)
+    store[2] = {"files": [20]}
+    assert 1 not in store
+    assert store[2] == {"files": [20]}
+    assert os.listdir(tmp_path / "spill") == []
+
+
+def test_expired_spill_files_are_removed(tmp_path):
+    store, _ = _store(tmp_path, idle_ttl=0, memory_budget=1000, spill_ttl=60)
+    store[1] = {"files": [1]}
+    time.sleep(0.01)
+    store.sweep()
+    path = tmp_path / "spill" / "1.json"
+    old = time.time() - 120
+    os.utime(path, (old, old))
+
+    store.sweep()
+    assert not path.exists()
+    assert store.get(1) is None
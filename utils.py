@@ -1,7 +1,8 @@
 import os
 import logging
 from telethon.tl.types import DocumentAttributeAudio
-from config import BATCH_SIZE
+from config import BATCH_SIZE, BATCH_PAGE_SIZE
+from batch_store import BatchStore
 
 # تنظیم لاگر
 logging.basicConfig(
@@ -11,18 +12,25 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def split_into_batches(items, batch_size=BATCH_SIZE):
-    """تقسیم لیست به دسته‌های با اندازه مشخص"""
-    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    """تقسیم لیست به دسته‌های با اندازه مشخص (نمای افزایشی روی همان لیست، بدون کپی)"""
+    return BatchStore(items, batch_size)
 
-def format_batch_info(batches):
-    """ایجاد متن اطلاعات دسته‌های فایل موسیقی"""
-    result = "📂 لیست دسته‌های موسیقی:\n\n"
+def format_batch_info(batches, duplicates_dropped=0, page=0, page_size=BATCH_PAGE_SIZE):
+    """ایجاد متن اطلاعات دسته‌های فایل موسیقی (فقط دسته‌های صفحه page)"""
+    page, page_count, indexes = batches.page(page, page_size)
+    lines = [f"📂 لیست دسته‌های موسیقی ({batches.file_count} فایل در {len(batches)} دسته):", ""]
     
-    for i, batch in enumerate(batches, 1):
-        result += f"📁 دسته {i}: شامل {len(batch)} فایل موسیقی\n"
+    for i in indexes:
+        lines.append(f"📁 دسته {i + 1}: شامل {batches.batch_length(i)} فایل موسیقی")
     
-    result += "\n🔍 لطفاً شماره دسته مورد نظر را برای ارسال انتخاب کنید (مثال: 1)"
-    return result
+    if page_count > 1:
+        lines.append(f"\n📄 صفحه {page + 1} از {page_count}")
+    
+    if duplicates_dropped:
+        lines.append(f"\n🔁 فایل‌های تکراری حذف شده: {duplicates_dropped}")
+    
+    lines.append("\n🔍 لطفاً شماره دسته مورد نظر را برای ارسال انتخاب کنید (مثال: 1)")
+    return "\n".join(lines)
 
 def format_progress_message(total, processed):
     """نمایش پیشرفت عملیات"""